@@ -6,47 +6,231 @@ from PySide6.QtUiTools import QUiLoader
 from PySide6.QtWidgets import *
 from PySide6.QtCore import *
 import math
-import shutil
-import logging
-from backend.custom_models import PandasModel, SearchProxyModel, CustomProxyModel
+import time
+from backend.custom_models import PandasModel
+from backend.filter_engine import EXACT
 from backend.duplicates_checker import *
-from backend.pandas_manager import PandasManager
+from backend.pandas_manager import PandasManager, GROUP_COLUMNS
+from backend.hash_cache import HashCache
+from backend.hash_algorithms import get_hash_presets, DEFAULT_HASH_ALGORITHM
+from backend.dir_snapshot import DirectorySnapshot, get_roots_name
+from backend.file_walker import normalize_roots
+from backend.progress import ProgressAggregator
+from backend.scan_control import ScanControl, WorkerKilledException
+from backend.scan_checkpoint import DEFAULT_CHECKPOINT_DIR
+from backend.scan_filter import ScanFilter, COMMON_EXCLUDED_DIRS, format_pruned
+from backend.instrumentation import Instrumentation
+from backend.file_actions import ActionJournal, FileActionExecutor, MOVE, DELETE, HARDLINK, REFLINK, LINK_ACTIONS
+from backend.scan_history import ScanHistory, SnapshotDiff, DEFAULT_HISTORY_KEEP
+from backend.result_store import load_results, available_formats, list_analyses, DEFAULT_RESULTS_DIR, COLUMNS, FORMAT_NAMES
+from backend.keep_policy import KeepPolicy, OLDEST, NEWEST, SHORTEST_PATH, FEWEST_COMPONENTS, PREFERRED_ROOT
 import pyperclip
+from pathlib import Path
+
+# Instrumentation choices of the scan, mapped to the (profile, trace_memory) options or None
+INSTRUMENTATION_MODES = {
+    "No instrumentation": None,
+    "Instrument stages": (False, False),
+    "Instrument + cProfile": (True, False),
+    "Instrument + cProfile + tracemalloc": (True, True),
+}
+
+# Views of the duplicates keeping one file per group, mapped to the criteria of their KeepPolicy
+# (the later criteria break the ties). The preferred folders are the scanned folders in the order entered
+KEEP_POLICIES = {
+    "Keep Newest Files": [NEWEST, SHORTEST_PATH],
+    "Keep Oldest Files": [OLDEST, SHORTEST_PATH],
+    "Keep Shortest Paths": [SHORTEST_PATH, FEWEST_COMPONENTS, NEWEST],
+    "Keep Fewest Folders": [FEWEST_COMPONENTS, SHORTEST_PATH, NEWEST],
+    "Keep First Folder's Files": [PREFERRED_ROOT, SHORTEST_PATH, NEWEST],
+}
 
 
-class WorkerKilledException(Exception):
-    pass
-
 class WorkerSignals(QObject):
-    finished = Signal(list)
-    progress1 = Signal(int, int)
-    progress2 = Signal(int, int)
-    progress3 = Signal(int, int)
+    # ResultColumns of the duplicate files
+    finished = Signal(object)
+    cancelled = Signal()
+    # ProgressStats of the walk, the partial hashing stages and the full hashing stages
+    progress1 = Signal(object)
+    progress2 = Signal(object)
+    progress3 = Signal(object)
+    report = Signal(str)
 
 class Worker(QObject):
 
-    def __init__(self, paths):
+    def __init__(self, paths, workers=DEFAULT_HASH_WORKERS, hash_algorithm=DEFAULT_HASH_ALGORITHM, confirm_algorithm=None,
+                 incremental=False, scan_filter=None, instrumentation=None):
         super().__init__()
         self.paths = paths
+        self.scan_filter = scan_filter
+        # Started with the scan, stopped by the GUI once the DataFrame is built
+        self.instrumentation = instrumentation
+        self.workers = workers
+        self.hash_algorithm = hash_algorithm
+        self.confirm_algorithm = confirm_algorithm
+        self.incremental = incremental
         self.signals = WorkerSignals()
+        # Called from the GUI thread while process() runs in the worker thread
+        self.control = ScanControl()
+
+    def kill(self):
+        self.control.cancel()
+
+    def pause(self):
+        self.control.pause()
+
+    def resume(self):
+        self.control.resume()
 
     @Slot()
     def process(self):
-        files_by_size, progress, total_files = get_files_by_size(self.paths, self.update_progress_1)
-        hashes_on_1k, hashes_on_1k_num = get_duplicate_files_hashes_and_count(files_by_size, self.update_progress_2)
-        duplicate_files, unique_file_hashes = find_duplicate_files(hashes_on_1k, self.update_progress_3)
-    
+        if self.instrumentation is not None:
+            self.instrumentation.start()
+        try:
+            self.scan()
+        except WorkerKilledException:
+            self.signals.report.emit("Scan cancelled, progress was saved and will be resumed by the next scan")
+            self.signals.cancelled.emit()
+        except Exception as error:
+            # Stops the thread and resets the controls like a cancelled scan
+            self.signals.report.emit(f"Scan failed: {error}")
+            self.signals.cancelled.emit()
+
+    def scan(self):
+        snapshot = DirectorySnapshot.load(normalize_roots(self.paths)) if self.incremental else None
+
+        # Coalesce the progress of the scan loop so the GUI thread gets a few signals per second
+        progress_aggregators = [ProgressAggregator(self.update_progress_1), ProgressAggregator(self.update_progress_2),
+                                ProgressAggregator(self.update_progress_3)]
+
+        with HashCache() as cache:
+            # Walking and hashing overlap, duplicates are reported while the scan runs
+            pipeline = DuplicatePipeline(self.paths, cache=cache, workers=self.workers,
+                                         hash_algorithm=self.hash_algorithm, confirm_algorithm=self.confirm_algorithm,
+                                         walk_progress=progress_aggregators[0], partial_progress=progress_aggregators[1],
+                                         full_progress=progress_aggregators[2], snapshot=snapshot,
+                                         record_snapshot=self.incremental, control=self.control,
+                                         checkpoint_dir=DEFAULT_CHECKPOINT_DIR, resume=True,
+                                         scan_filter=self.scan_filter)
+            if pipeline.resumed is not None:
+                self.signals.report.emit("Resuming the interrupted scan...")
+            group_count = 0
+            last_report = 0
+            for digest, algorithm, size, files in pipeline.run():
+                if len(files) == 2:
+                    group_count += 1
+                    # Same rate limit as the progress bars
+                    if time.perf_counter() - last_report >= progress_aggregators[0].interval:
+                        last_report = time.perf_counter()
+                        self.signals.report.emit(f"{group_count} duplicate groups found so far...")
+
+            for progress_aggregator in progress_aggregators:
+                progress_aggregator.finish()
+            duplicate_files = pipeline.get_columns()
+            cache.evict_stale()
+
+        if self.incremental:
+            pipeline.walker.new_snapshot.save()
+        changes = self.save_history(duplicate_files)
+
+        self.signals.report.emit(f"{cache.get_stats_message()} | Stages: {format_stage_stats(pipeline.get_stage_stats())}"
+                                 f" | Pruned: {format_pruned(pipeline.walker.pruned_dirs, pipeline.walker.pruned_files)}"
+                                 f" | {changes}")
         self.signals.finished.emit(duplicate_files)
         # self.signals.finished.emit(files_by_size, total_files)
 
-    def update_progress_1(self, progress, total):
-        self.signals.progress1.emit(progress, total)
+    def save_history(self, duplicate_files):
+        """Saves the scan in the scan history, returns what changed since the previous scan of the folders."""
+        history = ScanHistory(normalize_roots(self.paths))
+        previous_paths = history.list_snapshots()
+        changes = "First scan of these folders"
+        if previous_paths:
+            try:
+                previous_files, _ = load_results(previous_paths[-1])
+                diff = SnapshotDiff(previous_files, duplicate_files, history.get_created(previous_paths[-1]))
+                changes = f"Since {diff.older_created:%Y-%m-%d %H:%M}: {diff.format_summary()}"
+            except (OSError, ValueError) as error:
+                # The scan is saved all the same, the next one compares with it
+                changes = f"Not compared with the previous scan: {error}"
+        try:
+            history.save(duplicate_files, metadata={'algorithm': self.hash_algorithm,
+                                                    'confirm_algorithm': self.confirm_algorithm},
+                         keep=DEFAULT_HISTORY_KEEP)
+        except (OSError, ValueError) as error:
+            changes = f"{changes} | Scan history not saved: {error}"
+        return changes
+
+    def update_progress_1(self, stats):
+        self.signals.progress1.emit(stats)
+
+    def update_progress_2(self, stats):
+        self.signals.progress2.emit(stats)
+
+    def update_progress_3(self, stats):
+        self.signals.progress3.emit(stats)
+
+class FileActionWorker(QObject):
+    """
+    Runs the moves, deletions or links of an ActionJournal, or undoes its moves, off the GUI thread.
+
+    Args:
+        journal (ActionJournal, optional): An existing journal to resume or undo.
+        undo (bool): Undo the moves of 'journal' instead of running it.
+        plan (dict, optional): Arguments of ActionJournal.create for a new journal, planned on the worker thread.
+    """
+
+    def __init__(self, journal=None, undo=False, plan=None):
+        super().__init__()
+        self.journal = journal
+        self.undo = undo
+        self.plan = plan
+        self.signals = WorkerSignals()
+        # Checked between two batches of files
+        self.control = ScanControl()
 
-    def update_progress_2(self, progress, total):
-        self.signals.progress2.emit(progress, total)
+    def kill(self):
+        self.control.cancel()
 
-    def update_progress_3(self, progress, total):
-        self.signals.progress3.emit(progress, total)
+    def pause(self):
+        self.control.pause()
+
+    def resume(self):
+        self.control.resume()
+
+    @Slot()
+    def process(self):
+        if self.journal is None:
+            # Picking the targets of many files takes a while
+            try:
+                self.journal = ActionJournal.create(**self.plan)
+            except OSError as error:
+                self.signals.report.emit(f"Cannot start the cleanup: {error}")
+                self.signals.cancelled.emit()
+                return
+        progress_aggregator = ProgressAggregator(self.signals.progress3.emit)
+        # Links check that both files are unchanged, the cache spares re-reading them
+        cache = HashCache() if self.journal.action in LINK_ACTIONS else None
+        executor = FileActionExecutor(self.journal, control=self.control, progress_callback=progress_aggregator,
+                                      cache=cache)
+        try:
+            if self.undo:
+                executor.undo()
+            else:
+                executor.run()
+        except WorkerKilledException:
+            self.signals.report.emit(f"Stopped ({self.journal.get_summary()}), "
+                                     f"the rest can be resumed from the Cleanup menu")
+            self.signals.cancelled.emit()
+            return
+        except Exception as error:
+            self.signals.report.emit(f"Cleanup failed ({self.journal.get_summary()}): {error}")
+            self.signals.cancelled.emit()
+            return
+        finally:
+            if cache is not None:
+                cache.close()
+        progress_aggregator.finish()
+        self.signals.finished.emit(self.journal)
 
 class ConfirmationDialog(QDialog):
     def __init__(self):
@@ -72,7 +256,104 @@ class ConfirmationDialog(QDialog):
 
         layout.addLayout(button_layout)
 
+class FilterDialog(QDialog):
+    """Edits the ScanFilter applied while walking the folders."""
+
+    def __init__(self, scan_filter):
+        super().__init__()
+
+        self.setWindowTitle("Scan Filters")
+
+        layout = QFormLayout(self)
+
+        self.min_size_spin_box = QSpinBox()
+        self.min_size_spin_box.setRange(0, 1024 * 1024 * 1024)
+        self.min_size_spin_box.setSuffix(" KB")
+        self.min_size_spin_box.setValue(scan_filter.min_size // 1024)
+        layout.addRow("Minimum size:", self.min_size_spin_box)
+
+        self.max_size_spin_box = QSpinBox()
+        self.max_size_spin_box.setRange(0, 1024 * 1024 * 1024)
+        self.max_size_spin_box.setSuffix(" MB")
+        self.max_size_spin_box.setSpecialValueText("No limit")
+        self.max_size_spin_box.setValue((scan_filter.max_size or 0) // (1024 * 1024))
+        layout.addRow("Maximum size:", self.max_size_spin_box)
+
+        self.extensions_edit = QLineEdit(', '.join(scan_filter.extensions))
+        self.extensions_edit.setPlaceholderText("jpg, png (empty for all files)")
+        layout.addRow("Extensions:", self.extensions_edit)
+
+        self.include_edit = QLineEdit(', '.join(scan_filter.include_globs))
+        self.include_edit.setPlaceholderText("*.iso, */Photos/* (empty for all files)")
+        layout.addRow("Include patterns:", self.include_edit)
+
+        self.exclude_edit = QLineEdit(', '.join(scan_filter.exclude_globs))
+        self.exclude_edit.setPlaceholderText("*.tmp, */build/*")
+        layout.addRow("Exclude patterns:", self.exclude_edit)
+
+        self.exclude_dirs_edit = QLineEdit(', '.join(scan_filter.exclude_dirs))
+        self.exclude_dirs_edit.setPlaceholderText(', '.join(COMMON_EXCLUDED_DIRS[:4]))
+        layout.addRow("Excluded folders:", self.exclude_dirs_edit)
+
+        common_dirs_button = QPushButton("Add common folders")
+        common_dirs_button.setToolTip(', '.join(COMMON_EXCLUDED_DIRS))
+        common_dirs_button.clicked.connect(self.add_common_dirs)
+        layout.addRow("", common_dirs_button)
+
+        self.same_filesystem_check_box = QCheckBox("Stay on the same filesystem")
+        self.same_filesystem_check_box.setChecked(scan_filter.same_filesystem)
+        layout.addRow(self.same_filesystem_check_box)
+
+        self.skip_hidden_check_box = QCheckBox("Skip hidden files and folders")
+        self.skip_hidden_check_box.setChecked(scan_filter.skip_hidden)
+        layout.addRow(self.skip_hidden_check_box)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addRow(buttons)
+
+    @staticmethod
+    def split_list(text):
+        return [item.strip() for item in text.split(',') if item.strip()]
+
+    def add_common_dirs(self):
+        exclude_dirs = self.split_list(self.exclude_dirs_edit.text())
+        exclude_dirs += [name for name in COMMON_EXCLUDED_DIRS if name not in exclude_dirs]
+        self.exclude_dirs_edit.setText(', '.join(exclude_dirs))
+
+    def get_scan_filter(self):
+        max_size = self.max_size_spin_box.value() * 1024 * 1024
+        return ScanFilter(min_size=self.min_size_spin_box.value() * 1024, max_size=max_size or None,
+                          include_globs=self.split_list(self.include_edit.text()),
+                          exclude_globs=self.split_list(self.exclude_edit.text()),
+                          extensions=self.split_list(self.extensions_edit.text()),
+                          exclude_dirs=self.split_list(self.exclude_dirs_edit.text()),
+                          same_filesystem=self.same_filesystem_check_box.isChecked(),
+                          skip_hidden=self.skip_hidden_check_box.isChecked())
+
         
+class ReportDialog(QDialog):
+    """Shows the instrumentation report of a scan."""
+
+    def __init__(self, report):
+        super().__init__()
+
+        self.setWindowTitle("Scan Report")
+        self.resize(900, 500)
+
+        layout = QVBoxLayout(self)
+
+        text_edit = QPlainTextEdit(report)
+        text_edit.setReadOnly(True)
+        text_edit.setLineWrapMode(QPlainTextEdit.NoWrap)
+        text_edit.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        layout.addWidget(text_edit)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
 class MyMainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -80,14 +361,34 @@ class MyMainWindow(QMainWindow):
         self.assignVariables()
 
         self.worker_thread = QThread()
+        # Moves and deletions run on their own thread, a scan can run meanwhile
+        self.action_thread = QThread()
+        self.action_worker = None
         self.folderButton.clicked.connect(self.openFolderDialog)
+        self.addFolderButton.clicked.connect(self.addFolderDialog)
+        self.filterButton.clicked.connect(self.show_filter_dialog)
+        self.scan_filter = ScanFilter()
         self.openButton.clicked.connect(self.execute_function)
-        self.exportButton.clicked.connect(self.save_to_csv)
+        self.pauseButton.toggled.connect(self.pause_worker)
+        self.cancelButton.clicked.connect(self.cancel_worker)
+        self.exportButton.clicked.connect(self.export_analysis)
 
         self.comboBox.activated.connect(self.onSelected)
         self.comboBox2.activated.connect(self.change_duplicate_view)
+        self.searchEdit.textChanged.connect(self.search_paths)
 
         self.moveButton.clicked.connect(self.move_files)
+
+        file_menu = self.window.menuBar().addMenu("File")
+        file_menu.addAction("Open Previous Analysis...", self.open_analysis)
+        file_menu.addAction("Export Analysis...", self.export_analysis)
+
+        cleanup_menu = self.window.menuBar().addMenu("Cleanup")
+        cleanup_menu.addAction("Undo Last Move", self.undo_last_move)
+        cleanup_menu.addAction("Resume Interrupted Cleanup", self.resume_cleanup)
+        cleanup_menu.addSeparator()
+        cleanup_menu.addAction("Replace Duplicates With Hardlinks", lambda: self.link_files(HARDLINK))
+        cleanup_menu.addAction("Replace Duplicates With Reflinks", lambda: self.link_files(REFLINK))
         
         
     def load_ui(self):
@@ -111,10 +412,16 @@ class MyMainWindow(QMainWindow):
         self.duplicatesView = self.window.findChild(QTableView, 'duplicatesView')
         self.groupby_duplicatesView = self.window.findChild(QTableView, 'duplicatesView_3')
         self.df = None
+        self.searchModel = None
+        self.pandas_data = None
 
         #Buttons
         self.folderButton = self.window.findChild(QToolButton, 'folderButton')
+        self.addFolderButton = self.window.findChild(QToolButton, 'addFolderButton')
+        self.filterButton = self.window.findChild(QPushButton, 'filterButton')
         self.openButton = self.window.findChild(QPushButton, 'openButton')
+        self.pauseButton = self.window.findChild(QPushButton, 'pauseButton')
+        self.cancelButton = self.window.findChild(QPushButton, 'cancelButton')
         self.exportButton = self.window.findChild(QPushButton, 'exportButton')
         self.moveButton = self.window.findChild(QPushButton, 'cleanFilesButton')
 
@@ -130,8 +437,18 @@ class MyMainWindow(QMainWindow):
 
         #LineEdit
         self.folderEdit = self.window.findChild(QLineEdit, 'folderEdit')
+        self.searchEdit = self.window.findChild(QLineEdit, 'searchEdit')
         self.comboBox = self.window.findChild(QComboBox, 'comboBox')
         self.comboBox2 = self.window.findChild(QComboBox, 'comboBox_2')
+        self.workersSpinBox = self.window.findChild(QSpinBox, 'workersSpinBox')
+        self.workersSpinBox.setValue(DEFAULT_HASH_WORKERS)
+        self.incrementalCheckBox = self.window.findChild(QCheckBox, 'incrementalCheckBox')
+        self.hashComboBox = self.window.findChild(QComboBox, 'hashComboBox')
+        self.hash_presets = get_hash_presets()
+        self.hashComboBox.addItems(list(self.hash_presets))
+        self.hashComboBox.setCurrentText(DEFAULT_HASH_ALGORITHM)
+        self.instrumentComboBox = self.window.findChild(QComboBox, 'instrumentComboBox')
+        self.instrumentComboBox.addItems(list(INSTRUMENTATION_MODES))
 
         #ProgressBar
         self.progress_bar_1 =  self.window.findChild(QProgressBar, 'progressBar_1')
@@ -144,37 +461,181 @@ class MyMainWindow(QMainWindow):
         folderPath = dialog.getExistingDirectory(self, "Select Folder")
         self.folderEdit.setText(folderPath)
 
+    def addFolderDialog(self):
+        folderPath = QFileDialog.getExistingDirectory(self, "Add Folder")
+        if folderPath:
+            paths = self.get_folder_paths()
+            self.folderEdit.setText(os.pathsep.join(paths + [folderPath]))
+
+    def show_filter_dialog(self):
+        dialog = FilterDialog(self.scan_filter)
+        if dialog.exec() == QDialog.Accepted:
+            self.scan_filter = dialog.get_scan_filter()
+
+    def get_folder_paths(self):
+        """Returns the folders entered in 'folderEdit', several folders are separated by os.pathsep."""
+        return [path.strip() for path in self.folderEdit.text().split(os.pathsep) if path.strip()]
+
     def execute_function(self):
-        self.folder_path = self.folderEdit.text()
-        self.progress_bar_1.setValue(0)
-        self.progress_bar_2.setValue(0)
-        self.progress_bar_3.setValue(0)
+        self.folder_paths = self.get_folder_paths()
+        # The first folder holds the duplicates bin and names the exported analysis
+        self.folder_path = self.folder_paths[0] if self.folder_paths else ''
+        for progress_bar in (self.progress_bar_1, self.progress_bar_2, self.progress_bar_3):
+            progress_bar.setValue(0)
+            progress_bar.setFormat("%p%")
 
         if not self.folder_path:
             self.show_error_message("Input is empty!")
-        elif not os.path.exists(self.folder_path) and not os.path.isdir(self.folder_path):
-            self.show_error_message(f"The folder '{self.folder_path}' does not exist.")
+        elif any(not os.path.isdir(path) for path in self.folder_paths):
+            missing = next(path for path in self.folder_paths if not os.path.isdir(path))
+            self.show_error_message(f"The folder '{missing}' does not exist.")
         else:
             if not self.worker_thread.isRunning():
-                self.worker = Worker(self.folder_path)
+                hash_algorithm, confirm_algorithm = self.hash_presets[self.hashComboBox.currentText()]
+                instrumentation_mode = INSTRUMENTATION_MODES[self.instrumentComboBox.currentText()]
+                instrumentation = Instrumentation(*instrumentation_mode) if instrumentation_mode else None
+                self.worker = Worker(self.folder_paths, self.workersSpinBox.value(), hash_algorithm, confirm_algorithm,
+                                     self.incrementalCheckBox.isChecked(), self.scan_filter, instrumentation)
 
                 self.worker.signals = WorkerSignals()
                 self.worker.signals.finished.connect(self.on_worker_finished)
+                self.worker.signals.cancelled.connect(self.stop_worker_thread)
 
                 # Connect the progress signals to the worker's update_progress methods
                 self.worker.signals.progress1.connect(self.update_progress_1)
                 self.worker.signals.progress2.connect(self.update_progress_2)
                 self.worker.signals.progress3.connect(self.update_progress_3)
+                self.worker.signals.report.connect(self.show_status)
 
                 self.worker.moveToThread(self.worker_thread)
+                # The thread is reused, the worker of the previous scan must not run again
+                try:
+                    self.worker_thread.started.disconnect()
+                except (RuntimeError, TypeError):
+                    pass
                 self.worker_thread.started.connect(self.worker.process)
 
+                self.set_controls_enabled(True)
                 self.worker_thread.start()
 
+    def get_running_worker(self):
+        """Returns the worker the pause and cancel buttons act on: the scan, else the running file actions."""
+        if self.worker_thread.isRunning():
+            return self.worker
+        if self.action_thread.isRunning():
+            return self.action_worker
+        return None
+
+    def set_controls_enabled(self, enabled):
+        self.pauseButton.setChecked(False)
+        self.pauseButton.setEnabled(enabled)
+        self.cancelButton.setEnabled(enabled)
+
+    def pause_worker(self, paused):
+        worker = self.get_running_worker()
+        if worker is not None:
+            name = "Scan" if worker is self.worker else "Cleanup"
+            if paused:
+                worker.pause()
+                self.show_status(f"{name} paused")
+            else:
+                worker.resume()
+                self.show_status(f"{name} resumed")
+        self.pauseButton.setText("Resume" if paused else "Pause")
+
+    def cancel_worker(self):
+        worker = self.get_running_worker()
+        if worker is not None:
+            self.show_status("Cancelling the scan..." if worker is self.worker else "Stopping the cleanup...")
+            worker.kill()
+
+    def stop_worker_thread(self):
+        if self.worker.instrumentation is not None:
+            self.worker.instrumentation.stop()
+        self.set_controls_enabled(self.action_thread.isRunning())
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+
+    def is_action_thread_idle(self):
+        """Returns whether files can be moved or deleted now, tells the user otherwise."""
+        if self.action_thread.isRunning():
+            self.show_error_message("Files are already being moved or deleted, wait until it is done.")
+            return False
+        return True
+
+    def start_file_actions(self, journal=None, undo=False, plan=None):
+        """Runs the moves or deletions of a journal (or undoes its moves) on the idle action thread, see FileActionWorker."""
+        # The thread is reused, the worker of the previous run must not run again
+        if self.action_worker is not None:
+            self.action_thread.started.disconnect(self.action_worker.process)
+
+        self.action_worker = FileActionWorker(journal, undo, plan)
+        self.action_worker.signals.finished.connect(self.on_file_actions_finished)
+        self.action_worker.signals.cancelled.connect(self.stop_action_thread)
+        self.action_worker.signals.progress3.connect(self.update_progress_3)
+        self.action_worker.signals.report.connect(self.show_status)
+
+        self.action_worker.moveToThread(self.action_thread)
+        self.action_thread.started.connect(self.action_worker.process)
+
+        self.set_controls_enabled(True)
+        self.action_thread.start()
+
+    def stop_action_thread(self):
+        self.set_controls_enabled(self.worker_thread.isRunning())
+        self.action_thread.quit()
+        self.action_thread.wait()
+
+    def on_file_actions_finished(self, journal):
+        self.stop_action_thread()
+        if journal.action == MOVE:
+            self.show_message(f"Files in {journal.destination}: {journal.get_summary()}")
+        elif journal.action in LINK_ACTIONS:
+            self.show_message(f"Duplicates replaced by links to the kept files: {journal.get_summary()}")
+        else:
+            self.show_message(f"Files deleted permanently: {journal.get_summary()}")
+
+    def find_journal(self, accept):
+        """Returns the most recent readable journal for which 'accept(journal)' is true, or None."""
+        for path in ActionJournal.list_journals():
+            try:
+                journal = ActionJournal.load(path)
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+            if accept(journal):
+                return journal
+        return None
+
+    def undo_last_move(self):
+        if not self.is_action_thread_idle():
+            return
+        journal = self.find_journal(lambda journal: journal.get_undoable())
+        if journal is None:
+            self.show_message("There are no moved files to put back.")
+            return
+        self.show_status(f"Moving {len(journal.get_undoable())} files back from {journal.destination}...")
+        self.start_file_actions(journal, undo=True)
+
+    def resume_cleanup(self):
+        if not self.is_action_thread_idle():
+            return
+        journal = self.find_journal(lambda journal: journal.get_counts()['pending'])
+        if journal is None:
+            self.show_message("There is no interrupted cleanup to resume.")
+            return
+        self.show_status(f"Resuming the cleanup of {journal.created} ({journal.get_summary()})...")
+        self.start_file_actions(journal)
+
     def on_worker_finished(self, result):
-        # Process the received data (list of dictionaries) here
-        if result:
-            self.pandas_data = PandasManager(result)
+        # Process the received data (ResultColumns) here
+        self.show_analysis(PandasManager(result) if result else None)
+        self.show_instrumentation_report()
+        self.stop_worker_thread()
+
+    def show_analysis(self, pandas_data):
+        """Shows the duplicates of a finished scan or of an opened analysis."""
+        if pandas_data is not None and pandas_data.get_total_files_count():
+            self.pandas_data = pandas_data
             self.show_hash_grouped_table(0)
             self.show_specific_data()
             self.show_all_data()
@@ -182,8 +643,51 @@ class MyMainWindow(QMainWindow):
         else:
             self.show_message("No Duplicate Files Found.")
 
-        self.worker_thread.quit()
-        self.worker_thread.wait()
+    def open_analysis(self):
+        """Shows an analysis saved by export_analysis instead of scanning again."""
+        if self.worker_thread.isRunning():
+            self.show_error_message("A scan is running, wait until it is done.")
+            return
+
+        # Starts from the most recently saved analysis that can be opened (not a CSV)
+        recent = next((entry for entry in list_analyses() if not entry['file'].lower().endswith('.csv')), None)
+        patterns = " ".join(f"*{result_format}" for result_format in available_formats())
+        filepath, _ = QFileDialog.getOpenFileName(self.window, "Open Previous Analysis",
+                                                  recent['file'] if recent else str(DEFAULT_RESULTS_DIR),
+                                                  f"Analyses ({patterns})")
+        if not filepath:
+            return
+        try:
+            pandas_data = PandasManager.from_file(filepath)
+        except (OSError, ValueError) as error:
+            self.show_error_message(f"Cannot open {filepath}: {error}")
+            return
+
+        # The keep policies and the duplicates bin go by the scanned folders
+        self.folder_paths = pandas_data.metadata.get('roots') or pandas_data.get_roots()
+        self.folder_path = self.folder_paths[0] if self.folder_paths else ''
+        self.folderEdit.setText(os.pathsep.join(self.folder_paths))
+        self.show_analysis(pandas_data)
+        self.show_status(f"Opened {filepath}, the files may have changed since it was saved")
+
+    def show_instrumentation_report(self):
+        """Stops the instrumentation of the finished scan, saves its report named after the scanned folders and shows it."""
+        instrumentation = self.worker.instrumentation
+        if instrumentation is None:
+            return
+
+        # The DataFrame construction is the last measured stage
+        instrumentation.stop()
+        # Named like the exported analysis, see get_roots_name
+        saved_paths = instrumentation.save(get_roots_name(self.worker.paths))
+
+        report = instrumentation.format_report()
+        report += "\n\nSaved " + ", ".join(str(path) for path in saved_paths)
+        if instrumentation.profile:
+            report += "\n\n" + instrumentation.get_profile_stats()
+        if instrumentation.trace_memory:
+            report += "\n\nLargest allocations still held at the end of the scan:\n" + instrumentation.get_memory_stats()
+        ReportDialog(report).exec()
     
     def get_readable_size(self, size_bytes):
         """
@@ -248,13 +752,9 @@ class MyMainWindow(QMainWindow):
         
         df = self.pandas_data.get_dataframe_copy()
 
-        model = PandasModel(df)
-
-        self.searchModel = QSortFilterProxyModel() #No need for custom filter model
-        self.searchModel.setDynamicSortFilter(True)
-        self.searchModel.setFilterCaseSensitivity(Qt.CaseInsensitive)
-        self.searchModel.setFilterKeyColumn(0) # this will search in specific column
-        self.searchModel.setSourceModel(model)
+        # The model filters itself, the paths get an n-gram index for the search box
+        self.searchModel = PandasModel(df, ngram_columns=['FilePath'])
+        self.searchModel.set_filter('FilePath', self.searchEdit.text())
 
         self.groupby_duplicatesView.setModel(self.searchModel)
 
@@ -269,15 +769,18 @@ class MyMainWindow(QMainWindow):
 
     def change_duplicate_view(self):
         
-        idx = self.comboBox2.currentIndex()
-        if idx == 0:    
+        view = self.comboBox2.currentText()
+        if view in KEEP_POLICIES:
+            self.df = self.pandas_data.get_excess_duplicates(self.get_keep_policy(view))
+        elif view == "Spanning Folders":
+            self.df = self.pandas_data.get_cross_root_duplicates()
+        else:
             self.df = self.pandas_data.get_dataframe_copy()
-        elif idx == 1:  
-            self.df = self.pandas_data.get_excess_duplicates(True)
-        elif idx == 2:
-            self.df = self.pandas_data.get_excess_duplicates(False)
         self.show_all_data()
 
+    def get_keep_policy(self, view):
+        return KeepPolicy(KEEP_POLICIES[view], preferred_roots=self.folder_paths)
+
     def show_all_data(self):
         
         if not isinstance(self.df, pd.DataFrame):
@@ -305,15 +808,12 @@ class MyMainWindow(QMainWindow):
         return values
 
     def delete_multiple_selections(self, tableview):
+        if not self.is_action_thread_idle():
+            return
         values = self.get_multiple_selections(tableview)
-        for myfile in values:
-            # If file exists, delete it.
-            if os.path.isfile(myfile):
-                os.remove(myfile)
-                self.show_message(f"The file '{myfile}' has been permanently deleted.")
-            else:
-                # If it fails, inform the user.
-                self.show_error_message(f"The file '{myfile}' does not exist.")
+        # Deleted in the background, the journal keeps the list of what was deleted
+        self.show_status(f"Deleting {len(values)} files...")
+        self.start_file_actions(plan=dict(action=DELETE, sources=sorted(values)))
 
     def set_unique_info(self, value, idex):
 
@@ -334,37 +834,37 @@ class MyMainWindow(QMainWindow):
         value = str(index.sibling(index.row(),0).data())
         
         idx = self.comboBox.currentIndex()
-        if idx == 0:    
-            self.searchModel.setFilterKeyColumn(4)
-        elif idx == 1:  
-            self.searchModel.setFilterKeyColumn(5)
-        self.searchModel.setFilterFixedString(value) 
+        # Show the files of the clicked group only, on whichever hash the groups are built
+        self.searchModel.set_filters({column: (value if column == GROUP_COLUMNS[idx] else None, EXACT)
+                                      for column in GROUP_COLUMNS})
         self.set_unique_info(value, idx)
 
-    @Slot(int, int)
-    def update_progress_1(self, progress, total):
-        # Update the progress bar value
-        percentage = int((progress / total) * 100)
-        self.progress_bar_1.setValue(percentage)
+    def search_paths(self, text):
+        if self.searchModel is not None:
+            self.searchModel.set_filter('FilePath', text)
 
-    @Slot(int, int)
-    def update_progress_2(self, progress, total):
-        # Update the progress bar value
-        percentage = int((progress / total) * 100)
-        self.progress_bar_2.setValue(percentage)
+    @Slot(object)
+    def update_progress_1(self, stats):
+        # Update the progress bar value, the throughput and ETA are shown as its text
+        self.progress_bar_1.setValue(stats.percentage)
+        self.progress_bar_1.setFormat(f"%p%  ({stats.format()})")
 
-    @Slot(int, int)
-    def update_progress_3(self, progress, total):
-        # Update the progress bar value
-        percentage = int((progress / total) * 100)
-        self.progress_bar_3.setValue(percentage)
+    @Slot(object)
+    def update_progress_2(self, stats):
+        # Update the progress bar value, the throughput and ETA are shown as its text
+        self.progress_bar_2.setValue(stats.percentage)
+        self.progress_bar_2.setFormat(f"%p%  ({stats.format()})")
+
+    @Slot(object)
+    def update_progress_3(self, stats):
+        # Update the progress bar value, the throughput and ETA are shown as its text
+        self.progress_bar_3.setValue(stats.percentage)
+        self.progress_bar_3.setFormat(f"%p%  ({stats.format()})")
 
     def showContextMenu(self, pos, tableview):
         current_item = tableview.indexAt(pos)
         
         if current_item is not None:
-            row = current_item.row()
-            print(row)
             menu = QMenu(self)
 
             # print_action = QAction("Print Files", self)
@@ -389,11 +889,37 @@ class MyMainWindow(QMainWindow):
 
             menu.exec(tableview.viewport().mapToGlobal(pos))
 
-    def save_to_csv(self):
-        
-        path = self.folderEdit.text()
-        self.pandas_data.save_dataframe_to_csv(path)
+    def export_analysis(self):
+        if self.pandas_data is None:
+            self.show_message("There is no analysis to export, scan a folder first.")
+            return
+
+        # Named after the scanned folders, see get_roots_name
+        folder_paths = self.get_folder_paths()
+        path = next(iter(folder_paths), '')
+        file_name = get_roots_name(folder_paths) if folder_paths else 'analysis'
+        filters = [f"{FORMAT_NAMES[result_format]} (*{result_format})" for result_format in available_formats()]
+        filters.append("CSV (*.csv)")
+        filepath, selected_filter = QFileDialog.getSaveFileName(self.window, "Export Analysis",
+                                                                str(DEFAULT_RESULTS_DIR / (file_name + COLUMNS)),
+                                                                ";;".join(filters))
+        if not filepath:
+            return
+        # The dialog does not add the suffix of the chosen format on every platform
+        suffix = selected_filter[selected_filter.index('*') + 1:-1]
+        if not filepath.lower().endswith(suffix):
+            filepath += suffix
+
+        try:
+            self.pandas_data.export(filepath, path)
+        except (OSError, ValueError) as error:
+            self.show_error_message(f"Cannot export the analysis: {error}")
+            return
+        self.show_status(f"Analysis saved to {filepath}")
     
+    def show_status(self, message):
+        self.window.statusBar().showMessage(message)
+
     def show_error_message(self, message):
         msg_box = QMessageBox()
         msg_box.setIcon(QMessageBox.Critical)
@@ -414,63 +940,54 @@ class MyMainWindow(QMainWindow):
             self.delete_multiple_selections(tableview)
 
     def move_files(self):
-        
-        idx = self.comboBox2.currentIndex()
-        if idx == 0:    
-            files_list = []
-        elif idx == 1:  
-            df = self.pandas_data.get_excess_duplicates(True)
-            files_list = df['FilePath'].tolist()
-        elif idx == 2:
-            df = self.pandas_data.get_excess_duplicates(False)
-            files_list = df['FilePath'].tolist()
-
-        # Create the destination subdirectory
-        dest_dir_path = os.path.join(self.folder_path, "duplicates_bin")
-        if not os.path.exists(dest_dir_path):
-            os.makedirs(dest_dir_path)
-
-        # Create a logger and set the log level to INFO
-        logger = logging.getLogger(__name__)
-        logger.setLevel(logging.INFO)
+        if not self.is_action_thread_idle():
+            return
 
-        # Create a file handler to write the log messages to a log file
-        log_file_path = os.path.join(dest_dir_path, f'dup_move_files.log')
-        file_handler = logging.FileHandler(log_file_path)
+        view = self.comboBox2.currentText()
+        if view in KEEP_POLICIES:
+            # With their aliases, the other hardlinks of a file keep it on the disk
+            files_list = self.pandas_data.get_excess_paths(self.get_keep_policy(view))
+        else:
+            # The other views show whole groups, they do not say which copy to keep
+            files_list = []
 
-        # Create a formatter for the log messages
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
+        if not files_list:
+            self.show_message("No files to move, choose a view that keeps one file of every group.")
+            return
 
-        # Add the file handler to the logger
-        logger.addHandler(file_handler)
+        dest_dir_path = os.path.join(self.folder_path, "duplicates_bin")
+        # The journal of the moves allows undoing or resuming them
+        self.show_status(f"Moving {len(files_list)} files to {dest_dir_path}...")
+        self.start_file_actions(plan=dict(action=MOVE, sources=files_list, destination=dest_dir_path))
+
+    def link_files(self, action):
+        """Replaces the excess duplicates of the current keep view by hardlinks or reflinks to the kept files."""
+        if not self.is_action_thread_idle():
+            return
+
+        view = self.comboBox2.currentText()
+        if self.pandas_data is None or view not in KEEP_POLICIES:
+            self.show_message("No files to link, scan a folder and choose a view that keeps one file of every group.")
+            return
+        sources, targets, hashes = self.pandas_data.get_link_plan(self.get_keep_policy(view))
+        if not sources:
+            self.show_message("There are no duplicates to link.")
+            return
+
+        if action == HARDLINK:
+            details = ("Every duplicate becomes another name of the kept file: they will share their "
+                       "permissions and times, and editing one edits all of them.")
+        else:
+            details = ("Every duplicate becomes a copy-on-write clone of the kept file, which needs a "
+                       "filesystem with reflinks (btrfs, XFS).")
+        answer = QMessageBox.question(self.window, "Confirmation",
+                                      f"Replace {len(sources)} duplicates by links to the file kept by "
+                                      f"'{view}'?\n\n{details}\nFiles changed since the scan are left alone.")
+        if answer != QMessageBox.Yes:
+            return
 
-        # Move each matching file to the destination subdirectory
-        for filepath in files_list:
-            try:
-                # Check if the file name already exists in the destination directory
-                file_name = os.path.basename(filepath)
-                dest_file_path = os.path.join(dest_dir_path, file_name)
-                file_name_without_ext = os.path.splitext(file_name)[0]
-                ext = os.path.splitext(file_name)[1]
-                suffix = 1
-
-                while os.path.exists(dest_file_path):
-                    # Rename the file with a suffix if it already exists in the destination directory
-                    new_file_name = f"{file_name_without_ext}_{suffix}{ext}"
-                    dest_file_path = os.path.join(dest_dir_path, new_file_name)
-                    suffix += 1
-
-                # Move the file to the destination subdirectory
-                shutil.move(filepath, dest_file_path)
-
-                # Log that the file has been moved successfully
-                logger.info(f"Moved '{filepath}' to '{dest_file_path}'")
-
-            except Exception as e:
-                # Log any errors that occur while moving the file
-                logger.error(f"Error moving '{filepath}' to '{dest_dir_path}': {e}")
-        self.show_message(f"All Duplicate Files moved to {dest_dir_path}")
+        self.show_status(f"Linking {len(sources)} duplicates...")
+        self.start_file_actions(plan=dict(action=action, sources=sources, targets=targets, hashes=hashes))
 
     def open_file_location(self, tableview):
         values = self.get_multiple_selections(tableview)
@@ -482,7 +999,7 @@ class MyMainWindow(QMainWindow):
                 elif os.name == 'posix':  # Linux or Mac
                     subprocess.run(['xdg-open', file_directory])
             else:
-                print("File location does not exist.")
+                self.show_status(f"File location does not exist: {file_directory}")
 
     def copy_file_location(self, tableview):
         values = self.get_multiple_selections(tableview)
@@ -0,0 +1,316 @@
+"""
+Headless duplicate scan.
+
+Runs the same pipeline as the GUI without importing PySide6 or pandas. Confirmed
+duplicate groups are streamed to stdout as NDJSON (one JSON object per line) while
+the scan runs; stage timings and throughput are printed to stderr.
+
+Walking and hashing overlap, so a group is written again every time it gains a member.
+The last line written for a hash holds the complete group.
+
+With --incremental the directory snapshot of the previous run is reused for directories
+whose mtime did not change. --watch keeps running after the first scan and rescans the
+directories reported by inotify (Linux only), writing the updated groups again.
+
+The scan state is checkpointed periodically and on Ctrl+C; --resume continues an
+interrupted scan of the same path and settings from its checkpoint.
+
+Several paths can be given; they are scanned together and duplicates are found across them.
+
+--instrument prints the wall time, CPU time, I/O and peak RSS of every stage and saves the
+report to folder_analysis_data/, where the GUI exports its analyses; --profile and --trace-memory
+also capture cProfile statistics and the top tracemalloc allocations.
+
+--save writes the duplicate files with typed columns (.cols, or Parquet, Arrow and zstd NDJSON
+when the optional packages are installed), the GUI opens the file without scanning again.
+
+--history saves every scan of the paths by time under folder_analysis_data/history/ and
+prints only what changed since the previous one (new, resolved, grown and shrunk duplicate
+groups), e.g. for a nightly cron job; --report writes the same changes as JSON.
+
+Usage:
+    python -m backend PATH [PATH ...] [--workers N] [--algorithm sha1] [--tiered] [--output groups.ndjson]
+"""
+import sys
+import json
+import time
+import datetime
+import argparse
+
+from backend.duplicates_checker import (DuplicatePipeline, convert_size, DEFAULT_HASH_WORKERS, DEFAULT_SAMPLE_STAGES,
+                                        SAMPLE_STAGES)
+from backend.file_walker import DEFAULT_WALK_WORKERS, normalize_roots
+from backend.hash_algorithms import (available_algorithms, get_fast_algorithm, DEFAULT_HASH_ALGORITHM,
+                                     STRONG_HASH_ALGORITHM)
+from backend.hash_cache import HashCache, DEFAULT_CACHE_PATH
+from backend.dir_snapshot import DirectorySnapshot, DEFAULT_SNAPSHOT_DIR, get_roots_name
+from backend.scan_checkpoint import DEFAULT_CHECKPOINT_DIR, DEFAULT_CHECKPOINT_INTERVAL
+from backend.scan_filter import ScanFilter, COMMON_EXCLUDED_DIRS, DEFAULT_MIN_SIZE, format_pruned
+from backend.instrumentation import Instrumentation
+from backend.result_store import save_results, load_results, record_analysis, get_format, available_formats, FORMATS
+from backend.scan_history import ScanHistory, SnapshotDiff, DEFAULT_HISTORY_DIR, DEFAULT_HISTORY_KEEP
+from backend import dir_watcher
+
+SIZE_SUFFIXES = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+def parse_size(value):
+    """Parses a size like '4096', '64K' or '1.5G' into bytes."""
+    value = value.strip().upper().rstrip('B')
+    suffix = value[-1:] if value[-1:] in SIZE_SUFFIXES else ''
+    try:
+        return int(float(value[:len(value) - len(suffix)]) * SIZE_SUFFIXES[suffix])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size '{value}'")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m backend', description='Find duplicate files without the GUI.')
+    parser.add_argument('path', nargs='+', help='Directories to scan, duplicates are also found across them')
+    parser.add_argument('-o', '--output', help='Write the NDJSON groups to this file instead of stdout')
+    parser.add_argument('--save', metavar='FILE',
+                        help=f"Also save the duplicate files for the GUI (File > Open Previous Analysis), "
+                             f"the suffix picks the format: {', '.join(FORMATS)}")
+    parser.add_argument('--workers', type=int, default=DEFAULT_HASH_WORKERS, help='Number of hashing threads')
+    parser.add_argument('--walk-workers', type=int, default=DEFAULT_WALK_WORKERS, help='Number of directory listing threads')
+    parser.add_argument('--algorithm', choices=available_algorithms(), default=DEFAULT_HASH_ALGORITHM,
+                        help='Hash algorithm used to compare files')
+    parser.add_argument('--confirm-algorithm', choices=available_algorithms(),
+                        help='Strong hash confirming collisions of --algorithm (tiered mode)')
+    parser.add_argument('--tiered', action='store_true',
+                        help=f'Shortcut for --algorithm {get_fast_algorithm()} --confirm-algorithm {STRONG_HASH_ALGORITHM}')
+    parser.add_argument('--samples', default=','.join(DEFAULT_SAMPLE_STAGES),
+                        help=f"Comma separated sampling stages out of {', '.join(SAMPLE_STAGES)}, empty to disable")
+    parser.add_argument('--no-cache', action='store_true', help='Do not use the persistent hash cache')
+    parser.add_argument('--cache-path', default=str(DEFAULT_CACHE_PATH), help='Location of the hash cache database')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Reuse the directory snapshot of the previous scan for unchanged directories')
+    parser.add_argument('--snapshot-dir', default=str(DEFAULT_SNAPSHOT_DIR), help='Location of the directory snapshots')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep watching the tree with inotify and rescan changed directories (implies --incremental)')
+    parser.add_argument('--resume', action='store_true', help='Continue the interrupted scan of the paths from its checkpoint')
+    parser.add_argument('--checkpoint-dir', default=str(DEFAULT_CHECKPOINT_DIR), help='Location of the scan checkpoints')
+    parser.add_argument('--checkpoint-interval', type=float, default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help='Seconds between two checkpoints of a running scan')
+    parser.add_argument('--no-checkpoint', action='store_true', help='Do not checkpoint the scan')
+
+    history = parser.add_argument_group('history', 'Scans saved by time, reporting what changed between them')
+    history.add_argument('--history', action='store_true',
+                         help='Save the scan in the scan history and report what changed since the previous scan of the paths')
+    history.add_argument('--since', type=datetime.datetime.fromisoformat, metavar='DATE',
+                         help='Compare with the last scan saved before this date (e.g. 2024-05-01) instead, implies --history')
+    history.add_argument('--report', metavar='FILE', help='Also write the changes as JSON, implies --history')
+    history.add_argument('--history-keep', type=int, default=DEFAULT_HISTORY_KEEP, metavar='N',
+                         help='Only keep the N most recent scans of the paths, 0 keeps every scan')
+    history.add_argument('--history-dir', default=str(DEFAULT_HISTORY_DIR), help='Location of the scan history')
+
+    filters = parser.add_argument_group('filters', 'Applied while walking, pruned directories are never opened')
+    filters.add_argument('--min-size', type=parse_size, default=DEFAULT_MIN_SIZE, help='Smallest file size, e.g. 4K')
+    filters.add_argument('--max-size', type=parse_size, help='Largest file size, e.g. 2G')
+    filters.add_argument('--include', action='append', default=[], metavar='GLOB',
+                         help='Only scan files whose name or path matches (repeatable)')
+    filters.add_argument('--exclude', action='append', default=[], metavar='GLOB',
+                         help='Skip files and directories whose name or path matches (repeatable)')
+    filters.add_argument('--ext', default='', help='Comma separated extensions to scan, e.g. jpg,png')
+    filters.add_argument('--exclude-dir', action='append', default=[], metavar='NAME',
+                         help='Skip directories with this name or name pattern (repeatable)')
+    filters.add_argument('--exclude-common', action='store_true',
+                         help=f"Skip {', '.join(COMMON_EXCLUDED_DIRS)}")
+    filters.add_argument('-x', '--same-filesystem', action='store_true', help='Do not cross filesystem boundaries')
+    filters.add_argument('--skip-hidden', action='store_true', help='Skip hidden files and directories')
+
+    instrument = parser.add_argument_group('instrumentation')
+    instrument.add_argument('--instrument', action='store_true',
+                            help='Measure time, CPU, I/O and memory per stage and save the report')
+    instrument.add_argument('--profile', action='store_true', help='Also profile the scan with cProfile')
+    instrument.add_argument('--trace-memory', action='store_true', help='Also trace the allocations with tracemalloc')
+    instrument.add_argument('--report-dir', default='folder_analysis_data', help='Where to save the reports')
+
+    args = parser.parse_args(argv)
+    args.instrument = args.instrument or args.profile or args.trace_memory
+    args.history = args.history or args.since is not None or args.report is not None
+    if args.tiered:
+        args.algorithm = get_fast_algorithm()
+        args.confirm_algorithm = STRONG_HASH_ALGORITHM
+
+    if args.watch:
+        if not dir_watcher.is_supported():
+            parser.error('--watch requires Linux inotify')
+        args.incremental = True
+
+    args.scan_filter = ScanFilter(min_size=args.min_size, max_size=args.max_size, include_globs=args.include,
+                                  exclude_globs=args.exclude,
+                                  extensions=[extension for extension in args.ext.split(',') if extension.strip()],
+                                  exclude_dirs=args.exclude_dir + (list(COMMON_EXCLUDED_DIRS) if args.exclude_common else []),
+                                  same_filesystem=args.same_filesystem, skip_hidden=args.skip_hidden)
+
+    if args.save:
+        try:
+            save_format = get_format(args.save)
+        except ValueError as error:
+            parser.error(str(error))
+        if save_format not in available_formats():
+            parser.error(f"--save {save_format} needs pyarrow or zstandard, available: {', '.join(available_formats())}")
+
+    args.samples = [stage for stage in args.samples.split(',') if stage]
+    for stage in args.samples:
+        if stage not in SAMPLE_STAGES:
+            parser.error(f"unknown sampling stage '{stage}'")
+    return args
+
+def print_stage_report(pipeline, total_seconds, stream=sys.stderr):
+    """Prints the work done by every pipeline stage. The stages overlap, so only the walk has its own wall time."""
+    rate = pipeline.file_count / pipeline.walk_seconds if pipeline.walk_seconds else 0
+    print(f"[walk] {pipeline.file_count} files in {pipeline.walk_seconds:.2f}s ({rate:.0f} files/s)", file=stream)
+    print(f"[filter] pruned {format_pruned(pipeline.walker.pruned_dirs, pipeline.walker.pruned_files)}", file=stream)
+
+    for stats in pipeline.get_stage_stats():
+        byte_rate = stats['bytes'] / total_seconds if total_seconds else 0
+        print(f"[{stats['stage']}] {stats['files_in']} files, {stats['eliminated']} eliminated, "
+              f"{convert_size(stats['bytes'])} read ({convert_size(int(byte_rate))}/s over the scan)", file=stream)
+
+    print(f"[total] {total_seconds:.2f}s", file=stream, flush=True)
+
+def write_groups(pipeline, output):
+    for digest, algorithm, size, files in pipeline.run():
+        group = {
+            'hash': digest.hex(),
+            'algorithm': algorithm,
+            'size': size,
+            'count': len(files),
+            'reclaimable': size * (len(files) - 1),
+            'files': files,
+            'roots': sorted({pipeline.get_root(filename) for filename in files}),
+            'aliases': {filename: pipeline.walker.aliases[filename]
+                        for filename in files if filename in pipeline.walker.aliases},
+        }
+        output.write(json.dumps(group) + '\n')
+        output.flush()
+
+def save_history(args, roots, columns):
+    """Reports what changed since the previous scan of 'roots' (or the last one before --since), then saves this one."""
+    history = ScanHistory(roots, args.history_dir)
+    created = datetime.datetime.now()
+    previous_path = history.find_snapshot(args.since or created)
+
+    if previous_path is None:
+        print("[history] first saved scan of these paths, nothing to compare with", file=sys.stderr)
+    else:
+        try:
+            previous_columns, _ = load_results(previous_path)
+            diff = SnapshotDiff(previous_columns, columns, history.get_created(previous_path), created)
+        except (OSError, ValueError) as error:
+            print(f"[history] cannot compare with {previous_path}: {error}", file=sys.stderr)
+        else:
+            print(diff.format_report(), file=sys.stderr)
+            if args.report:
+                with open(args.report, 'w', encoding='utf-8') as report_file:
+                    json.dump(diff.to_dict(), report_file, indent=2)
+
+    snapshot_path = history.save(columns, created, {'algorithm': args.algorithm,
+                                                     'confirm_algorithm': args.confirm_algorithm},
+                                 keep=args.history_keep)
+    print(f"[history] saved {snapshot_path}", file=sys.stderr)
+
+def run_scan(args, output):
+    roots = normalize_roots(args.path)
+    cache = None if args.no_cache else HashCache(args.cache_path)
+    snapshot = DirectorySnapshot.load(roots, args.snapshot_dir) if args.incremental else None
+    watcher = None
+    dirty_dirs = set()
+
+    try:
+        if args.watch:
+            # Watch before the first scan so that changes made while it runs are not lost
+            watcher = dir_watcher.InotifyWatcher()
+            for root in roots:
+                watcher.add_tree(root)
+
+        while True:
+            instrumentation = None
+            if args.instrument:
+                instrumentation = Instrumentation(profile=args.profile, trace_memory=args.trace_memory)
+                instrumentation.start()
+
+            start_time = time.perf_counter()
+            pipeline = DuplicatePipeline(roots, cache=cache, workers=args.workers, walk_workers=args.walk_workers,
+                                         hash_algorithm=args.algorithm, confirm_algorithm=args.confirm_algorithm,
+                                         sample_stages=args.samples, snapshot=snapshot,
+                                         record_snapshot=args.incremental, dirty_dirs=dirty_dirs,
+                                         checkpoint_dir=None if args.no_checkpoint else args.checkpoint_dir,
+                                         checkpoint_interval=args.checkpoint_interval, resume=args.resume,
+                                         scan_filter=args.scan_filter)
+            if pipeline.resumed is not None:
+                print("[resume] continuing from the checkpoint of the interrupted scan", file=sys.stderr, flush=True)
+            try:
+                write_groups(pipeline, output)
+            finally:
+                if instrumentation is not None:
+                    instrumentation.stop()
+            total_seconds = time.perf_counter() - start_time
+
+            groups = pipeline.get_duplicate_groups()
+            reclaimable = sum(size * (len(files) - 1) for _, _, size, files in groups)
+            print_stage_report(pipeline, total_seconds)
+            print(f"{len(groups)} groups, {sum(len(files) for _, _, _, files in groups)} files, "
+                  f"{convert_size(reclaimable)} reclaimable", file=sys.stderr)
+
+            columns = pipeline.get_columns() if args.save or args.history else None
+            if args.save:
+                saved_path = save_results(columns, args.save, {'roots': roots})
+                record_analysis(saved_path, {'path': roots[0], 'rows': len(columns)})
+                print(f"[save] {len(columns)} files saved to {saved_path}", file=sys.stderr)
+
+            if args.history:
+                save_history(args, roots, columns)
+
+            if args.incremental:
+                snapshot = pipeline.walker.new_snapshot
+                snapshot.save(args.snapshot_dir)
+                print(f"[snapshot] {pipeline.walker.dirs_reused} of {pipeline.walker.dirs_scanned} directories reused",
+                      file=sys.stderr)
+
+            if instrumentation is not None:
+                print(instrumentation.format_report(), file=sys.stderr)
+                # Named like the analysis the GUI exports for the same paths, see get_roots_name
+                for report_path in instrumentation.save(get_roots_name(roots), args.report_dir):
+                    print(f"[instrumentation] saved {report_path}", file=sys.stderr)
+
+            if cache is not None:
+                cache.flush()
+                print(cache.get_stats_message(), file=sys.stderr)
+                cache.reset_stats()
+
+            if watcher is None:
+                break
+
+            dirty_dirs = watcher.wait_for_changes()
+            if dirty_dirs is None:
+                print("[watch] event queue overflowed, rescanning everything", file=sys.stderr, flush=True)
+                snapshot = None
+                dirty_dirs = set()
+            else:
+                print(f"[watch] {len(dirty_dirs)} directories changed, rescanning", file=sys.stderr, flush=True)
+
+        if cache is not None:
+            cache.evict_stale()
+    finally:
+        if watcher is not None:
+            watcher.close()
+        if cache is not None:
+            cache.close()
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as output:
+                run_scan(args, output)
+        else:
+            run_scan(args, sys.stdout)
+    except KeyboardInterrupt:
+        if not args.no_checkpoint:
+            print("Interrupted, run again with --resume to continue the scan", file=sys.stderr)
+        return 130
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,24 +1,120 @@
+import threading
+import numpy as np
 import pandas as pd
+from collections import OrderedDict
 from PySide6.QtWidgets import *
 from PySide6.QtCore import *
 
+from backend.filter_engine import FilterEngine, CONTAINS
+
+# Rows added to the view per fetchMore call
+DEFAULT_FETCH_BATCH = 10000
+
+# Formatted cells kept by a model, a few screens worth of every column
+DEFAULT_CELL_CACHE_SIZE = 50000
+
+def get_sort_keys(series):
+    """
+    Returns values whose argsort orders 'series' like sort_values would, except that
+    categoricals are ordered by their text instead of by the order of their categories.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories.astype(str).to_numpy()
+        category_ranks = np.argsort(np.argsort(categories, kind='stable'), kind='stable')
+        codes = series.cat.codes.to_numpy()
+        # Missing values (code -1) sort first
+        return np.where(codes >= 0, category_ranks[codes], -1)
+    return series.to_numpy()
+
 class PandasModel(QAbstractTableModel):
-    """A model to interface a Qt view with pandas dataframe """
+    """
+    A model to interface a Qt view with pandas dataframe.
+
+    The model never copies or reorders the DataFrame. The view shows the rows through
+    '_order', a permutation of the row positions. Sorting swaps in the argsort of the
+    column, which is computed once per column on a background thread so the GUI stays
+    responsive.
+
+    Filters are evaluated by a FilterEngine over the whole DataFrame and only select which
+    rows of the sorted permutation are shown, so neither sorting nor filtering asks the
+    model for a single cell.
+
+    Cells are rendered column by column. Categorical columns (hashes, roots, algorithms)
+    have their categories rendered once. Text columns are shown as they are. Everything
+    else is formatted on demand and kept in an LRU cache. With 'fetch_batch' set, rows
+    are handed to the view in batches through canFetchMore/fetchMore.
+
+    Args:
+        dataframe (pd.DataFrame): The data to show.
+        fetch_batch (int, optional): Rows added per fetchMore call, None to show every row at once.
+        ngram_columns (list): Columns searched through an n-gram index, see FilterEngine.
+    """
 
     sortingAboutToStart = Signal()
     sortingFinished = Signal()
+    # Emitted from the sorting thread: request number, column, (argsort, order)
+    _argsortReady = Signal(int, int, object)
 
-    def __init__(self, dataframe: pd.DataFrame, parent=None):
+    def __init__(self, dataframe: pd.DataFrame, parent=None, fetch_batch=DEFAULT_FETCH_BATCH,
+                 cache_size=DEFAULT_CELL_CACHE_SIZE, ngram_columns=()):
         QAbstractTableModel.__init__(self, parent)
         self._dataframe = dataframe
+        # Every row in the sorted order, and the rows of it passing the filters
+        self._sort_order = np.arange(len(dataframe.index))
+        self._order = self._sort_order
+        self.filter_engine = FilterEngine(dataframe, ngram_columns)
+        self._fetch_batch = fetch_batch
+        self._loaded_rows = len(self._order) if fetch_batch is None else min(fetch_batch, len(self._order))
+
+        self._columns = [self._render_column(dataframe.iloc[:, column]) for column in range(len(dataframe.columns))]
+        self._headers = [str(column) for column in dataframe.columns]
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+
+        self._argsorts = {}
+        self._sort_request = 0
+        self._argsortReady.connect(self._apply_argsort)
+
+    @staticmethod
+    def _render_column(series):
+        """
+        Returns:
+            tuple: (codes, rendered categories) for categoricals, (texts, None) for text columns,
+                   (values, False) for columns formatted on demand.
+        """
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = [str(category) for category in series.cat.categories]
+            # Missing values (code -1) pick the last entry
+            return series.cat.codes.to_numpy(), categories + ['nan']
+        if pd.api.types.is_string_dtype(series) and not series.hasnans:
+            return series.to_numpy(), None
+        return series.array, False
+
+    def _get_text(self, row, column):
+        values, rendering = self._columns[column]
+        if rendering is None:
+            return values[row]
+        if rendering is not False:
+            return rendering[values[row]]
+
+        key = (row, column)
+        text = self._cache.get(key)
+        if text is None:
+            text = str(values[row])
+            self._cache[key] = text
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        return text
 
     def rowCount(self, parent=QModelIndex()) -> int:
         """ Override method from QAbstractTableModel
 
-        Return row count of the pandas DataFrame
+        Return the number of rows handed to the view so far
         """
         if parent == QModelIndex():
-            return len(self._dataframe.index)
+            return self._loaded_rows
         return 0
 
     def columnCount(self, parent=QModelIndex()) -> int:
@@ -27,9 +123,20 @@ class PandasModel(QAbstractTableModel):
         Return column count of the pandas DataFrame
         """
         if parent == QModelIndex():
-            return len(self._dataframe.columns)
+            return len(self._headers)
         return 0
 
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        return parent == QModelIndex() and self._loaded_rows < len(self._order)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        rows = min(self._fetch_batch, len(self._order) - self._loaded_rows)
+        self.beginInsertRows(QModelIndex(), self._loaded_rows, self._loaded_rows + rows - 1)
+        self._loaded_rows += rows
+        self.endInsertRows()
+
     def data(self, index: QModelIndex, role=Qt.ItemDataRole):
         """Override method from QAbstractTableModel
 
@@ -39,7 +146,7 @@ class PandasModel(QAbstractTableModel):
             return None
 
         if role == Qt.DisplayRole:
-            return str(self._dataframe.iloc[index.row(), index.column()])
+            return self._get_text(self._order[index.row()], index.column())
         return None
 
     def headerData(self, section: int, orientation: Qt.Orientation, role: Qt.ItemDataRole):
@@ -49,78 +156,87 @@ class PandasModel(QAbstractTableModel):
         """
         if role == Qt.DisplayRole:
             if orientation == Qt.Horizontal:
-                return str(self._dataframe.columns[section])
+                return self._headers[section]
 
             if orientation == Qt.Vertical:
-                return str(self._dataframe.index[section]+1)
+                return str(self._dataframe.index[self._order[section]]+1)
 
         return None
 
+    def set_filter(self, column, pattern, mode=CONTAINS):
+        """Filters the rows on one column, an empty pattern removes the filter. See FilterEngine.set_filter."""
+        self.set_filters({column: (pattern, mode)})
+
+    def set_filters(self, filters):
+        """
+        Sets several filters at once, the view is reset a single time.
+
+        Args:
+            filters (dict): Column name -> (pattern, mode), an empty pattern removes the filter of the column.
+        """
+        changed = False
+        for column, (pattern, mode) in filters.items():
+            changed |= self.filter_engine.set_filter(column, pattern, mode)
+        if not changed:
+            return
+
+        self.beginResetModel()
+        self._order = self._get_visible_rows(self._sort_order)
+        self._loaded_rows = len(self._order) if self._fetch_batch is None else min(self._fetch_batch, len(self._order))
+        self.endResetModel()
+
+    def _get_visible_rows(self, sort_order):
+        mask = self.filter_engine.get_mask()
+        return sort_order if mask is None else sort_order[mask[sort_order]]
+
+    def get_source_row(self, row):
+        """Returns the position in the DataFrame of the row shown at 'row'."""
+        return int(self._order[row])
+
     def sort(self, columnId, order=Qt.AscendingOrder):
         """sort the model column
-        After sorting the data in ascending or descending order, a signal
-        `layoutChanged` is emitted.
+        The argsort of the column is computed on a background thread the first time, then
+        `layoutChanged` is emitted once the new order is in place.
         Args:
             columnId (int): columnIndex
             order (Qt::SortOrder, optional): descending(1) or ascending(0). defaults to Qt.AscendingOrder
         """
-        self.layoutAboutToBeChanged.emit()
+        self._sort_request += 1
         self.sortingAboutToStart.emit()
-        column = self._dataframe.columns[columnId]
-        self._dataframe.sort_values(by=column, ascending=not bool(order), inplace=True)
+
+        argsort = self._argsorts.get(columnId)
+        if argsort is not None:
+            self._set_order(argsort, order)
+            return
+
+        request = self._sort_request
+        keys = get_sort_keys(self._dataframe.iloc[:, columnId])
+
+        def compute_argsort():
+            argsort = np.argsort(keys, kind='stable')
+            try:
+                self._argsortReady.emit(request, columnId, (argsort, order))
+            except RuntimeError:
+                # The model was deleted while sorting
+                pass
+
+        threading.Thread(target=compute_argsort, daemon=True).start()
+
+    @Slot(int, int, object)
+    def _apply_argsort(self, request, columnId, result):
+        argsort, order = result
+        self._argsorts[columnId] = argsort
+        # A later sort request replaced this one
+        if request == self._sort_request:
+            self._set_order(argsort, order)
+
+    def _set_order(self, argsort, order):
+        self.layoutAboutToBeChanged.emit()
+        self._sort_order = argsort[::-1] if order == Qt.DescendingOrder else argsort
+        # Same rows in a new order, the row count does not change
+        self._order = self._get_visible_rows(self._sort_order)
         self.layoutChanged.emit()
         self.sortingFinished.emit()
 
     def flags(self, index):
         return Qt.ItemIsEnabled|Qt.ItemIsSelectable|Qt.ItemIsEditable
-
-class SearchProxyModel(QSortFilterProxyModel):
-
-    """proxy model to search for the files in one column"""
-
-    def setFilterRegExp(self, pattern):
-        if isinstance(pattern, str):
-            pattern = QtCore.QRegExp(
-                pattern, Qt.CaseInsensitive,
-                QtCore.QRegExp.FixedString)
-        super(SearchProxyModel, self).setFilterRegExp(pattern)
-
-    def _accept_index(self, idx):
-        if idx.isValid():
-            text = idx.data(Qt.DisplayRole)
-            if self.filterRegExp().indexIn(text) >= 0:
-                return True
-            for row in range(idx.model().rowCount(idx)):
-                if self._accept_index(idx.model().index(row, 0, idx)):
-                    return True
-        return False
-
-    def filterAcceptsRow(self, sourceRow, sourceParent):
-        idx = self.sourceModel().index(sourceRow, 0, sourceParent)
-        return self._accept_index(idx)
-
-class CustomProxyModel(QSortFilterProxyModel):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self._filters = dict()
-
-    @property
-    def filters(self):
-        return self._filters
-
-    def setFilter(self, expresion, column):
-        if expresion:
-            self.filters[column] = expresion
-        elif column in self.filters:
-            del self.filters[column]
-        self.invalidateFilter()
-
-    def filterAcceptsRow(self, source_row, source_parent):
-        for column, expresion in self.filters.items():
-            text = self.sourceModel().index(source_row, column, source_parent).data()
-            regex = QRegExp(
-                expresion, QtCore.Qt.CaseInsensitive, QRegExp.RegExp
-            )
-            if regex.indexIn(text) == -1:
-                return False
-        return True
\ No newline at end of file
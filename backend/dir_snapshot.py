@@ -0,0 +1,118 @@
+import os
+import gzip
+import json
+import hashlib
+from pathlib import Path
+from collections import namedtuple, Counter
+
+DEFAULT_SNAPSHOT_DIR = Path('folder_analysis_data') / 'snapshots'
+
+# The stat fields the scan pipeline reads, restored from a snapshot without touching the disk
+SnapshotStat = namedtuple('SnapshotStat', ['st_size', 'st_mtime_ns', 'st_ctime', 'st_dev', 'st_ino', 'st_nlink'])
+
+def realpath_roots(roots):
+    """Returns the canonical paths of 'roots', a single path or a list of paths."""
+    if isinstance(roots, (str, os.PathLike)):
+        roots = [roots]
+    return [os.path.realpath(root) for root in roots]
+
+def get_roots_name(roots):
+    """
+    Returns the name of the files saved for a scan of 'roots': the name of the first root and a
+    hash of all of them, so scans of different folders with the same name never collide.
+    """
+    roots = realpath_roots(roots)
+    digest = hashlib.sha1('\n'.join(roots).encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+    name = Path(roots[0]).name or 'root'
+    if len(roots) > 1:
+        name += f"+{len(roots) - 1}"
+    return f"{name}-{digest}"
+
+def to_snapshot_stat(stat_result):
+    return SnapshotStat(stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ctime,
+                        stat_result.st_dev, stat_result.st_ino, stat_result.st_nlink)
+
+class DirectorySnapshot():
+    """
+    Listing of every directory of a scanned tree: its mtime_ns, subdirectories, and the
+    path, stat and symlink flag of each file.
+
+    A directory whose mtime did not change since the snapshot was taken has the same
+    entries, so an incremental walk reuses its listing instead of calling scandir again.
+    Editing a file in place does not change the mtime of its directory, so the stored
+    file stats can be stale; the walker stats the files of a reused listing again.
+    """
+
+    def __init__(self, root, directories=None, filter_spec=None):
+        # A snapshot covers a single root or the whole set of roots of a multi-root scan
+        self.roots = realpath_roots(root)
+        # The listings only hold what the ScanFilter of the walk let through
+        self.filter_spec = filter_spec
+        # Directory path mapped to (mtime_ns, subdirectories, [(path, SnapshotStat, is_symlink), ...], pruned)
+        self.directories = directories if directories is not None else {}
+
+    @staticmethod
+    def get_snapshot_path(root, snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+        """Snapshots are named after a hash of the roots, see get_roots_name."""
+        return Path(snapshot_dir) / f"{get_roots_name(root)}.jsonl.gz"
+
+    @classmethod
+    def load(cls, root, snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+        """
+        Loads the snapshot of 'root' saved by a previous scan.
+
+        Returns:
+            DirectorySnapshot: The snapshot, or None if there is none or it cannot be read.
+        """
+        snapshot_path = cls.get_snapshot_path(root, snapshot_dir)
+        directories = {}
+        filter_spec = None
+        try:
+            with gzip.open(snapshot_path, 'rt', encoding='utf-8', errors='surrogateescape') as snapshot_file:
+                for line in snapshot_file:
+                    entry = json.loads(line)
+                    if isinstance(entry, dict):
+                        # Header line
+                        filter_spec = entry.get('filter_spec')
+                        continue
+                    directory, mtime_ns, subdirs, files, *pruned = entry
+                    directories[directory] = (mtime_ns, subdirs,
+                                              [(path, SnapshotStat(*stat_fields), is_symlink)
+                                               for path, is_symlink, *stat_fields in files],
+                                              Counter({(kind, reason): count
+                                                       for kind, reason, count in (pruned[0] if pruned else [])}))
+        except (OSError, ValueError, TypeError):
+            return None
+        return cls(root, directories, filter_spec)
+
+    def save(self, snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+        """Writes the snapshot atomically, one JSON line per directory."""
+        snapshot_path = self.get_snapshot_path(self.roots, snapshot_dir)
+        snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = snapshot_path.with_suffix('.tmp')
+
+        with gzip.open(temp_path, 'wt', encoding='utf-8', errors='surrogateescape', compresslevel=1) as snapshot_file:
+            snapshot_file.write(json.dumps({'filter_spec': self.filter_spec}) + '\n')
+            for directory, (mtime_ns, subdirs, files, pruned) in self.directories.items():
+                snapshot_file.write(json.dumps([directory, mtime_ns, subdirs,
+                                                [[path, is_symlink, *stat_fields]
+                                                 for path, stat_fields, is_symlink in files],
+                                                [[kind, reason, count] for (kind, reason), count in pruned.items()]]) + '\n')
+        os.replace(temp_path, snapshot_path)
+        return snapshot_path
+
+    def lookup(self, directory, mtime_ns):
+        """
+        Returns:
+            tuple: The stored (files, subdirectories, pruned counts) of 'directory' if its mtime is unchanged, else None.
+        """
+        entry = self.directories.get(directory)
+        if entry is None or entry[0] != mtime_ns:
+            return None
+        return entry[2], entry[1], entry[3]
+
+    def record(self, directory, mtime_ns, files, subdirs, pruned=None):
+        self.directories[directory] = (mtime_ns, subdirs,
+                                       [(path, to_snapshot_stat(file_stat), is_symlink)
+                                        for path, file_stat, is_symlink in files],
+                                       pruned if pruned is not None else Counter())
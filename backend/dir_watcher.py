@@ -0,0 +1,148 @@
+import os
+import sys
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# Constants from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Content changes are reported once the writer closes the file, not on every write
+WATCH_MASK = (IN_CLOSE_WRITE | IN_ATTRIB | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+def is_supported():
+    return sys.platform.startswith('linux')
+
+class InotifyWatcher():
+    """
+    Watches a directory tree with Linux inotify and reports which directories changed.
+
+    Every directory gets its own watch (inotify is not recursive); directories created
+    later are added as they appear. The changed directories are meant to be passed as
+    'dirty_dirs' to an incremental scan, which then re-lists only those directories.
+    """
+
+    def __init__(self):
+        if not is_supported():
+            raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+        self._directories = {}
+        self._watches = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_directory(self, directory):
+        watch = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if watch < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                raise OSError(error, "inotify watch limit reached, raise fs.inotify.max_user_watches")
+            # The directory vanished or is unreadable, the next scan will notice
+            return
+        self._directories[watch] = directory
+        self._watches[directory] = watch
+
+    def add_tree(self, root):
+        """Adds a watch for 'root' and every directory below it (symlinked directories are not followed)."""
+        root = os.path.realpath(root)
+        self.add_directory(root)
+        for dirpath, dirnames, filenames in os.walk(root):
+            for dirname in dirnames:
+                self.add_directory(os.path.join(dirpath, dirname))
+
+    def _read_events(self):
+        changed = set()
+        overflow = False
+
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+
+            offset = 0
+            while offset < len(data):
+                watch, mask, cookie, name_length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + name_length].rstrip(b'\0')
+                offset += name_length
+
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+
+                directory = self._directories.get(watch)
+                if directory is None:
+                    continue
+
+                if mask & IN_IGNORED:
+                    # The watched directory itself is gone
+                    del self._directories[watch]
+                    self._watches.pop(directory, None)
+                    changed.add(os.path.dirname(directory))
+                    continue
+
+                changed.add(directory)
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    new_directory = os.path.join(directory, os.fsdecode(name))
+                    self.add_tree(new_directory)
+                    changed.add(new_directory)
+
+        return changed, overflow
+
+    def wait_for_changes(self, timeout=None, settle=1.0):
+        """
+        Blocks until something changes, then collects events until the tree is quiet for 'settle' seconds.
+
+        Returns:
+            set: The changed directories, an empty set on timeout, or None if the kernel event
+                 queue overflowed and the whole tree must be rescanned.
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        changed = set()
+        overflow = False
+        while ready:
+            batch, batch_overflow = self._read_events()
+            changed |= batch
+            overflow |= batch_overflow
+            ready, _, _ = select.select([self._fd], [], [], settle)
+
+        return None if overflow else changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
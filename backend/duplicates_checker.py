@@ -1,39 +1,61 @@
 import os
-import hashlib
-from datetime import datetime
 import math
-from collections import defaultdict
+from collections import defaultdict, deque
 import platform
-from concurrent.futures import ThreadPoolExecutor
-
-def count_files(directory):
-    count = 0
-    with ThreadPoolExecutor() as executor:
-        for entry in os.scandir(directory):
-            if entry.is_file():
-                count += 1
-            elif entry.is_dir():
-                count += executor.submit(count_files, entry.path).result()
-    return count
-
-def get_hash(filename, first_chunk_only=False, hash_algorithm=hashlib.sha1):
-    # Create an instance of the specified hash algorithm
-    hash_obj = hash_algorithm()
-
-    # Open the file in binary mode
-    with open(filename, 'rb') as file_object:
+import time
+import queue
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from backend.file_walker import ParallelWalker, DEFAULT_WALK_WORKERS, normalize_roots, get_root_of
+from backend.hash_algorithms import get_hash_algorithm, DEFAULT_HASH_ALGORITHM
+from backend.hash_io import update_hash_from_open_file
+from backend.result_columns import ResultColumns
+from backend import instrumentation
+from backend.scan_control import WorkerKilledException
+from backend.scan_checkpoint import ScanCheckpoint, DEFAULT_CHECKPOINT_INTERVAL
+from backend.scan_filter import ScanFilter, DEFAULT_MIN_SIZE
+
+# hashlib releases the GIL while hashing large buffers, so threads scale with the disks
+DEFAULT_HASH_WORKERS = min(8, os.cpu_count() or 1)
+
+def get_hash(filename, first_chunk_only=False, hash_algorithm=DEFAULT_HASH_ALGORITHM, cache=None):
+    # Create an instance of the specified hash algorithm, given by registry name or constructor
+    if isinstance(hash_algorithm, str):
+        algorithm_name = hash_algorithm
+        hash_obj = get_hash_algorithm(hash_algorithm)()
+    else:
+        hash_obj = hash_algorithm()
+        algorithm_name = hash_obj.name
+
+    # Unbuffered, the full hash reads straight into its buffer
+    with open(filename, 'rb', buffering=0) as file_object:
+        # Stat'ed through the open descriptor, the cached digest describes this very file. A
+        # file changed after the stat gets another mtime, so its entry is never valid again
+        file_stat = os.fstat(file_object.fileno())
+        instrumentation.count(files_opened=1, stat_calls=1)
+
+        # Unchanged files are served from the persistent hash cache without being read
+        if cache is not None:
+            cached = cache.get(file_stat, algorithm_name, first_chunk_only)
+            if cached is not None:
+                return cached
+
         if first_chunk_only:
             # Read only the first 2048 bytes of the file
             data = file_object.read(2048)
             hash_obj.update(data)
+            instrumentation.count(bytes_read=len(data))
         else:
-            # Iterate over the file in small chunks using a helper function called chunk_reader
-            for chunk in chunk_reader(file_object):
-                hash_obj.update(chunk)
+            # Hash the whole file through a reused buffer, without per-chunk copies
+            update_hash_from_open_file(hash_obj, file_object, file_stat)
 
     # Calculate the digest (hash) of the file
     hashed = hash_obj.digest()
 
+    if cache is not None:
+        cache.put(file_stat, algorithm_name, hashed, first_chunk_only)
+
     return hashed
 
 def chunk_reader(file, chunk_size=51200):
@@ -47,6 +69,131 @@ def chunk_reader(file, chunk_size=51200):
             break
         yield chunk
 
+def map_in_order(function, items, workers=DEFAULT_HASH_WORKERS):
+    """
+    Applies 'function' to every item on a thread pool and yields the results in input order.
+
+    Only a bounded number of items is in flight at once, so memory stays flat for
+    millions of candidates and the output order is deterministic regardless of
+    which worker finishes first.
+
+    Args:
+        function (callable): Function called with a single item.
+        items (iterable): Items to process.
+        workers (int): Number of threads. 1 runs on the calling thread.
+
+    Yields:
+        tuple: (item, result)
+    """
+    if workers <= 1:
+        for item in items:
+            yield item, function(item)
+        return
+
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for item in items:
+            in_flight.append((item, executor.submit(function, item)))
+            if len(in_flight) >= workers * 4:
+                done_item, future = in_flight.popleft()
+                yield done_item, future.result()
+
+        while in_flight:
+            done_item, future = in_flight.popleft()
+            yield done_item, future.result()
+
+def _hash_or_none(filename, first_chunk_only, hash_algorithm, cache):
+    try:
+        return get_hash(filename, first_chunk_only=first_chunk_only, hash_algorithm=hash_algorithm, cache=cache)
+    except OSError:
+        # The file access might have changed until this point
+        return None
+
+def hash_files(filenames, first_chunk_only=False, workers=DEFAULT_HASH_WORKERS, cache=None,
+               hash_algorithm=DEFAULT_HASH_ALGORITHM):
+    """
+    Hashes files on a thread pool and yields the results in input order.
+
+    Args:
+        filenames (iterable): Paths of the files to hash.
+        first_chunk_only (bool): Hash only the first chunk of every file.
+        workers (int): Number of hashing threads. 1 hashes on the calling thread.
+        cache (HashCache, optional): Persistent hash cache consulted before reading a file.
+        hash_algorithm (str): Name of the registered hash algorithm.
+
+    Yields:
+        tuple: (filename, digest) where digest is None if the file could not be read.
+    """
+    return map_in_order(partial(_hash_or_none, first_chunk_only=first_chunk_only, hash_algorithm=hash_algorithm, cache=cache),
+                        filenames, workers)
+
+def _tail_offsets(file_size, block_size):
+    return [max(0, file_size - block_size)]
+
+def _middle_offsets(file_size, block_size):
+    return [int(file_size * fraction) for fraction in (0.25, 0.5, 0.75)]
+
+# Cheap sampling stages run between the first-chunk hash and the full hash, in order.
+# Each stage maps a file size to the offsets of the blocks it hashes.
+SAMPLE_STAGES = {
+    'tail': _tail_offsets,
+    'middle': _middle_offsets,
+}
+DEFAULT_SAMPLE_STAGES = ('tail', 'middle')
+SAMPLE_BLOCK_SIZE = 16 * 1024
+
+def _hash_blocks(file_object, offsets, block_size, hash_algorithm):
+    hash_obj = get_hash_algorithm(hash_algorithm)()
+    bytes_read = 0
+    for offset in offsets:
+        file_object.seek(offset)
+        block = file_object.read(block_size)
+        bytes_read += len(block)
+        hash_obj.update(block)
+    instrumentation.count(bytes_read=bytes_read)
+    return hash_obj.digest()
+
+def get_sample_hash(filename, offsets, block_size=SAMPLE_BLOCK_SIZE, hash_algorithm=DEFAULT_HASH_ALGORITHM):
+    """
+    Hashes the blocks of 'block_size' bytes found at each of the given offsets.
+    """
+    with open(filename, 'rb') as file_object:
+        instrumentation.count(files_opened=1)
+        return _hash_blocks(file_object, offsets, block_size, hash_algorithm)
+
+def get_stage_sample_hash(filename, stage, block_size=SAMPLE_BLOCK_SIZE, hash_algorithm=DEFAULT_HASH_ALGORITHM,
+                          cache=None):
+    """
+    Hashes the blocks selected by the sampling 'stage' of a file, consulting the hash cache first.
+
+    The file is stat'ed through the open descriptor, so a stale stat from the walk (or from a
+    stored directory snapshot) can never validate a cached entry.
+    """
+    with open(filename, 'rb') as file_object:
+        file_stat = os.fstat(file_object.fileno())
+        instrumentation.count(files_opened=1, stat_calls=1)
+
+        sample = f"{stage}:{block_size}"
+        if cache is not None:
+            cached = cache.get_sample(file_stat, hash_algorithm, sample)
+            if cached is not None:
+                return cached
+
+        offsets = SAMPLE_STAGES[stage](file_stat.st_size, block_size)
+        hashed = _hash_blocks(file_object, offsets, block_size, hash_algorithm)
+
+    if cache is not None:
+        cache.put_sample(file_stat, hash_algorithm, sample, hashed)
+
+    return hashed
+
+def _sample_or_none(item, stage, block_size, hash_algorithm, cache):
+    filename, _ = item
+    try:
+        return get_stage_sample_hash(filename, stage, block_size, hash_algorithm, cache)
+    except OSError:
+        return None
+
 def convert_size(size_bytes):
     """function to convert bytes to readable format"""
     if size_bytes == 0:
@@ -70,67 +217,64 @@ def creation_date(path_to_file):
             # so we'll settle for when its content was last modified.
             return stat.st_mtime
 
-def get_files_by_size(path, progress_callback):
+@instrumentation.instrumented('walk')
+def get_files_by_size(path, progress_callback, workers=DEFAULT_WALK_WORKERS, scan_filter=None):
     """
     Recursively scans the directories specified in 'path' and returns a dictionary that groups files by their size.
 
+    The tree is traversed once with a parallel os.scandir walker; the total reported to
+    'progress_callback' is an estimate that converges to the real count as the walk proceeds.
+
     Args:
-        path (str):Directory path to scan.
+        path (str):Directory path to scan, or a list of directories scanned together.
+        workers (int): Number of threads listing directories.
+        scan_filter (ScanFilter, optional): Filter applied during the walk, by default only files
+            smaller than 1024 bytes are skipped.
+
+    Every physical file is listed once: hardlinks and symlinked paths to the same
+    (st_dev, st_ino) are collapsed into one primary path with aliases.
 
     Returns:
         dict: Dictionary containing file paths grouped by their respective sizes.
         int: Total files count
+        int: Total files count, equal to the scanned count once the walk is complete
+        dict: Primary paths mapped to the other paths of the same physical file.
     """
 
     # Initialize counters and data structures
     file_count = 0
     files_by_size = defaultdict(list)
 
-    total_files = count_files(path)
+    walker = ParallelWalker(path, workers=workers, scan_filter=scan_filter or ScanFilter())
 
-    # Walk through the directory tree rooted at 'path'
-    for dirpath, dirnames, filenames in os.walk(path):
-        # Iterate over each filename in the current directory
-        for filename in filenames:
+    for batch in walker.walk_batches():
+        for file_path, file_stat in batch:
+            # Files outside the size range were already pruned by the walker
             file_count += 1
 
-            # Generate the full path to the current file
-            file_path = os.path.join(dirpath, filename)
-
-            try:
-                # Get the real (canonical) path of the file
-                real_file_path = os.path.realpath(file_path)
-
-                # Get the size of the file in bytes
-                file_size = os.path.getsize(real_file_path)
-
-                # Ignore files smaller than 1024 bytes
-                if file_size < 1024:
-                    continue
+            # Append the file path to the list associated with the file size
+            files_by_size[file_stat.st_size].append(file_path)
 
-                # Add the file path to the dictionary using the file size as the key
-                if file_size not in files_by_size:
-                    # Initialize an empty list for the file size if it doesn't exist
-                    files_by_size[file_size] = []
+        # Call the progress callback once per directory to update the progress
+        progress_callback(file_count, max(file_count, walker.estimated_total()))
 
-                # Append the file path to the list associated with the file size
-                files_by_size[file_size].append(real_file_path)
-                # Call the progress callback to update the progress
-                progress_callback(file_count, total_files)
+    # Directories finish in any order, sort the buckets to keep the results deterministic
+    for files in files_by_size.values():
+        files.sort()
 
-            except OSError:
-                # If the file is not accessible due to permissions or other reasons,
-                # continue to the next file
-                continue
-            
-    return files_by_size, file_count, total_files
+    return files_by_size, file_count, file_count, walker.aliases
 
-def get_duplicate_files_hashes_and_count(files_by_size, progress_callback):
+@instrumentation.instrumented('prefix')
+def get_duplicate_files_hashes_and_count(files_by_size, progress_callback, cache=None, workers=DEFAULT_HASH_WORKERS,
+                                         hash_algorithm=DEFAULT_HASH_ALGORITHM):
     """
     This function calculates the count of duplicate files based on their sizes.
 
     Args:
         files_by_size (dict): A dictionary containing file sizes as keys and a list of corresponding file names as values.
+        cache (HashCache, optional): Persistent hash cache consulted before reading a file.
+        workers (int): Number of threads hashing the first chunks.
+        hash_algorithm (str): Name of the registered hash algorithm used for the first chunks.
 
     Returns:
         Dict: Dictionary to store file hashes and associated filenames
@@ -145,90 +289,625 @@ def get_duplicate_files_hashes_and_count(files_by_size, progress_callback):
     hashes_on_1k = defaultdict(list)  # Dictionary to store file hashes and associated filenames
     hashes_on_1k_num = 0  # Count of duplicate file hashes
 
-    for size, files in files_by_size.items():
+    # Skip file sizes that have less than 2 files since they are unique
+    candidates = (filename for size, files in files_by_size.items() if len(files) >= 2 for filename in files)
+
+    for filename, small_hash in hash_files(candidates, first_chunk_only=True, workers=workers, cache=cache,
+                                             hash_algorithm=hash_algorithm):
+        if small_hash is None:
+            # Ignore file access errors and continue to the next file
+            continue
+
+        # Add the filename to the list of filenames associated with the existing hash
+        hashes_on_1k[small_hash].append(filename)
+
+        # Increment the count of unique file hashes
+        hashes_on_1k_num += 1
+
+        progress_callback(hashes_on_1k_num, qualifying_file_count)
+
+    return hashes_on_1k, hashes_on_1k_num
+
+@instrumentation.instrumented('samples')
+def refine_by_samples(hashes_on_1k, progress_callback, stages=DEFAULT_SAMPLE_STAGES, cache=None,
+                      workers=DEFAULT_HASH_WORKERS, hash_algorithm=DEFAULT_HASH_ALGORITHM,
+                      block_size=SAMPLE_BLOCK_SIZE):
+    """
+    Splits the first-chunk groups further by hashing a few sampled blocks of every file
+    (the last block, then fixed offsets in the middle) before the expensive full hash.
+
+    Files are regrouped by (size, sample hash) after each stage and files left alone in
+    their group are dropped. Groups whose members all have a cached full hash are passed
+    through untouched, so unchanged files are still not read again.
+
+    Args:
+        hashes_on_1k (dict): A dictionary containing file hashes as keys and a list of corresponding filenames as values.
+        stages (iterable): Names of the SAMPLE_STAGES to run, in order.
+        cache (HashCache, optional): Persistent hash cache consulted for full and sample hashes.
+        workers (int): Number of threads reading samples.
+        hash_algorithm (str): Name of the registered hash algorithm for the samples.
+        block_size (int): Size of every sampled block.
+
+    Returns:
+        dict: The first-chunk hashes mapped to the files that are still duplicate candidates.
+        list: Per-stage statistics as dictionaries with 'stage', 'files_in', 'files_out' and 'eliminated'.
+    """
+    stage_stats = []
+
+    # Every group is keyed by (hash on 1k, size, sample hashes...) while stages run
+    groups = {}
+    for hash_1k, files in hashes_on_1k.items():
         if len(files) < 2:
-            # Skip file sizes that have less than 2 files since they are unique
             continue
 
+        sized_files = []
         for filename in files:
             try:
-                small_hash = get_hash(filename, first_chunk_only=True)  # Calculate the hash of the first chunk of the file
+                file_stat = os.stat(filename)
+                instrumentation.count(stat_calls=1)
+            except OSError:
+                continue
+            sized_files.append((filename, file_stat))
+
+        already_hashed = cache is not None and all(cache.has_full_hash(file_stat, hash_algorithm)
+                                                   for _, file_stat in sized_files)
+
+        for filename, file_stat in sized_files:
+            # Files no larger than the first chunk were already hashed completely
+            if already_hashed or file_stat.st_size <= 2048:
+                key = (hash_1k, None)
+            else:
+                key = (hash_1k, file_stat.st_size)
+            groups.setdefault(key, []).append((filename, file_stat))
+
+    for stage in stages:
+        files_in = sum(len(members) for members in groups.values())
+        candidates = [member for key, members in groups.items() if key[1] is not None for member in members]
+
+        sample_hashes = {}
+        for progress, (member, sample_hash) in enumerate(
+                map_in_order(partial(_sample_or_none, stage=stage, block_size=block_size,
+                                     hash_algorithm=hash_algorithm, cache=cache), candidates, workers), start=1):
+            sample_hashes[member[0]] = sample_hash
+            progress_callback(progress, len(candidates))
+
+        next_groups = {}
+        for key, members in groups.items():
+            for member in members:
+                if key[1] is None:
+                    next_key = key
+                elif sample_hashes[member[0]] is None:
+                    # The file vanished or became unreadable
+                    continue
+                else:
+                    next_key = key + (sample_hashes[member[0]],)
+                next_groups.setdefault(next_key, []).append(member)
 
-                # Add the filename to the list of filenames associated with the existing hash                
-                hashes_on_1k[small_hash].append(filename)
+        # Drop files that no longer share their group with anything
+        groups = {key: members for key, members in next_groups.items() if len(members) >= 2}
 
-                # Increment the count of unique file hashes
-                hashes_on_1k_num += 1
+        files_out = sum(len(members) for members in groups.values())
+        stage_stats.append({'stage': stage, 'files_in': files_in, 'files_out': files_out,
+                            'eliminated': files_in - files_out})
 
-                progress_callback(hashes_on_1k_num, qualifying_file_count)
+    refined = defaultdict(list)
+    for key, members in groups.items():
+        refined[key[0]].extend(filename for filename, _ in members)
 
-            except OSError:
-                # Ignore file access errors and continue to the next file
-                continue
+    return refined, stage_stats
 
-    return hashes_on_1k, hashes_on_1k_num
+def format_stage_stats(stage_stats):
+    """Formats the statistics returned by refine_by_samples into a single line."""
+    return ', '.join(f"{stats['stage']}: {stats['eliminated']} of {stats['files_in']} eliminated" for stats in stage_stats)
 
-def find_duplicate_files(hashes_on_1k, progress_callback):
+@instrumentation.instrumented('full')
+def find_duplicate_files(hashes_on_1k, progress_callback, cache=None, workers=DEFAULT_HASH_WORKERS,
+                         hash_algorithm=DEFAULT_HASH_ALGORITHM, confirm_algorithm=None,
+                         hash_1k_algorithm=None, aliases=None, roots=None):
     """
     Finds duplicate files based on hash values. For all files with the hash on the 1st 1024 bytes, get their hash on the full file - collisions will be duplicates
 
+    In tiered mode ('confirm_algorithm' set) every candidate is hashed with the cheap 'hash_algorithm'
+    first, and only the files whose fast hash collides are re-hashed with the strong 'confirm_algorithm'.
+    The algorithm that produced each hash is recorded in the 'Hash Algorithm' column.
+
     Args:
         hashes_on_1k (dict): A dictionary containing file hashes as keys and a list of corresponding filenames as values.
+        cache (HashCache, optional): Persistent hash cache consulted before reading a file.
+        workers (int): Number of threads hashing full files.
+        hash_algorithm (str): Name of the registered hash algorithm for the full files.
+        confirm_algorithm (str, optional): Name of the strong hash algorithm confirming fast hash collisions.
+        hash_1k_algorithm (str, optional): Name of the algorithm that produced 'hashes_on_1k', defaults to 'hash_algorithm'.
+        aliases (dict, optional): Primary paths mapped to the other paths of the same physical file.
+        roots (list, optional): Normalized scan roots, used to fill the 'Root' column.
 
     Returns:
-        tuple: A tuple containing the data of the duplicate file and a dictionary containing unique file hashes 
-               as keys and a list of corresponding filenames as values.
+        ResultColumns: The data of the duplicate files.
     """
     duplicate_files_count = 0  # Counter for duplicate file occurrences
-    
-    total_files = sum([len(files) for hashes, files in hashes_on_1k.items() if len(files) >= 2])
-    unique_file_hashes = defaultdict(list)  # Dictionary to store unique file hashes and their corresponding filenames
-    total_file_size = 0  # Total size of all duplicate files
-    duplicate_files_list = []
 
-    try:
-        for hash_1k, files in hashes_on_1k.items():
-            if len(files) < 2:
-                continue  # Skip files that don't have duplicates
-
-            for filename in files:
-                try:
-                    full_hash = get_hash(filename, first_chunk_only=False)  # Calculate the file's hash
-                except OSError:
-                    # The file access might have changed until this point, so continue to the next file
-                    continue
+    # Remember the 1k hash of every candidate, skipping files that don't have duplicates
+    hash_1k_by_file = {filename: hash_1k for hash_1k, files in hashes_on_1k.items() if len(files) >= 2 for filename in files}
 
-                duplicate_files_count += 1
-                size = os.path.getsize(filename)
-                filesize = convert_size(size)
-                creation = datetime.fromtimestamp(os.path.getctime(filename))
-                modification = datetime.fromtimestamp(os.path.getctime(filename))
-
-                # Store data of the duplicate file
-                data = {
-                    'Hash': full_hash,
-                    'FilePath': filename,
-                    'Size': filesize,
-                    'Size In Bytes': size,
-                    'Hash on 1k': hash_1k,
-                    'Modified Date': modification,
-                    'Creation Date': creation
-                }
-
-                unique_file_hashes[str(full_hash)].append(filename)
-                total_file_size += size
-                duplicate_files_list.append(data)
-
-                progress_callback(duplicate_files_count, total_files)
+    total_files = len(hash_1k_by_file)
+    duplicate_files = ResultColumns()
 
-    except OSError:
-        print("An error occurred while accessing files. Please try again.")
+    full_hash_by_file = {}
+    for filename, full_hash in hash_files(hash_1k_by_file, first_chunk_only=False, workers=workers, cache=cache,
+                                          hash_algorithm=hash_algorithm):
+        if full_hash is None:
+            # The file access might have changed until this point, so continue to the next file
+            continue
 
-    return duplicate_files_list, unique_file_hashes  # Return the duplicate file data and unique file hashes
+        full_hash_by_file[filename] = (full_hash, hash_algorithm)
+        duplicate_files_count += 1
+        progress_callback(duplicate_files_count, total_files)
+
+    if confirm_algorithm:
+        # Only files sharing a fast hash can be duplicates, confirm those with the strong hash
+        fast_hash_counts = defaultdict(int)
+        for full_hash, _ in full_hash_by_file.values():
+            fast_hash_counts[full_hash] += 1
+        to_confirm = [filename for filename, (full_hash, _) in full_hash_by_file.items() if fast_hash_counts[full_hash] >= 2]
+
+        total_files += len(to_confirm)
+        for filename, strong_hash in hash_files(to_confirm, first_chunk_only=False, workers=workers, cache=cache,
+                                                hash_algorithm=confirm_algorithm):
+            duplicate_files_count += 1
+            if strong_hash is None:
+                del full_hash_by_file[filename]
+            else:
+                full_hash_by_file[filename] = (strong_hash, confirm_algorithm)
+            progress_callback(duplicate_files_count, total_files)
+
+    for filename, (full_hash, algorithm) in full_hash_by_file.items():
+        try:
+            file_stat = os.stat(filename)
+        except OSError:
+            # The file access might have changed until this point, so continue to the next file
+            continue
+        instrumentation.count(stat_calls=1)
 
-def search_duplicate_files(path):
+        # Store data of the duplicate file
+        duplicate_files.append(filename, file_stat, full_hash, algorithm, hash_1k_by_file[filename],
+                               hash_1k_algorithm or hash_algorithm,
+                               aliases.get(filename, []) if aliases else [],
+                               (get_root_of(filename, roots) or '') if roots else '')
 
-    files_by_size, file_count = get_files_by_size(path)
-    hashes_on_1k, hashes_on_1k_num = get_duplicate_files_hashes_and_count(files_by_size)
-    duplicate_files, unique_file_hashes = find_duplicate_files(hashes_on_1k)
-    return duplicate_files
\ No newline at end of file
+    return duplicate_files
+
+class DuplicatePipeline():
+    """
+    Streaming scan where walking, first-chunk hashing, sampling and full hashing overlap.
+
+    The walk runs on its own thread and feeds size buckets. As soon as a bucket has a
+    second member both files are queued for the first-chunk hash, and every stage works
+    the same way: a file moves on to the next stage once its group in the current stage
+    (keyed by size and all digests so far) holds at least two files. The last stage
+    groups by (size, full hash) and reports duplicates the moment they are confirmed.
+
+    Stages, in order: 'prefix', the sampling stages, 'full' and, in tiered mode, 'confirm'.
+    Groups of stage N are kept at level N + 1; level 0 holds the size buckets.
+
+    'path' is a directory or a list of directories. All roots are walked concurrently and
+    compared with each other, and every row is tagged with the root its file was found in.
+    'scan_filter' prunes directories and files during the walk; without one only files
+    below 'min_size' are skipped.
+
+    The progress callbacks are called with (done, total, bytes_done, bytes_total) after
+    every step of the scan loop; wrap them in a backend.progress.ProgressAggregator to
+    limit the update rate. The walk totals are estimates that converge as it proceeds.
+
+    'snapshot', 'record_snapshot' and 'dirty_dirs' are handed to the ParallelWalker for
+    incremental rescans; unchanged files are then neither listed nor, thanks to the hash
+    cache, read again.
+
+    A ScanControl given as 'control' pauses or cancels the walk and the hashing, a
+    cancelled scan raises WorkerKilledException out of run(). With a 'checkpoint_dir'
+    the state of the scan is saved every 'checkpoint_interval' seconds and when it is
+    cancelled or interrupted; with 'resume' a new pipeline picks up from that checkpoint.
+    The checkpoint is deleted once a scan completes.
+    """
+
+    def __init__(self, path, cache=None, workers=DEFAULT_HASH_WORKERS, walk_workers=DEFAULT_WALK_WORKERS,
+                 hash_algorithm=DEFAULT_HASH_ALGORITHM, confirm_algorithm=None, sample_stages=DEFAULT_SAMPLE_STAGES,
+                 block_size=SAMPLE_BLOCK_SIZE, min_size=DEFAULT_MIN_SIZE, walk_progress=None, partial_progress=None,
+                 full_progress=None, snapshot=None, record_snapshot=False, dirty_dirs=None, control=None,
+                 checkpoint_dir=None, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, resume=False, scan_filter=None):
+        self.path = path
+        self.cache = cache
+        self.workers = workers
+        self.hash_algorithm = hash_algorithm
+        self.confirm_algorithm = confirm_algorithm
+        self.block_size = block_size
+        self.scan_filter = scan_filter or ScanFilter(min_size=min_size)
+        self.min_size = self.scan_filter.min_size
+
+        self.walker = ParallelWalker(path, workers=walk_workers, snapshot=snapshot, record_snapshot=record_snapshot,
+                                     dirty_dirs=dirty_dirs, control=control, scan_filter=self.scan_filter)
+        self.roots = self.walker.roots
+        self.file_count = 0
+        self.bytes_seen = 0
+        self.walk_seconds = 0
+        self.walk_done = False
+
+        self.control = control
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_interval = checkpoint_interval
+
+        self.walk_progress = walk_progress
+        self.partial_progress = partial_progress
+        self.full_progress = full_progress
+
+        self.stages = ['prefix', *sample_stages, 'full']
+        if confirm_algorithm:
+            self.stages.append('confirm')
+        self.final_level = len(self.stages)
+        self.full_level = self.stages.index('full') + 1
+
+        self.groups = [dict() for _ in range(self.final_level + 1)]
+        self.digests = [dict() for _ in range(self.final_level + 1)]
+        self.stage_stats = {stage: {'files': 0, 'bytes': 0, 'advanced': 0} for stage in self.stages}
+
+        self._backlog = deque()
+        self._in_flight = {}
+        self._submitted = [0] * (self.final_level + 1)
+        self._completed = [0] * (self.final_level + 1)
+        self._submitted_bytes = [0] * (self.final_level + 1)
+        self._completed_bytes = [0] * (self.final_level + 1)
+
+        # What changed since the last checkpoint, only that is appended to it
+        self._checkpoint_saved = False
+        self._unsaved_files = []
+        self._unsaved_digests = {stage: {} for stage in self.stages}
+        self._aliases_saved = False
+
+        self.resumed = None
+        if resume and checkpoint_dir is not None:
+            self.resumed = ScanCheckpoint.load(self.roots, self._checkpoint_settings(sample_stages), checkpoint_dir)
+
+    def _checkpoint_settings(self, sample_stages):
+        """The settings a checkpoint must have been written with to be resumed by this pipeline."""
+        def algorithm_name(algorithm):
+            return algorithm if isinstance(algorithm, str) or algorithm is None else algorithm.__name__
+
+        return {'hash_algorithm': algorithm_name(self.hash_algorithm),
+                'confirm_algorithm': algorithm_name(self.confirm_algorithm),
+                'sample_stages': list(sample_stages), 'block_size': self.block_size,
+                'scan_filter': self.scan_filter.to_spec()}
+
+    def _resumed_digest(self, stage, filename):
+        """Returns the digest of the checkpoint being resumed if the file did not change since."""
+        try:
+            instrumentation.count(stat_calls=1)
+            return self.resumed.lookup(stage, filename, os.stat(filename))
+        except OSError:
+            return None
+
+    def _hash_member(self, level, member):
+        """Computes the digest of a (filename, stat) member for the stage of 'level'."""
+        filename, file_stat = member
+        stage = self.stages[level - 1]
+
+        with instrumentation.measure(stage):
+            if self.control is not None:
+                self.control.check()
+
+            if self.resumed is not None:
+                digest = self._resumed_digest(stage, filename)
+                if digest is not None:
+                    return digest
+
+            if stage == 'prefix':
+                return _hash_or_none(filename, True, self.hash_algorithm, self.cache)
+            if stage == 'full':
+                return _hash_or_none(filename, False, self.hash_algorithm, self.cache)
+            if stage == 'confirm':
+                return _hash_or_none(filename, False, self.confirm_algorithm, self.cache)
+
+            # Files no larger than the first chunk were already hashed completely
+            if file_stat.st_size <= 2048:
+                return b''
+            return _sample_or_none(member, stage, self.block_size, self.hash_algorithm, self.cache)
+
+    def _bytes_read(self, stage, file_stat):
+        if stage == 'prefix':
+            return min(file_stat.st_size, 2048)
+        if stage in SAMPLE_STAGES:
+            if file_stat.st_size <= 2048:
+                return 0
+            return min(file_stat.st_size, len(SAMPLE_STAGES[stage](file_stat.st_size, self.block_size)) * self.block_size)
+        return file_stat.st_size
+
+    def _walk_into(self, batches):
+        try:
+            if self.resumed is not None and self.resumed.walk_done:
+                # The checkpointed size buckets replace the walk
+                self.walker.aliases.update(self.resumed.aliases)
+                batches.put(self.resumed.files)
+            else:
+                for batch in self.walker.walk_batches():
+                    batches.put(batch)
+        except BaseException as error:
+            batches.put(error)
+        batches.put(None)
+
+    def _submit_backlog(self, executor):
+        while self._backlog and len(self._in_flight) < self.workers * 4:
+            level, member, key = self._backlog.popleft()
+            future = executor.submit(self._hash_member, level, member)
+            self._in_flight[future] = (level, member, key)
+
+    def _advance(self, level, member, key):
+        """Queues a member of a group at 'level' for the next stage."""
+        if level > 0:
+            self.stage_stats[self.stages[level - 1]]['advanced'] += 1
+        self._backlog.append((level + 1, member, key))
+        self._submitted[level + 1] += 1
+        self._submitted_bytes[level + 1] += self._bytes_read(self.stages[level], member[1])
+
+    def _group_update(self, key, group):
+        stage = self.stages[self.final_level - 1]
+        algorithm = self.confirm_algorithm if stage == 'confirm' else self.hash_algorithm
+        return key[1], algorithm, key[0], [filename for filename, _ in group]
+
+    def _add(self, level, key, member):
+        """Adds a member to a group, then yields a duplicate update or schedules the next stage."""
+        group = self.groups[level].setdefault(key, [])
+        group.append(member)
+
+        if level == self.final_level:
+            if len(group) >= 2:
+                yield self._group_update(key, group)
+        elif len(group) == 2:
+            for pending_member in group:
+                self._advance(level, pending_member, key)
+        elif len(group) > 2:
+            self._advance(level, member, key)
+
+    def _complete(self, future):
+        level, member, key = self._in_flight.pop(future)
+        digest = future.result()
+
+        stage = self.stages[level - 1]
+        bytes_read = self._bytes_read(stage, member[1])
+        self._completed[level] += 1
+        self._completed_bytes[level] += bytes_read
+        self.stage_stats[stage]['files'] += 1
+        if digest is None:
+            # The file vanished or became unreadable
+            return
+
+        self.stage_stats[stage]['bytes'] += bytes_read
+        self.digests[level][member[0]] = digest
+        if self.checkpoint_dir is not None:
+            self._unsaved_digests[stage][member[0]] = (member[1].st_size, member[1].st_mtime_ns, digest)
+
+        if level >= self.full_level:
+            # Only the content matters from here on, the earlier digests are implied
+            next_key = (member[1].st_size, digest)
+        else:
+            next_key = key + (digest,)
+        yield from self._add(level, next_key, member)
+
+    def get_checkpoint(self):
+        """
+        Returns:
+            ScanCheckpoint: The current state of the scan.
+        """
+        members = {}
+        for group in self.groups[0].values():
+            members.update(group)
+
+        digests = {}
+        for level, stage in enumerate(self.stages, start=1):
+            digests[stage] = {filename: (members[filename].st_size, members[filename].st_mtime_ns, digest)
+                              for filename, digest in self.digests[level].items()}
+
+        return ScanCheckpoint(self.roots, self._checkpoint_settings(self.stages[1:self.full_level - 1]), self.walk_done,
+                              self.file_count, list(members.items()), self.walker.aliases if self.walk_done else {},
+                              digests)
+
+    def save_checkpoint(self):
+        """
+        Saves the files walked and the digests computed since the previous save. The first
+        save of a scan replaces the checkpoint it resumed from, the next ones append to it.
+        """
+        if self.checkpoint_dir is None:
+            return
+        # The aliases are only complete, and only saved once, when the walk is done
+        save_aliases = self.walk_done and not self._aliases_saved
+        ScanCheckpoint(self.roots, self._checkpoint_settings(self.stages[1:self.full_level - 1]), self.walk_done,
+                       self.file_count, self._unsaved_files, self.walker.aliases if save_aliases else {},
+                       self._unsaved_digests).save(self.checkpoint_dir, append=self._checkpoint_saved)
+
+        self._checkpoint_saved = True
+        self._aliases_saved = self._aliases_saved or save_aliases
+        self._unsaved_files = []
+        self._unsaved_digests = {stage: {} for stage in self.stages}
+
+    def _report_levels(self, progress_callback, levels):
+        progress_callback(sum(self._completed[level] for level in levels),
+                          max(1, sum(self._submitted[level] for level in levels)),
+                          sum(self._completed_bytes[level] for level in levels),
+                          sum(self._submitted_bytes[level] for level in levels))
+
+    def _report_progress(self):
+        if self.walk_progress is not None:
+            if self.walk_done:
+                estimated_total = self.file_count
+            else:
+                # Links are counted once per path by the walker, the final count can be lower
+                estimated_total = max(self.file_count, self.walker.estimated_total())
+            # The size of the files not listed yet is estimated from the average size so far
+            average_size = self.bytes_seen / self.file_count if self.file_count else 0
+            self.walk_progress(self.file_count, estimated_total, self.bytes_seen,
+                               self.bytes_seen + int((estimated_total - self.file_count) * average_size))
+
+        if self.partial_progress is not None:
+            self._report_levels(self.partial_progress, range(1, self.full_level))
+
+        if self.full_progress is not None:
+            self._report_levels(self.full_progress, range(self.full_level, self.final_level + 1))
+
+    def run(self):
+        """
+        Runs the scan.
+
+        Yields:
+            tuple: (digest, algorithm, size, filenames) every time a duplicate group is confirmed
+                   or gains a member. The last update for a digest holds the complete group.
+        """
+        with instrumentation.stage('pipeline'):
+            yield from self._run()
+
+    def _run(self):
+        start_time = time.perf_counter()
+        last_checkpoint = start_time
+        batches = queue.Queue()
+        walk_thread = threading.Thread(target=self._walk_into, args=(batches,), daemon=True)
+        walk_thread.start()
+
+        if self.resumed is not None and self.resumed.walk_done:
+            # Only the files of the size buckets are replayed, the smaller ones were counted before
+            self.file_count = self.resumed.file_count - len(self.resumed.files)
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while not self.walk_done or self._backlog or self._in_flight:
+                if self.control is not None:
+                    # Blocks while paused
+                    self.control.check()
+
+                # Block on the walk only when there is no hashing to do
+                block = not (self._backlog or self._in_flight)
+                while not self.walk_done:
+                    try:
+                        batch = batches.get(block=block)
+                    except queue.Empty:
+                        break
+                    block = False
+
+                    if batch is None:
+                        self.walk_done = True
+                        self.walk_seconds = time.perf_counter() - start_time
+                        break
+                    if isinstance(batch, BaseException):
+                        raise batch
+
+                    if self.checkpoint_dir is not None:
+                        self._unsaved_files.extend(batch)
+                    for file_path, file_stat in batch:
+                        self.file_count += 1
+                        self.bytes_seen += file_stat.st_size
+                        yield from self._add(0, (file_stat.st_size,), (file_path, file_stat))
+
+                self._submit_backlog(executor)
+                if self._in_flight:
+                    done, _ = wait(self._in_flight, timeout=None if self.walk_done else 0.05, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from self._complete(future)
+
+                self._report_progress()
+
+                if self.checkpoint_dir is not None and time.perf_counter() - last_checkpoint >= self.checkpoint_interval:
+                    self.save_checkpoint()
+                    last_checkpoint = time.perf_counter()
+        except (WorkerKilledException, KeyboardInterrupt):
+            self.save_checkpoint()
+            raise
+        finally:
+            # Queued hashes of a cancelled scan are dropped, running ones finish
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        walk_thread.join()
+        self._report_progress()
+        if self.checkpoint_dir is not None:
+            ScanCheckpoint.remove(self.roots, self.checkpoint_dir)
+
+    def get_duplicate_groups(self):
+        """
+        Returns:
+            list: (digest, algorithm, size, sorted filenames) for every final duplicate group.
+        """
+        groups = []
+        for key, group in self.groups[self.final_level].items():
+            if len(group) >= 2:
+                digest, algorithm, size, files = self._group_update(key, group)
+                groups.append((digest, algorithm, size, sorted(files)))
+        return sorted(groups)
+
+    def get_stage_stats(self):
+        """
+        Returns:
+            list: Per-stage dictionaries with 'stage', 'files_in', 'files_out', 'eliminated' and 'bytes'.
+        """
+        stage_stats = []
+        for stage in self.stages:
+            stats = self.stage_stats[stage]
+            files_out = stats['advanced']
+            if stage == self.stages[-1]:
+                # Nothing follows the last stage, its survivors are the confirmed duplicates
+                files_out = sum(len(group) for group in self.groups[self.final_level].values() if len(group) >= 2)
+            stage_stats.append({'stage': stage, 'files_in': stats['files'], 'files_out': files_out,
+                                'eliminated': stats['files'] - files_out, 'bytes': stats['bytes']})
+        return stage_stats
+
+    def get_root(self, filename):
+        """
+        Returns the scanned root 'filename' belongs to. A symlinked file resolving outside
+        every root belongs to the root of its first link.
+        """
+        root = get_root_of(filename, self.roots)
+        if root is None:
+            for alias in self.walker.aliases.get(filename, []):
+                root = get_root_of(alias, self.roots)
+                if root is not None:
+                    break
+        return root or ''
+
+    @instrumentation.instrumented('columns')
+    def get_columns(self):
+        """
+        Returns the data of every file that reached the full hash stage as ResultColumns, like find_duplicate_files.
+        """
+        aliases = self.walker.aliases
+        prefix_digests = self.digests[1]
+        full_digests = self.digests[self.full_level]
+        confirmed_digests = self.digests[self.final_level] if self.confirm_algorithm else {}
+
+        members = {}
+        for group in self.groups[self.full_level].values():
+            members.update(group)
+
+        duplicate_files = ResultColumns()
+        for filename in sorted(full_digests):
+            if filename in confirmed_digests:
+                full_hash, algorithm = confirmed_digests[filename], self.confirm_algorithm
+            else:
+                full_hash, algorithm = full_digests[filename], self.hash_algorithm
+
+            duplicate_files.append(filename, members[filename], full_hash, algorithm, prefix_digests[filename],
+                                   self.hash_algorithm, aliases.get(filename, []), self.get_root(filename))
+
+        return duplicate_files
+
+def search_duplicate_files(path, cache=None, workers=DEFAULT_HASH_WORKERS, hash_algorithm=DEFAULT_HASH_ALGORITHM,
+                           confirm_algorithm=None):
+    """
+    Runs the whole pipeline on 'path' without progress reporting.
+
+    Returns:
+        ResultColumns: Data of the duplicate files, as returned by find_duplicate_files.
+    """
+    def ignore_progress(progress, total):
+        pass
+
+    roots = normalize_roots(path)
+    files_by_size, file_count, total_files, aliases = get_files_by_size(roots, ignore_progress)
+    hashes_on_1k, hashes_on_1k_num = get_duplicate_files_hashes_and_count(files_by_size, ignore_progress, cache=cache,
+                                                                          workers=workers, hash_algorithm=hash_algorithm)
+    hashes_on_1k, sample_stats = refine_by_samples(hashes_on_1k, ignore_progress, cache=cache, workers=workers,
+                                                   hash_algorithm=hash_algorithm)
+    return find_duplicate_files(hashes_on_1k, ignore_progress, cache=cache, workers=workers, hash_algorithm=hash_algorithm,
+                                confirm_algorithm=confirm_algorithm, aliases=aliases, roots=roots)
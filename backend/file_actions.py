@@ -0,0 +1,537 @@
+import os
+import sys
+import json
+import errno
+import shutil
+import datetime
+from pathlib import Path
+from collections import Counter
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, reflinks are not supported there
+    fcntl = None
+
+from backend.duplicates_checker import map_in_order, get_hash
+
+DEFAULT_JOURNAL_DIR = Path('folder_analysis_data') / 'journals'
+
+JOURNAL_VERSION = 1
+
+# Actions of a journal
+MOVE = 'move'
+DELETE = 'delete'
+# Replace a duplicate by a hardlink or a copy-on-write clone of the kept file
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+LINK_ACTIONS = (HARDLINK, REFLINK)
+
+# ioctl request cloning the extents of a file into another on Linux (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+# Suffix of the temporary name a link is created under before it replaces the duplicate
+LINK_TEMP_SUFFIX = '.dup-link'
+# Suffix of the temporary name a cross-device move copies to before it takes the target name
+COPY_TEMP_SUFFIX = '.dup-partial'
+
+# Outcomes of an action, the last one recorded in the journal counts
+DONE = 'done'
+MISSING = 'missing'
+FAILED = 'failed'
+UNDONE = 'undone'
+UNDO_FAILED = 'undo_failed'
+
+# Cross-device moves copy the data, a few threads keep the disks busy
+DEFAULT_ACTION_WORKERS = 4
+
+# Outcomes appended to the journal with one write
+DEFAULT_JOURNAL_BATCH = 500
+
+def plan_targets(sources, destination):
+    """
+    Picks a free name in 'destination' for every source, adding a _1, _2, ... suffix to the
+    name on collisions.
+
+    The directory is listed once and the names picked so far are tracked in memory, instead
+    of probing the filesystem for every candidate name. Names are compared case-insensitively,
+    so the plan also holds on case-insensitive filesystems.
+
+    Returns:
+        list: The target path of every source.
+    """
+    taken = {name.casefold() for name in os.listdir(destination)} if os.path.isdir(destination) else set()
+    # Next suffix to try per name, so many files with the same name do not rescan the suffixes
+    next_suffix = {}
+    targets = []
+    for source in sources:
+        name = os.path.basename(source)
+        key = name.casefold()
+        if key in taken:
+            stem, ext = os.path.splitext(name)
+            suffix = next_suffix.get(key, 1)
+            while f"{stem}_{suffix}{ext}".casefold() in taken:
+                suffix += 1
+            next_suffix[key] = suffix + 1
+            name = f"{stem}_{suffix}{ext}"
+        taken.add(name.casefold())
+        targets.append(os.path.join(destination, name))
+    return targets
+
+def reflink(source, target):
+    """
+    Creates 'target' as a copy-on-write clone of 'source': a new file sharing the blocks of
+    'source' until either is modified, so no data is copied.
+
+    Raises:
+        OSError: Where the platform or the filesystem does not support reflinks.
+    """
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are only supported on Linux")
+    with open(source, 'rb') as source_file, open(target, 'xb') as target_file:
+        try:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+        except OSError as error:
+            if error.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EXDEV):
+                raise OSError(error.errno, "The filesystem does not support reflinks") from error
+            raise
+
+def get_temp_path(path, suffix):
+    """The temporary name of a file replacing or becoming 'path', next to it so the rename stays within the directory."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}{suffix}")
+
+def rename_no_replace(source, target):
+    """
+    Renames 'source' to 'target' within a filesystem without ever replacing an existing 'target'.
+
+    'target' is created as a hardlink, which fails if it exists, then 'source' is removed. On
+    filesystems without hardlinks it falls back to a rename once 'target' was checked free.
+
+    Raises:
+        FileExistsError: If 'target' exists.
+        OSError: As os.rename, with EXDEV if the paths are on different filesystems.
+    """
+    try:
+        # Links a symbolic link itself, not the file it points to
+        os.link(source, target, follow_symlinks=os.link not in os.supports_follow_symlinks)
+    except OSError as error:
+        if isinstance(error, FileExistsError) or error.errno in (errno.ENOENT, errno.EXDEV):
+            raise
+        # No hardlinks here (FAT, some network shares), only the window between the check and the rename is left
+        if os.path.lexists(target):
+            raise FileExistsError(errno.EEXIST, "File exists", target) from error
+        os.rename(source, target)
+        return
+    try:
+        os.remove(source)
+    except OSError:
+        os.remove(target)
+        raise
+
+class ActionJournal():
+    """
+    Append-only journal of a batch of file moves, deletions or links.
+
+    The journal starts with a header and the planned actions (the source and the target of
+    every file), then the outcome of every executed action is appended. Nothing is ever
+    rewritten: an interruption loses at most the outcomes of the batch being written, and
+    the files of those are checked again when the run is resumed. Moves can be undone from
+    the journal, deletions and links only recorded.
+
+    Args:
+        path (Path): The journal file.
+        action (str): MOVE, DELETE, HARDLINK or REFLINK.
+        sources (list): The files to move, delete or replace by a link.
+        targets (list): The target of every source for MOVE, the kept file it is linked to for
+            the link actions, None for DELETE.
+        destination (str): The directory the files are moved to.
+        created (str): Creation time of the journal.
+        hashes (list): (algorithm, hex digest) the content of every source and target must
+            still have, for the link actions.
+    """
+
+    def __init__(self, path, action, sources, targets=None, destination=None, created=None, hashes=None):
+        self.path = Path(path)
+        self.action = action
+        self.sources = sources
+        self.targets = targets
+        self.destination = destination
+        self.created = created
+        self.hashes = hashes
+        # Last recorded outcome of every action, None while pending
+        self.statuses = [None] * len(sources)
+        self.errors = {}
+        # The file ends with a line cut short, the next record starts a new line
+        self._partial_line = False
+
+    def __len__(self):
+        return len(self.sources)
+
+    @classmethod
+    def create(cls, action, sources, destination=None, journal_dir=DEFAULT_JOURNAL_DIR, targets=None, hashes=None):
+        """
+        Plans the actions and writes the journal. For MOVE, creates 'destination' and picks
+        the target of every file with plan_targets; the link actions take their 'targets'
+        and 'hashes' from the caller, see PandasManager.get_link_plan.
+
+        Returns:
+            ActionJournal: The journal, every action pending.
+        """
+        journal_dir = Path(journal_dir)
+        journal_dir.mkdir(parents=True, exist_ok=True)
+        now = datetime.datetime.now()
+        path = journal_dir / f"{action}_{now:%Y%m%d_%H%M%S_%f}.jsonl"
+
+        sources = list(sources)
+        if action == MOVE:
+            os.makedirs(destination, exist_ok=True)
+            targets = plan_targets(sources, destination)
+
+        journal = cls(path, action, sources, targets, destination, now.isoformat(timespec='seconds'), hashes)
+        header = {'type': 'header', 'version': JOURNAL_VERSION, 'action': action,
+                  'destination': destination, 'created': journal.created}
+        lines = [json.dumps(header)]
+        for index, source in enumerate(sources):
+            record = {'type': 'plan', 'id': index, 'source': source,
+                      'target': targets[index] if targets is not None else None}
+            if hashes is not None:
+                record['hash'] = hashes[index]
+            lines.append(json.dumps(record))
+        journal._append(lines)
+        return journal
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a journal, e.g. to resume or undo its run.
+
+        Raises:
+            ValueError: If the file is not a journal of a supported version.
+        """
+        sources = []
+        targets = []
+        hashes = []
+        outcomes = []
+        header = None
+        partial_line = False
+        with open(path, 'r', encoding='utf-8') as journal_file:
+            for line in journal_file:
+                partial_line = not line.endswith('\n')
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line cut short by an interruption, its outcomes are found again when resuming
+                    continue
+                record_type = record.get('type')
+                if record_type == 'header':
+                    header = record
+                elif record_type == 'plan':
+                    sources.append(record['source'])
+                    targets.append(record['target'])
+                    hashes.append(record.get('hash'))
+                else:
+                    outcomes.append(record)
+
+        if header is None or header.get('version') != JOURNAL_VERSION:
+            raise ValueError(f"'{path}' is not a journal of version {JOURNAL_VERSION}")
+
+        action = header['action']
+        journal = cls(path, action, sources, targets if action != DELETE else None, header['destination'],
+                      header['created'], hashes if action in LINK_ACTIONS else None)
+        for record in outcomes:
+            journal._set_outcome(record['id'], record['type'], record.get('error'))
+        journal._partial_line = partial_line
+        return journal
+
+    @staticmethod
+    def list_journals(journal_dir=DEFAULT_JOURNAL_DIR):
+        """Returns the journal files, the most recent first."""
+        journal_dir = Path(journal_dir)
+        if not journal_dir.is_dir():
+            return []
+        # The names start with the action then the timestamp
+        return sorted(journal_dir.glob('*.jsonl'), key=lambda path: path.stem.split('_', 1)[1], reverse=True)
+
+    def _append(self, lines):
+        with open(self.path, 'a', encoding='utf-8') as journal_file:
+            if self._partial_line:
+                journal_file.write('\n')
+                self._partial_line = False
+            journal_file.write(''.join(line + '\n' for line in lines))
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def _set_outcome(self, index, status, error=None):
+        self.statuses[index] = status
+        if error is None:
+            self.errors.pop(index, None)
+        else:
+            self.errors[index] = error
+
+    def record(self, outcomes):
+        """
+        Appends outcomes to the journal.
+
+        Args:
+            outcomes (list): (index, status, error message or None) tuples.
+        """
+        if not outcomes:
+            return
+        lines = []
+        for index, status, error in outcomes:
+            self._set_outcome(index, status, error)
+            record = {'type': status, 'id': index}
+            if error is not None:
+                record['error'] = error
+            lines.append(json.dumps(record))
+        self._append(lines)
+
+    def get_pending(self):
+        """Returns the actions to run: never run, or failed and worth another try."""
+        return [index for index, status in enumerate(self.statuses) if status is None or status == FAILED]
+
+    def get_undoable(self):
+        """Returns the moves to undo, the most recent first. Deletions cannot be undone."""
+        if self.action != MOVE:
+            return []
+        return [index for index in range(len(self.statuses) - 1, -1, -1)
+                if self.statuses[index] in (DONE, UNDO_FAILED)]
+
+    def get_counts(self):
+        """Returns the number of actions per outcome, 'pending' for the ones not run yet."""
+        return Counter(status or 'pending' for status in self.statuses)
+
+    def get_summary(self):
+        """Returns the outcomes as text, e.g. '120 moved, 2 missing, 1 failed'."""
+        done_names = {MOVE: 'moved', DELETE: 'deleted', HARDLINK: 'linked', REFLINK: 'cloned'}
+        names = {DONE: done_names[self.action], MISSING: 'missing', FAILED: 'failed',
+                 UNDONE: 'moved back', UNDO_FAILED: 'not moved back', 'pending': 'pending'}
+        counts = self.get_counts()
+        return ', '.join(f"{counts[status]} {name}" for status, name in names.items() if counts[status]) or 'nothing to do'
+
+class FileActionExecutor():
+    """
+    Runs the actions of an ActionJournal in batches, recording every outcome.
+
+    Moves within a filesystem are a link and an unlink, metadata operations that never
+    replace a file, and run on the calling thread. Moves that cross devices have to copy
+    the data; they are collected and copied on a bounded thread pool afterwards, under a
+    temporary name first. Deletions are unlinks on the calling thread.
+    Links verify the content of both files first, which may read them, so they run on the
+    pool too. The outcomes are appended to the journal a batch at a time, then
+    'progress_callback' and 'control' are consulted, so a cancelled run stops after the
+    current batch and resumes with the actions still pending.
+
+    Args:
+        journal (ActionJournal): The actions to run.
+        workers (int): Threads copying cross-device moves and verifying links.
+        control (ScanControl, optional): Pause and cancellation of the run.
+        progress_callback (callable, optional): Called with (done, total).
+        batch_size (int): Outcomes appended to the journal at once.
+        cache (HashCache, optional): Serves the hashes of unchanged files when verifying links.
+    """
+
+    def __init__(self, journal, workers=DEFAULT_ACTION_WORKERS, control=None, progress_callback=None,
+                 batch_size=DEFAULT_JOURNAL_BATCH, cache=None):
+        self.journal = journal
+        self.workers = workers
+        self.control = control
+        self.progress_callback = progress_callback
+        self.batch_size = batch_size
+        self.cache = cache
+
+    def run(self):
+        """
+        Moves or deletes the pending files of the journal.
+
+        Returns:
+            Counter: The number of actions per outcome, see ActionJournal.get_counts.
+
+        Raises:
+            WorkerKilledException: If the run was cancelled through 'control'.
+        """
+        if self.journal.action == DELETE:
+            return self._execute(self.journal.get_pending(), self._delete, None)
+        if self.journal.action in LINK_ACTIONS:
+            return self._execute(self.journal.get_pending(), None, self._link)
+
+        def apply(index):
+            return self._rename(index, self.journal.sources[index], self.journal.targets[index])
+
+        def copy(index):
+            return self._copy(index, self.journal.sources[index], self.journal.targets[index])
+
+        return self._execute(self.journal.get_pending(), apply, copy)
+
+    def undo(self):
+        """
+        Moves the files of a move journal back to where they were, the most recent first.
+        A file is not moved back over a file that took its place.
+
+        Returns:
+            Counter: The number of actions per outcome.
+        """
+        def apply(index):
+            source, target = self.journal.sources[index], self.journal.targets[index]
+            if os.path.lexists(source) and not os.path.lexists(target):
+                # Moved back before an interruption, the outcome was not journaled yet
+                return index, UNDONE, None
+            os.makedirs(os.path.dirname(source), exist_ok=True)
+            return self._rename(index, target, source, UNDONE, UNDO_FAILED)
+
+        def copy(index):
+            return self._copy(index, self.journal.targets[index], self.journal.sources[index], UNDONE, UNDO_FAILED)
+
+        return self._execute(self.journal.get_undoable(), apply, copy)
+
+    def _execute(self, indexes, apply, copy):
+        """Runs 'apply' on the calling thread, then 'copy' on the pool for the actions it declined (all without 'apply')."""
+        total = len(indexes)
+        done = 0
+        cross_device = [] if apply is not None else indexes
+
+        for start in range(0, total if apply is not None else 0, self.batch_size):
+            self._check()
+            outcomes = []
+            for index in indexes[start:start + self.batch_size]:
+                outcome = apply(index)
+                if outcome is None:
+                    cross_device.append(index)
+                else:
+                    outcomes.append(outcome)
+            done = self._record(outcomes, done, total)
+
+        # Copies run in input order, at most a few per worker in flight
+        outcomes = []
+        for _, outcome in map_in_order(copy, cross_device, self.workers):
+            outcomes.append(outcome)
+            if len(outcomes) >= self.batch_size:
+                done = self._record(outcomes, done, total)
+                outcomes = []
+                self._check()
+        self._record(outcomes, done, total)
+
+        return self.journal.get_counts()
+
+    def _record(self, outcomes, done, total):
+        self.journal.record(outcomes)
+        done += len(outcomes)
+        if self.progress_callback is not None:
+            self.progress_callback(done, total)
+        return done
+
+    def _check(self):
+        if self.control is not None:
+            self.control.check()
+
+    @staticmethod
+    def _rename(index, source, target, done_status=DONE, failed_status=FAILED):
+        """
+        Renames within a filesystem. Returns the outcome, None if the move crosses devices.
+
+        The target was free when the journal was planned, but a file may have taken the name
+        since (or before a resumed run): that action fails instead of replacing the file.
+        """
+        try:
+            rename_no_replace(source, target)
+        except FileNotFoundError as error:
+            if os.path.lexists(target) and not os.path.lexists(source):
+                # Moved before an interruption, the outcome was not journaled yet
+                return index, done_status, None
+            return (index, MISSING, None) if done_status == DONE else (index, failed_status, str(error))
+        except FileExistsError:
+            try:
+                if os.path.samestat(os.lstat(source), os.lstat(target)):
+                    # Interrupted between the link and the removal of the source
+                    os.remove(source)
+                    return index, done_status, None
+            except OSError as error:
+                return index, failed_status, str(error)
+            return index, failed_status, f"'{target}' already exists"
+        except OSError as error:
+            if error.errno == errno.EXDEV:
+                return None
+            return index, failed_status, str(error)
+        return index, done_status, None
+
+    @staticmethod
+    def _copy(index, source, target, done_status=DONE, failed_status=FAILED):
+        """
+        Moves across devices: copies the data and metadata under a temporary name next to the
+        target, renames the copy to the target without replacing a file, then removes the source.
+        An interrupted copy only leaves the temporary file, which the resumed run replaces.
+        """
+        temp_path = get_temp_path(target, COPY_TEMP_SUFFIX)
+        try:
+            if os.path.lexists(target):
+                return index, failed_status, f"'{target}' already exists"
+            if os.path.lexists(temp_path):
+                os.remove(temp_path)
+            try:
+                shutil.copy2(source, temp_path, follow_symlinks=False)
+                rename_no_replace(temp_path, target)
+            except BaseException:
+                if os.path.lexists(temp_path):
+                    os.remove(temp_path)
+                raise
+            os.remove(source)
+        except FileNotFoundError as error:
+            return (index, MISSING, None) if done_status == DONE else (index, failed_status, str(error))
+        except FileExistsError:
+            return index, failed_status, f"'{target}' already exists"
+        except OSError as error:
+            return index, failed_status, str(error)
+        return index, done_status, None
+
+    def _delete(self, index):
+        try:
+            os.remove(self.journal.sources[index])
+        except FileNotFoundError:
+            return index, MISSING, None
+        except OSError as error:
+            return index, FAILED, str(error)
+        return index, DONE, None
+
+    def _verify(self, path, algorithm, digest):
+        """Returns whether the file still has the content it had when it was scanned."""
+        return get_hash(path, hash_algorithm=algorithm, cache=self.cache).hex() == digest
+
+    def _link(self, index):
+        """Replaces a duplicate by a hardlink or a reflink to the kept file, through a temporary name and a rename."""
+        duplicate, kept = self.journal.sources[index], self.journal.targets[index]
+        algorithm, digest = self.journal.hashes[index]
+        try:
+            duplicate_stat = os.stat(duplicate)
+            kept_stat = os.stat(kept)
+            if (duplicate_stat.st_dev, duplicate_stat.st_ino) == (kept_stat.st_dev, kept_stat.st_ino):
+                # Linked before an interruption, or another path of the same file
+                return index, DONE, None
+            if duplicate_stat.st_dev != kept_stat.st_dev:
+                return index, FAILED, f"'{kept}' is on another filesystem"
+            for path in (kept, duplicate):
+                if not self._verify(path, algorithm, digest):
+                    return index, FAILED, f"'{path}' changed since the scan"
+
+            # A temporary file left by an interrupted run is replaced
+            temp_path = get_temp_path(duplicate, LINK_TEMP_SUFFIX)
+            if os.path.lexists(temp_path):
+                os.remove(temp_path)
+            try:
+                if self.journal.action == HARDLINK:
+                    os.link(kept, temp_path)
+                else:
+                    reflink(kept, temp_path)
+                    # A clone is a new file, it keeps the permissions and times of the duplicate
+                    shutil.copystat(duplicate, temp_path)
+                # Atomic, the duplicate path always holds either the old or the new file
+                os.replace(temp_path, duplicate)
+            except BaseException:
+                if os.path.lexists(temp_path):
+                    os.remove(temp_path)
+                raise
+        except FileNotFoundError:
+            return index, MISSING, None
+        except OSError as error:
+            return index, FAILED, str(error)
+        return index, DONE, None
@@ -0,0 +1,326 @@
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from backend.dir_snapshot import DirectorySnapshot, realpath_roots
+from backend import instrumentation
+
+# Directory listing is dominated by syscall latency, especially on network mounts
+DEFAULT_WALK_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+
+def scan_directory(directory, scan_filter=None):
+    """
+    Lists a single directory with os.scandir.
+
+    Symlinked files are resolved to their canonical path, symlinked directories are
+    not followed (same as os.walk). The stat of every file is taken once from its
+    DirEntry and returned alongside the path so that callers never stat it again.
+
+    With a ScanFilter, pruned subdirectories are left out (so the walk never opens them)
+    and files are rejected by name before their stat is taken.
+
+    Args:
+        directory (str): Directory to list.
+        scan_filter (ScanFilter, optional): Filter applied to the entries.
+
+    Returns:
+        list: (path, os.stat_result, is_symlink) tuples for the regular files in the directory.
+        list: Paths of the subdirectories.
+        Counter: Number of pruned entries keyed by ('dirs' or 'files', reason).
+    """
+    files = []
+    subdirs = []
+    pruned = Counter()
+    # DirEntry.stat() caches its result, the first call per entry is the only syscall
+    stat_calls = 0
+
+    try:
+        parent_dev = None
+        if scan_filter is not None and scan_filter.same_filesystem:
+            parent_dev = os.stat(directory).st_dev
+            stat_calls += 1
+
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if scan_filter is not None:
+                            # Windows reports the hidden attribute in the DirEntry without an extra call
+                            entry_stat = None
+                            if parent_dev is not None or os.name == 'nt':
+                                entry_stat = entry.stat(follow_symlinks=False)
+                                stat_calls += 1
+                            reason = scan_filter.prune_directory(entry.name, entry.path, entry_stat)
+                            if reason is None and parent_dev is not None and entry_stat.st_dev != parent_dev:
+                                reason = 'other filesystem'
+                            if reason is not None:
+                                pruned['dirs', reason] += 1
+                                continue
+                        subdirs.append(entry.path)
+                    elif entry.is_file():
+                        if scan_filter is not None:
+                            reason = scan_filter.prune_file_name(entry.name, entry.path)
+                            if reason is None:
+                                reason = scan_filter.prune_file_stat(entry.name, entry.stat())
+                                stat_calls += 1
+                            if reason is not None:
+                                pruned['files', reason] += 1
+                                continue
+                        else:
+                            stat_calls += 1
+                        # Only symlinks need the expensive canonical path resolution
+                        is_symlink = entry.is_symlink()
+                        path = os.path.realpath(entry.path) if is_symlink else entry.path
+                        files.append((path, entry.stat(), is_symlink))
+                except OSError:
+                    # If the file is not accessible due to permissions or other reasons,
+                    # continue to the next entry
+                    continue
+    except OSError:
+        # Unreadable directories are skipped like os.walk does
+        pass
+
+    instrumentation.count(dirs_listed=1, stat_calls=stat_calls)
+    return files, subdirs, pruned
+
+def file_identity(stat_result):
+    """
+    Returns the (st_dev, st_ino) pair identifying the physical file, or None where the
+    platform does not report inode numbers (e.g. DirEntry.stat() on Windows).
+    """
+    if not stat_result.st_ino:
+        return None
+    return stat_result.st_dev, stat_result.st_ino
+
+def normalize_roots(roots):
+    """
+    Canonicalizes the roots of a scan and drops the overlapping ones.
+
+    A root inside another root, or the same directory reached again through a bind mount
+    (same st_dev and st_ino), would list its files twice and report every file as a
+    duplicate of itself.
+
+    Args:
+        roots: A directory or a list of directories.
+
+    Returns:
+        list: The sorted canonical roots, none of them inside another.
+    """
+    unique_roots = []
+    identities = set()
+    # Sorted, a parent comes before the directories inside it
+    for root in sorted(set(realpath_roots(roots))):
+        if any(root.startswith(os.path.join(kept_root, '')) for kept_root in unique_roots):
+            continue
+        try:
+            root_stat = os.stat(root)
+            identity = (root_stat.st_dev, root_stat.st_ino)
+        except OSError:
+            identity = None
+        if identity is not None and identity in identities:
+            continue
+        identities.add(identity)
+        unique_roots.append(root)
+    return unique_roots
+
+def get_root_of(path, roots):
+    """Returns the root of 'roots' containing 'path', or None."""
+    for root in roots:
+        if path == root or path.startswith(os.path.join(root, '')):
+            return root
+    return None
+
+class ParallelWalker():
+    """
+    Single-pass directory walker that lists directories concurrently.
+
+    'root' is a directory or a list of directories; several roots (e.g. mount points of
+    different disks) are walked concurrently by the same pool, overlapping roots are
+    dropped with normalize_roots.
+
+    The walk keeps running counters so that a total file count can be estimated while
+    the traversal is still in progress, instead of walking the tree twice.
+
+    Hardlinked files and files reached through symlinks are tracked by (st_dev, st_ino)
+    and reported once: the lexicographically smallest path is yielded after the rest of
+    the walk, and the other paths are recorded in 'aliases'.
+
+    Given the DirectorySnapshot of a previous scan, directories whose mtime is unchanged
+    (and that are not listed in 'dirty_dirs') are taken from the snapshot instead of
+    being listed again; only their files are stat'ed. With 'record_snapshot' the walk
+    builds a fresh snapshot in 'new_snapshot' for the next incremental run.
+
+    A ScanControl given as 'control' is checked before every directory is listed, so a
+    paused walk stops listing and a cancelled one raises WorkerKilledException.
+
+    A ScanFilter given as 'scan_filter' is applied while listing; the pruned directories
+    and files are counted by reason in 'pruned_dirs' and 'pruned_files'. A snapshot
+    taken with a different filter is not reused.
+    """
+
+    def __init__(self, root, workers=DEFAULT_WALK_WORKERS, snapshot=None, record_snapshot=False, dirty_dirs=None,
+                 control=None, scan_filter=None):
+        self.roots = normalize_roots(root)
+        self.workers = workers
+        self.control = control
+        self.scan_filter = scan_filter
+        self._root_prefixes = tuple(os.path.join(root, '') for root in self.roots)
+
+        filter_spec = scan_filter.to_spec() if scan_filter is not None else None
+        if snapshot is not None and snapshot.filter_spec != filter_spec:
+            # Its listings hold the files of another filter
+            snapshot = None
+        self.snapshot = snapshot
+        self.dirty_dirs = dirty_dirs or set()
+        self.new_snapshot = DirectorySnapshot(self.roots, filter_spec=filter_spec) if record_snapshot else None
+
+        self.files_seen = 0
+        self.dirs_scanned = 0
+        self.dirs_pending = 0
+        self.dirs_reused = 0
+        self.pruned_dirs = Counter()
+        self.pruned_files = Counter()
+
+        # Primary path mapped to the other paths of the same physical file
+        self.aliases = {}
+        self._linked_files = {}
+
+    def _split_linked(self, files):
+        """Withholds files that may be reachable through several paths, returns the rest."""
+        unique_files = []
+        for path, file_stat, is_symlink in files:
+            # A symlink resolving into the scanned roots points at a file the walk lists by its real path
+            if is_symlink and path.startswith(self._root_prefixes):
+                continue
+
+            identity = file_identity(file_stat)
+            if identity is not None and (is_symlink or file_stat.st_nlink > 1):
+                paths, _ = self._linked_files.setdefault(identity, (set(), file_stat))
+                paths.add(path)
+            else:
+                unique_files.append((path, file_stat))
+        return unique_files
+
+    def _resolve_linked(self):
+        """Returns one primary entry per physical file and fills 'aliases'."""
+        primaries = []
+        for paths, file_stat in self._linked_files.values():
+            primary, *others = sorted(paths)
+            if others:
+                self.aliases[primary] = others
+            primaries.append((primary, file_stat))
+        self._linked_files.clear()
+        return primaries
+
+    def _scan(self, directory):
+        """Lists a directory, or takes its listing from the snapshot when the directory is unchanged."""
+        with instrumentation.measure('walk'):
+            return self._list(directory)
+
+    def _list(self, directory):
+        if self.control is not None:
+            self.control.check()
+
+        if self.snapshot is None and self.new_snapshot is None:
+            files, subdirs, pruned = scan_directory(directory, self.scan_filter)
+            return directory, None, files, subdirs, pruned, False
+
+        try:
+            # Taken before listing, so changes made during the listing show up on the next run
+            mtime_ns = os.stat(directory).st_mtime_ns
+            instrumentation.count(stat_calls=1)
+        except OSError:
+            return directory, None, [], [], Counter(), False
+
+        if self.snapshot is not None and directory not in self.dirty_dirs:
+            listing = self.snapshot.lookup(directory, mtime_ns)
+            if listing is not None:
+                files, subdirs, pruned = listing
+                files, pruned = self._restat(files, pruned)
+                return directory, mtime_ns, files, subdirs, pruned, True
+
+        files, subdirs, pruned = scan_directory(directory, self.scan_filter)
+        return directory, mtime_ns, files, subdirs, pruned, False
+
+    def _restat(self, files, pruned):
+        """
+        Takes the stats of the files of a reused listing again.
+
+        Editing a file in place does not change the mtime of its directory, so the stored
+        stats can be stale; bucketed by a stale size, a file would be compared with the
+        wrong files. Only the listing is reused, which spares the directory reads. Files
+        that left the size range of the filter are pruned; files that entered it are only
+        found once their directory changes.
+        """
+        fresh_files = []
+        pruned = Counter(pruned)
+        for path, _, is_symlink in files:
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                # Deleted since the snapshot
+                continue
+            if self.scan_filter is not None:
+                reason = self.scan_filter.prune_file_stat(os.path.basename(path), file_stat)
+                if reason is not None:
+                    pruned['files', reason] += 1
+                    continue
+            fresh_files.append((path, file_stat, is_symlink))
+        instrumentation.count(stat_calls=len(files))
+        return fresh_files, pruned
+
+    def estimated_total(self):
+        """
+        Estimates the total number of files from the average files per scanned directory.
+        """
+        if not self.dirs_scanned:
+            return self.files_seen
+        average_files = self.files_seen / self.dirs_scanned
+        return self.files_seen + int(self.dirs_pending * average_files)
+
+    def walk_batches(self):
+        """
+        Walks the trees rooted at 'roots'.
+
+        Yields:
+            list: (path, os.stat_result) tuples for the files of one directory, and a
+                  final batch with the primary paths of linked files.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {executor.submit(self._scan, root) for root in self.roots}
+            self.dirs_pending = len(pending)
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    directory, mtime_ns, files, subdirs, pruned, reused = future.result()
+                    for subdir in subdirs:
+                        pending.add(executor.submit(self._scan, subdir))
+
+                    if self.new_snapshot is not None and mtime_ns is not None:
+                        self.new_snapshot.record(directory, mtime_ns, files, subdirs, pruned)
+
+                    for (kind, reason), count in pruned.items():
+                        (self.pruned_dirs if kind == 'dirs' else self.pruned_files)[reason] += count
+
+                    self.dirs_reused += reused
+                    self.dirs_scanned += 1
+                    self.files_seen += len(files)
+                    self.dirs_pending = len(pending)
+
+                    unique_files = self._split_linked(files)
+                    if unique_files:
+                        yield unique_files
+
+        # Linked files are only complete once every directory has been listed
+        primaries = self._resolve_linked()
+        if primaries:
+            yield primaries
+
+    def walk(self):
+        """
+        Yields:
+            tuple: (path, os.stat_result) for every file under the roots.
+        """
+        for batch in self.walk_batches():
+            yield from batch
@@ -0,0 +1,243 @@
+import re
+import numpy as np
+import pandas as pd
+
+# Filter modes
+CONTAINS = 'contains'
+EXACT = 'exact'
+REGEX = 'regex'
+
+# Characters per n-gram of the substring index
+NGRAM_SIZE = 3
+
+# Below this many rows a substring filter scans the column, building an index would not pay off
+NGRAM_MIN_ROWS = 20000
+
+def _get_ngrams(data):
+    """Returns the n-gram ids of every position of a uint8 array (NUL separated strings), and whether each is valid."""
+    grams = (data[:-2].astype(np.uint32) << 16) | (data[1:-1].astype(np.uint32) << 8) | data[2:]
+    # N-grams that span two strings contain the NUL separator
+    valid = (data[:-2] != 0) & (data[1:-1] != 0) & (data[2:] != 0)
+    return grams, valid
+
+def _get_starts(sorted_values):
+    """Returns the positions where a new value starts in a sorted array."""
+    starts = np.empty(len(sorted_values), dtype=bool)
+    starts[:1] = True
+    np.not_equal(sorted_values[1:], sorted_values[:-1], out=starts[1:])
+    return np.flatnonzero(starts)
+
+def _encode(text):
+    # Paths that are not valid UTF-8 hold surrogates, they are encoded the same way in the index and the queries
+    return text.lower().encode('utf-8', 'surrogatepass')
+
+class NgramIndex():
+    """
+    Index of the lowercase byte trigrams of a column of strings, for case-insensitive substring search.
+
+    Every trigram maps to the sorted rows containing it. A query looks up the rows of each of
+    its trigrams, intersects them starting with the rarest and confirms the few candidates
+    left, instead of scanning every string. The index is built with NumPy a chunk of rows at
+    a time and takes about 8 bytes per distinct trigram of every string.
+
+    Args:
+        strings (sequence): The strings to index, without missing values.
+        chunk_rows (int): Rows encoded at once while building.
+    """
+
+    def __init__(self, strings, chunk_rows=65536):
+        self.strings = strings
+        chunk_grams = []
+        chunk_rows_list = []
+
+        for start in range(0, len(strings), chunk_rows):
+            chunk = strings[start:start + chunk_rows]
+            data = np.frombuffer(b'\0'.join(_encode(text) for text in chunk) + b'\0\0', dtype=np.uint8)
+            grams, valid = _get_ngrams(data)
+            # Row of every position: the number of separators before it
+            rows = np.cumsum(data[:-2] == 0)[valid] + start
+            # One entry per distinct trigram of a row, sorted by trigram then row
+            keys = np.sort((grams[valid].astype(np.uint64) << 32) | rows.astype(np.uint64))
+            keys = keys[_get_starts(keys)]
+            chunk_grams.append((keys >> 32).astype(np.uint32))
+            chunk_rows_list.append((keys & 0xFFFFFFFF).astype(np.uint32))
+
+        grams = np.concatenate(chunk_grams) if chunk_grams else np.zeros(0, dtype=np.uint32)
+        rows = np.concatenate(chunk_rows_list) if chunk_rows_list else np.zeros(0, dtype=np.uint32)
+        # Stable, the chunks come in row order so the rows of every trigram stay sorted
+        order = np.argsort(grams, kind='stable')
+        grams = grams[order]
+        starts = _get_starts(grams)
+        self.grams = grams[starts]
+        self.rows = rows[order]
+        self.offsets = np.append(starts, len(self.rows))
+
+    def _get_postings(self, gram):
+        position = np.searchsorted(self.grams, gram)
+        if position == len(self.grams) or self.grams[position] != gram:
+            return None
+        return self.rows[self.offsets[position]:self.offsets[position + 1]]
+
+    def search(self, text):
+        """
+        Returns:
+            np.ndarray: Sorted rows containing 'text' (case-insensitive), or None if 'text' is
+            shorter than NGRAM_SIZE bytes and the index cannot answer.
+        """
+        data = _encode(text)
+        if len(data) < NGRAM_SIZE or b'\0' in data:
+            return None
+
+        grams, _ = _get_ngrams(np.frombuffer(data, dtype=np.uint8))
+        postings = []
+        for gram in np.unique(grams):
+            rows = self._get_postings(gram)
+            if rows is None:
+                return np.zeros(0, dtype=np.int64)
+            postings.append(rows)
+
+        # Intersect starting with the rarest trigram, the candidates only shrink
+        postings.sort(key=len)
+        candidates = postings[0]
+        for rows in postings[1:]:
+            if not len(candidates):
+                break
+            positions = np.minimum(np.searchsorted(rows, candidates), len(rows) - 1)
+            candidates = candidates[rows[positions] == candidates]
+
+        candidates = candidates.astype(np.int64)
+        if len(data) == NGRAM_SIZE:
+            return candidates
+        # The trigrams of a candidate may be in another order, confirm the substring
+        lowered = text.lower()
+        return candidates[np.fromiter((lowered in self.strings[row].lower() for row in candidates),
+                                      dtype=bool, count=len(candidates))]
+
+class FilterEngine():
+    """
+    Filters the rows of a DataFrame on several columns at once.
+
+    Every filter is evaluated over its whole column with vectorized pandas/NumPy operations
+    and the resulting mask is cached, so changing one filter only re-evaluates that column.
+    Categorical columns (hashes, roots) evaluate the predicate once per category instead of
+    once per row. A substring filter that extends the previous one of its column (typing in
+    a search box) only checks the rows that matched before. Columns listed in 'ngram_columns'
+    answer substring filters from an NgramIndex, built the first time it is needed.
+
+    Args:
+        dataframe (pd.DataFrame): The rows to filter.
+        ngram_columns (list): Columns to index for substring search, e.g. ['FilePath'].
+        ngram_min_rows (int): Row count from which the n-gram index is used.
+    """
+
+    def __init__(self, dataframe, ngram_columns=(), ngram_min_rows=NGRAM_MIN_ROWS):
+        self._dataframe = dataframe
+        self._ngram_columns = set(ngram_columns)
+        self._ngram_min_rows = ngram_min_rows
+        self._ngram_indexes = {}
+
+        # column -> (pattern, mode) and column -> boolean mask
+        self.filters = {}
+        self._masks = {}
+
+    def __len__(self):
+        return len(self.filters)
+
+    def set_filter(self, column, pattern, mode=CONTAINS):
+        """
+        Sets the filter of 'column', an empty or None pattern removes it.
+
+        Args:
+            column (str): Column name.
+            pattern (str): Text to look for.
+            mode (str): CONTAINS (case-insensitive substring), EXACT (equal text) or
+                REGEX (case-insensitive regular expression).
+
+        Returns:
+            bool: Whether the filters changed.
+
+        Raises:
+            re.error: If a REGEX pattern is invalid, the previous filter is kept.
+        """
+        if not pattern:
+            return self.clear_filter(column)
+        if self.filters.get(column) == (pattern, mode):
+            return False
+
+        self._masks[column] = self._evaluate(column, pattern, mode)
+        self.filters[column] = (pattern, mode)
+        return True
+
+    def clear_filter(self, column):
+        """Removes the filter of 'column'. Returns whether there was one."""
+        self._masks.pop(column, None)
+        return self.filters.pop(column, None) is not None
+
+    def clear(self):
+        changed = bool(self.filters)
+        self.filters.clear()
+        self._masks.clear()
+        return changed
+
+    def get_mask(self):
+        """Returns the boolean mask of the rows passing every filter, or None without filters."""
+        if not self._masks:
+            return None
+        masks = iter(self._masks.values())
+        mask = next(masks).copy()
+        for column_mask in masks:
+            mask &= column_mask
+        return mask
+
+    def get_rows(self):
+        """Returns the positions of the rows passing every filter, or None without filters."""
+        mask = self.get_mask()
+        return None if mask is None else np.flatnonzero(mask)
+
+    def _get_ngram_index(self, column, series):
+        index = self._ngram_indexes.get(column)
+        if index is None and column in self._ngram_columns and len(series) >= self._ngram_min_rows \
+                and pd.api.types.is_string_dtype(series) and not series.hasnans:
+            index = self._ngram_indexes[column] = NgramIndex(series.to_numpy())
+        return index
+
+    def _evaluate(self, column, pattern, mode):
+        series = self._dataframe[column]
+
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # The predicate is evaluated on the categories, the rows pick the result with their code
+            categories = pd.Series(series.cat.categories.astype(str))
+            matches = np.append(self._match(categories, pattern, mode), False)
+            return matches[series.cat.codes.to_numpy()]
+
+        if mode == CONTAINS:
+            index = self._get_ngram_index(column, series)
+            rows = index.search(pattern) if index is not None else None
+            if rows is not None:
+                mask = np.zeros(len(series), dtype=bool)
+                mask[rows] = True
+                return mask
+
+            previous = self.filters.get(column)
+            if previous is not None and previous[1] == CONTAINS and previous[0].lower() in pattern.lower():
+                # Rows without the previous text cannot contain the longer one
+                mask = self._masks[column].copy()
+                candidates = np.flatnonzero(mask)
+                mask[candidates] = self._match(series.iloc[candidates], pattern, mode)
+                return mask
+
+        return self._match(series, pattern, mode)
+
+    @staticmethod
+    def _match(series, pattern, mode):
+        """Evaluates the predicate over a whole series, returns a boolean array."""
+        if not pd.api.types.is_string_dtype(series):
+            series = series.astype(str)
+        if mode == EXACT:
+            return (series == pattern).to_numpy(dtype=bool, na_value=False)
+        if mode == CONTAINS:
+            return series.str.contains(pattern, case=False, regex=False, na=False).to_numpy(dtype=bool)
+        if mode == REGEX:
+            # Compiled once for the whole column, invalid patterns raise re.error
+            return series.str.contains(pattern, flags=re.IGNORECASE, regex=True, na=False).to_numpy(dtype=bool)
+        raise ValueError(f"Unknown filter mode: {mode}")
@@ -0,0 +1,103 @@
+import numpy as np
+
+def factorize_digests(digest_column):
+    """
+    Encodes the digests of a DigestColumn as integers without creating an object per row.
+
+    The codes follow the byte order of the digests, so sorting by code sorts by digest.
+
+    Returns:
+        np.ndarray: int64 code of every row, equal digests share a code.
+        list: Hex string of the digest of every code.
+    """
+    count = len(digest_column)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64), []
+
+    keys = np.frombuffer(digest_column.buffer, dtype=np.dtype((np.void, digest_column.width)), count=count)
+    lengths = np.frombuffer(digest_column.lengths, dtype=np.uint8)
+    _, first_rows, codes = np.unique(keys, return_index=True, return_inverse=True)
+
+    if lengths.min() != lengths.max():
+        # Shorter digests are padded with zeros, their length keeps them apart from longer ones
+        _, first_rows, codes = np.unique(codes * 256 + lengths, return_index=True, return_inverse=True)
+
+    return codes.astype(np.int64, copy=False), [digest_column[row].hex() for row in first_rows]
+
+class GroupIndex():
+    """
+    The duplicate groups of one key column, computed once.
+
+    Rows are ordered by group with a stable argsort of the key codes; 'offsets' delimit
+    every group in that order, so looking up the rows or the aggregates of a group is a
+    dictionary lookup and a slice instead of a groupby.
+
+    Args:
+        codes (np.ndarray): Group code of every row, as returned by factorize_digests.
+        keys (list): Key of every group (the hex digest).
+        sizes (np.ndarray): Size in bytes of every row.
+        external_links (np.ndarray): Hardlinks from outside the scanned tree of every row.
+    """
+
+    def __init__(self, codes, keys, sizes, external_links):
+        self.codes = codes
+        self.keys = keys
+        self.group_ids = {key: group for group, key in enumerate(keys)}
+
+        group_count = len(keys)
+        self.order = np.argsort(codes, kind='stable')
+        self.counts = np.bincount(codes, minlength=group_count)
+        self.offsets = np.zeros(group_count + 1, dtype=np.int64)
+        np.cumsum(self.counts, out=self.offsets[1:])
+
+        self.total_sizes = np.bincount(codes, weights=sizes, minlength=group_count).astype(np.int64)
+
+        # Median per group: the middle element(s) once the rows are sorted by group, then size
+        sorted_sizes = sizes[np.lexsort((sizes, codes))]
+        starts = self.offsets[:-1]
+        self.median_sizes = (sorted_sizes[starts + (self.counts - 1) // 2] + sorted_sizes[starts + self.counts // 2]) / 2
+        self.duplicate_sizes = self.total_sizes - self.median_sizes
+
+        # A file also hardlinked from outside the scanned tree frees nothing when removed, so
+        # such a file is the one kept in its group and the others are counted
+        linked_outside = np.bincount(codes, weights=external_links > 0, minlength=group_count)
+        kept = np.maximum(linked_outside, 1)
+        self.reclaimable_sizes = self.median_sizes * np.maximum(self.counts - kept, 0)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get_group_id(self, key):
+        """Raises KeyError for an unknown key, like DataFrameGroupBy.get_group."""
+        return self.group_ids[key]
+
+    def get_rows(self, key):
+        """Returns the row positions of the group of 'key'."""
+        group = self.get_group_id(key)
+        return self.order[self.offsets[group]:self.offsets[group + 1]]
+
+    def get_summary(self, key):
+        """
+        Returns:
+            tuple: Total size, file count and duplicate size (total minus the median) of the group.
+        """
+        group = self.get_group_id(key)
+        return int(self.total_sizes[group]), int(self.counts[group]), float(self.duplicate_sizes[group])
+
+    def count_distinct(self, values, value_count):
+        """
+        Counts the distinct values per group.
+
+        Args:
+            values (np.ndarray): Integer code of a value (e.g. the root) of every row.
+            value_count (int): Number of distinct value codes.
+
+        Returns:
+            np.ndarray: Number of distinct values in every group.
+        """
+        pairs = np.unique(self.codes * max(value_count, 1) + values)
+        return np.bincount(pairs // max(value_count, 1), minlength=len(self.keys))
+
+    def any(self, mask):
+        """Returns for every group whether 'mask' is true for at least one of its rows."""
+        return np.bincount(self.codes, weights=mask, minlength=len(self.keys)) > 0
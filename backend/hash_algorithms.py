@@ -0,0 +1,65 @@
+import hashlib
+
+# Registry of hash constructors by name. Every constructor returns an object with the
+# hashlib interface (update/digest), and the name is what gets recorded in results and caches.
+HASH_ALGORITHMS = {
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'blake2b': hashlib.blake2b,
+}
+
+# Fast non-cryptographic or SIMD hashes are used when the optional packages are installed
+try:
+    import xxhash
+    HASH_ALGORITHMS['xxh3_128'] = xxhash.xxh3_128
+    HASH_ALGORITHMS['xxh64'] = xxhash.xxh64
+except ImportError:
+    pass
+
+try:
+    import blake3
+    HASH_ALGORITHMS['blake3'] = blake3.blake3
+except ImportError:
+    pass
+
+DEFAULT_HASH_ALGORITHM = 'sha1'
+STRONG_HASH_ALGORITHM = 'sha256'
+
+# Preferred pre-filter hashes, fastest first
+FAST_HASH_CANDIDATES = ['xxh3_128', 'blake3', 'xxh64', 'blake2b']
+
+def get_hash_algorithm(name):
+    """
+    Returns the hash constructor registered under 'name'.
+
+    Raises:
+        ValueError: If the algorithm is unknown or its optional package is not installed.
+    """
+    try:
+        return HASH_ALGORITHMS[name]
+    except KeyError:
+        raise ValueError(f"Unknown hash algorithm '{name}'. Available: {', '.join(available_algorithms())}")
+
+def available_algorithms():
+    return list(HASH_ALGORITHMS)
+
+def get_fast_algorithm():
+    """Returns the name of the fastest installed pre-filter hash."""
+    for name in FAST_HASH_CANDIDATES:
+        if name in HASH_ALGORITHMS:
+            return name
+    return DEFAULT_HASH_ALGORITHM
+
+def get_hash_presets():
+    """
+    Returns the hashing modes offered to the user.
+
+    Returns:
+        dict: Label mapped to a (hash_algorithm, confirm_algorithm) tuple. 'confirm_algorithm'
+              is None for single-tier modes; in tiered modes every file is hashed with the fast
+              'hash_algorithm' and only colliding groups are confirmed with 'confirm_algorithm'.
+    """
+    presets = {name: (name, None) for name in HASH_ALGORITHMS}
+    fast_algorithm = get_fast_algorithm()
+    presets[f'Tiered: {fast_algorithm} -> {STRONG_HASH_ALGORITHM}'] = (fast_algorithm, STRONG_HASH_ALGORITHM)
+    return presets
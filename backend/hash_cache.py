@@ -0,0 +1,261 @@
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path('folder_analysis_data') / 'hash_cache.sqlite3'
+
+class HashCache():
+    """
+    Persistent on-disk store of file hashes backed by SQLite.
+
+    Entries are keyed by file identity (st_dev, st_ino) and the hash algorithm, and are
+    only valid while the file keeps the same size and mtime_ns. A file whose size or
+    modification time changed is treated as a miss and its stale entry is replaced on
+    the next write. Both the first-chunk hash and the full hash are stored per file, and
+    hashes of sampled blocks are kept in a separate table keyed by the sample name.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, flush_every=500):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_every = flush_every
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._pending_writes = 0
+        self._touched = set()
+        self._touched_samples = set()
+
+        # The worker thread owns the cache, but hashing may happen on pool threads
+        self._connection = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                st_dev INTEGER NOT NULL,
+                st_ino INTEGER NOT NULL,
+                algorithm TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                chunk_hash BLOB,
+                full_hash BLOB,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (st_dev, st_ino, algorithm)
+            )
+            """
+        )
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sample_hashes (
+                st_dev INTEGER NOT NULL,
+                st_ino INTEGER NOT NULL,
+                algorithm TEXT NOT NULL,
+                sample TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                digest BLOB NOT NULL,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (st_dev, st_ino, algorithm, sample)
+            )
+            """
+        )
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _column(first_chunk_only):
+        return 'chunk_hash' if first_chunk_only else 'full_hash'
+
+    @staticmethod
+    def is_cacheable(stat_result):
+        """Files without a stable inode number (some network and FAT mounts) cannot be keyed."""
+        return stat_result.st_ino != 0
+
+    def get(self, stat_result, algorithm, first_chunk_only=False):
+        """
+        Look up a cached hash for a file.
+
+        Args:
+            stat_result (os.stat_result): Current stat of the file.
+            algorithm (str): Name of the hash algorithm, e.g. 'sha1'.
+            first_chunk_only (bool): Whether the first-chunk hash is requested instead of the full hash.
+
+        Returns:
+            bytes: The cached digest, or None on a miss or a stale entry.
+        """
+        if not self.is_cacheable(stat_result):
+            self.misses += 1
+            return None
+
+        column = self._column(first_chunk_only)
+        key = (stat_result.st_dev, stat_result.st_ino, algorithm)
+
+        with self._lock:
+            row = self._connection.execute(
+                f'SELECT {column}, size, mtime_ns FROM file_hashes '
+                'WHERE st_dev = ? AND st_ino = ? AND algorithm = ?',
+                key
+            ).fetchone()
+
+            if row is None or row[0] is None or row[1] != stat_result.st_size or row[2] != stat_result.st_mtime_ns:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._touched.add(key)
+
+        return row[0]
+
+    def get_sample(self, stat_result, algorithm, sample):
+        """
+        Look up the cached hash of a sampled block set, e.g. sample='tail:16384'.
+
+        Returns:
+            bytes: The cached digest, or None on a miss or a stale entry.
+        """
+        if not self.is_cacheable(stat_result):
+            self.misses += 1
+            return None
+
+        key = (stat_result.st_dev, stat_result.st_ino, algorithm, sample)
+
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT digest, size, mtime_ns FROM sample_hashes '
+                'WHERE st_dev = ? AND st_ino = ? AND algorithm = ? AND sample = ?',
+                key
+            ).fetchone()
+
+            if row is None or row[1] != stat_result.st_size or row[2] != stat_result.st_mtime_ns:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._touched_samples.add(key)
+
+        return row[0]
+
+    def put_sample(self, stat_result, algorithm, sample, digest):
+        """Store the hash of a sampled block set, replacing a stale entry."""
+        if not self.is_cacheable(stat_result):
+            return
+
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO sample_hashes '
+                '(st_dev, st_ino, algorithm, sample, size, mtime_ns, digest, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (stat_result.st_dev, stat_result.st_ino, algorithm, sample, stat_result.st_size,
+                 stat_result.st_mtime_ns, digest, time.time())
+            )
+            self._pending_writes += 1
+            if self._pending_writes >= self.flush_every:
+                self._flush_locked()
+
+    def has_full_hash(self, stat_result, algorithm):
+        """
+        Checks whether a valid full hash is stored for a file, without counting a hit or a miss.
+        """
+        if not self.is_cacheable(stat_result):
+            return False
+
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT 1 FROM file_hashes WHERE st_dev = ? AND st_ino = ? AND algorithm = ? '
+                'AND size = ? AND mtime_ns = ? AND full_hash IS NOT NULL',
+                (stat_result.st_dev, stat_result.st_ino, algorithm, stat_result.st_size, stat_result.st_mtime_ns)
+            ).fetchone()
+        return row is not None
+
+    def put(self, stat_result, algorithm, digest, first_chunk_only=False):
+        """
+        Store a freshly computed hash. A stale entry for the same file identity is replaced.
+        """
+        if not self.is_cacheable(stat_result):
+            return
+
+        column = self._column(first_chunk_only)
+        other_column = self._column(not first_chunk_only)
+
+        with self._lock:
+            # On conflict the other hash is kept only if it still describes the same file content
+            self._connection.execute(
+                f"""
+                INSERT INTO file_hashes (st_dev, st_ino, algorithm, size, mtime_ns, {column}, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (st_dev, st_ino, algorithm) DO UPDATE SET
+                    {other_column} = CASE
+                        WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns THEN {other_column}
+                        ELSE NULL
+                    END,
+                    {column} = excluded.{column},
+                    size = excluded.size,
+                    mtime_ns = excluded.mtime_ns,
+                    last_seen = excluded.last_seen
+                """,
+                (stat_result.st_dev, stat_result.st_ino, algorithm, stat_result.st_size,
+                 stat_result.st_mtime_ns, digest, time.time())
+            )
+            self._pending_writes += 1
+            if self._pending_writes >= self.flush_every:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._touched:
+            now = time.time()
+            self._connection.executemany(
+                'UPDATE file_hashes SET last_seen = ? WHERE st_dev = ? AND st_ino = ? AND algorithm = ?',
+                [(now, *key) for key in self._touched]
+            )
+            self._touched.clear()
+        if self._touched_samples:
+            now = time.time()
+            self._connection.executemany(
+                'UPDATE sample_hashes SET last_seen = ? WHERE st_dev = ? AND st_ino = ? AND algorithm = ? AND sample = ?',
+                [(now, *key) for key in self._touched_samples]
+            )
+            self._touched_samples.clear()
+        self._connection.commit()
+        self._pending_writes = 0
+
+    def flush(self):
+        """Commit pending writes and refresh the last-seen time of cache hits."""
+        with self._lock:
+            self._flush_locked()
+
+    def evict_stale(self, max_age_days=30):
+        """
+        Remove entries that have not been read or written for 'max_age_days'.
+
+        Returns:
+            int: Number of evicted entries.
+        """
+        cutoff = time.time() - max_age_days * 86400
+        with self._lock:
+            self._flush_locked()
+            evicted = self._connection.execute('DELETE FROM file_hashes WHERE last_seen < ?', (cutoff,)).rowcount
+            evicted += self._connection.execute('DELETE FROM sample_hashes WHERE last_seen < ?', (cutoff,)).rowcount
+            self._connection.commit()
+        return evicted
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._connection.close()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get_stats_message(self):
+        total = self.hits + self.misses
+        ratio = (self.hits / total * 100) if total else 0
+        return f"Hash cache: {self.hits} hits, {self.misses} misses ({ratio:.1f}% hit rate)"
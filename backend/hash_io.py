@@ -0,0 +1,108 @@
+import os
+import mmap
+
+from backend import instrumentation
+
+# Files at least this large are hashed straight from a read-only memory map when use_mmap is set.
+# Off by default: touching a page past the end of a file truncated by another process while it
+# is mapped raises SIGBUS, which kills the whole process (the GUI included), where readinto just
+# returns a short read. Only enable it for files that cannot change, e.g. read-only or snapshot
+# filesystems.
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+def adaptive_chunk_size(file_size):
+    """
+    Picks the read size for a file: small files are read in one go, large files in
+    big blocks so that the per-call overhead disappears next to the hashing cost.
+    """
+    if file_size <= 256 * 1024:
+        return 64 * 1024
+    if file_size <= 16 * 1024 * 1024:
+        return 256 * 1024
+    return 1024 * 1024
+
+def advise_sequential(fd, file_size):
+    """Tells the kernel the file will be read once from start to end (no-op where unsupported)."""
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, 0, file_size, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+def advise_dontneed(fd, file_size):
+    """Drops the file from the page cache so a scan does not evict the working set of other programs."""
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, 0, file_size, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+
+def _update_from_mmap(hash_obj, file_object, file_size, chunk_size):
+    fd = file_object.fileno()
+    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+        if hasattr(mapped, 'madvise'):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(mapped) as view:
+            # Slices of a memoryview share the mapping, nothing is copied
+            for offset in range(0, file_size, chunk_size):
+                # Stop like a short read if the file was truncated since it was mapped. This
+                # narrows the SIGBUS window to a truncation during one chunk, it cannot close it
+                end = min(offset + chunk_size, os.fstat(fd).st_size)
+                if end <= offset:
+                    break
+                hash_obj.update(view[offset:end])
+
+def _update_from_readinto(hash_obj, file_object, chunk_size):
+    # One buffer is reused for the whole file instead of allocating a bytes object per read
+    buffer = bytearray(chunk_size)
+    with memoryview(buffer) as view:
+        while True:
+            read = file_object.readinto(buffer)
+            if not read:
+                break
+            hash_obj.update(view[:read])
+
+def update_hash_from_open_file(hash_obj, file_object, file_stat, use_mmap=False, drop_cache=True):
+    """
+    Feeds the whole content of an open file into 'hash_obj' without per-chunk allocations.
+
+    Files are read with readinto on a reused buffer, or from a memory map for large files
+    when use_mmap is set. The chunk size adapts to the file size.
+
+    Args:
+        hash_obj: An object with the hashlib update interface.
+        file_object: The file, opened unbuffered in binary mode so readinto fills the buffer directly.
+        file_stat (os.stat_result): Stat of the open file, see update_hash_from_file.
+        use_mmap (bool): Memory map files above MMAP_THRESHOLD. Only safe for files that
+            cannot be truncated while they are hashed, see MMAP_THRESHOLD.
+        drop_cache (bool): Advise the kernel to drop the file pages once hashed.
+    """
+    fd = file_object.fileno()
+    file_size = file_stat.st_size
+    instrumentation.count(bytes_read=file_size)
+    chunk_size = adaptive_chunk_size(file_size)
+
+    advise_sequential(fd, file_size)
+
+    if use_mmap and file_size >= MMAP_THRESHOLD:
+        _update_from_mmap(hash_obj, file_object, file_size, chunk_size)
+    else:
+        _update_from_readinto(hash_obj, file_object, chunk_size)
+
+    if drop_cache:
+        advise_dontneed(fd, file_size)
+
+def update_hash_from_file(hash_obj, filename, use_mmap=False, drop_cache=True):
+    """
+    Feeds the whole content of a file into 'hash_obj', see update_hash_from_open_file.
+
+    Returns:
+        os.stat_result: Stat of the open file taken before it was read. A digest is only
+            cached under this stat: a file changed after the stat has another mtime, so the
+            entry never validates the changed content.
+    """
+    with open(filename, 'rb', buffering=0) as file_object:
+        file_stat = os.fstat(file_object.fileno())
+        instrumentation.count(files_opened=1, stat_calls=1)
+        update_hash_from_open_file(hash_obj, file_object, file_stat, use_mmap, drop_cache)
+    return file_stat
@@ -0,0 +1,347 @@
+"""
+Per-stage instrumentation of a scan.
+
+An Instrumentation object, once started, collects for every stage: wall time, CPU time,
+bytes read, files opened, directories listed, stat calls and peak RSS. The low-level
+functions report their I/O with count(); the stage they belong to is the one of the
+enclosing measure() (per work item, on any thread) or stage() (a sequential phase).
+When no instrumentation is active all of these are no-ops.
+
+Optionally the scan is profiled with cProfile and its allocations are traced with
+tracemalloc. Before Python 3.12 a profiler only sees the thread that enabled it, so every
+thread doing measured work gets its own and the results are merged; from 3.12 on a
+single profiler sees all threads.
+"""
+import io
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from pathlib import Path
+from functools import wraps
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is not reported there
+    resource = None
+
+COUNTERS = ('bytes_read', 'files_opened', 'dirs_listed', 'stat_calls')
+
+PER_THREAD_PROFILING = sys.version_info < (3, 12)
+
+_active = None
+
+def get_peak_rss():
+    """Returns the peak resident set size of the process in bytes, or None where unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def get_active():
+    return _active
+
+def count(**counters):
+    """Adds I/O counters (see COUNTERS) to the current stage of the active instrumentation."""
+    if _active is not None:
+        _active.add(**counters)
+
+def measure(stage):
+    """Measures one work item of 'stage' if an instrumentation is active."""
+    return _active.measure(stage) if _active is not None else nullcontext()
+
+def stage(name):
+    """Measures a sequential phase if an instrumentation is active."""
+    return _active.stage(name) if _active is not None else nullcontext()
+
+def instrumented(name):
+    """Decorator measuring every call of a function as the sequential phase 'name'."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+class Instrumentation():
+    """
+    Collects the metrics of a scan, see the module documentation.
+
+    Stages that overlap (the pipeline hashes several stages at once on a thread pool)
+    are measured per work item: 'wall_seconds' is the span from the first item started
+    to the last one finished, 'busy_seconds' and 'cpu_seconds' are summed over items.
+    A stage also measured as a phase reports the wall and process CPU time of the phase.
+
+    Args:
+        profile (bool): Profile every measured call with cProfile.
+        trace_memory (bool): Trace the allocations with tracemalloc.
+    """
+
+    def __init__(self, profile=False, trace_memory=False):
+        self.profile = profile
+        self.trace_memory = trace_memory
+
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Phase of the thread that started the instrumentation, inherited by threads without a stage of their own
+        self._owner = None
+        self._default_stage = None
+
+        self._profilers = []
+        self._memory_snapshot = None
+        self.running = False
+        self.start_time = None
+        self.total_seconds = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Activates the instrumentation for the whole process."""
+        global _active
+        _active = self
+        self.running = True
+        self._owner = threading.get_ident()
+        self.start_time = time.perf_counter()
+        if self.profile and not PER_THREAD_PROFILING:
+            profiler = cProfile.Profile()
+            self._profilers.append(profiler)
+            profiler.enable()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        """Deactivates the instrumentation, stopping twice does nothing."""
+        global _active
+        if not self.running:
+            return
+        self.running = False
+        if _active is self:
+            _active = None
+        if self.start_time is not None:
+            self.total_seconds = time.perf_counter() - self.start_time
+        if self.profile and not PER_THREAD_PROFILING and self._profilers:
+            self._profilers[0].disable()
+        if self.trace_memory and tracemalloc.is_tracing():
+            self._memory_snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+    def _get_stage(self, name):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = {'phases': 0, 'phase_seconds': 0.0, 'phase_cpu_seconds': 0.0,
+                                         'items': 0, 'first_start': None, 'last_end': None,
+                                         'busy_seconds': 0.0, 'item_cpu_seconds': 0.0,
+                                         'peak_rss': None, 'python_peak_memory': None,
+                                         **{counter: 0 for counter in COUNTERS}}
+        return stats
+
+    def add(self, **counters):
+        name = getattr(self._local, 'stage', None) or getattr(self._local, 'phase', None) or self._default_stage or 'other'
+        with self._lock:
+            stats = self._get_stage(name)
+            for counter, value in counters.items():
+                stats[counter] += value
+
+    def _get_profiler(self):
+        """Returns the profiler of the calling thread, or None when profiling is off or already running here."""
+        if not self.profile or not PER_THREAD_PROFILING or getattr(self._local, 'profiling', False):
+            return None
+        profiler = getattr(self._local, 'profiler', None)
+        if profiler is None:
+            profiler = self._local.profiler = cProfile.Profile()
+            with self._lock:
+                self._profilers.append(profiler)
+        return profiler
+
+    @contextmanager
+    def _profiled(self):
+        profiler = self._get_profiler()
+        if profiler is None:
+            yield
+            return
+        self._local.profiling = True
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self._local.profiling = False
+
+    @contextmanager
+    def measure(self, name):
+        """Measures one work item of stage 'name' on the calling thread."""
+        previous_stage = getattr(self._local, 'stage', None)
+        self._local.stage = name
+
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        try:
+            with self._profiled():
+                yield
+        finally:
+            end_wall = time.perf_counter()
+            cpu = time.thread_time() - start_cpu
+            peak_rss = get_peak_rss()
+            self._local.stage = previous_stage
+
+            with self._lock:
+                stats = self._get_stage(name)
+                stats['items'] += 1
+                stats['busy_seconds'] += end_wall - start_wall
+                stats['item_cpu_seconds'] += cpu
+                if stats['first_start'] is None or start_wall < stats['first_start']:
+                    stats['first_start'] = start_wall
+                if stats['last_end'] is None or end_wall > stats['last_end']:
+                    stats['last_end'] = end_wall
+                stats['peak_rss'] = peak_rss
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measures a sequential phase. The work of the calling thread is counted towards 'name';
+        phases of the thread that started the instrumentation also count the work of the pool
+        threads they start, phases of other threads do not leak into them.
+        """
+        previous_phase = getattr(self._local, 'phase', None)
+        self._local.phase = name
+        is_owner = threading.get_ident() == self._owner
+        if is_owner:
+            previous_stage = self._default_stage
+            self._default_stage = name
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            with self._profiled():
+                yield
+        finally:
+            wall = time.perf_counter() - start_wall
+            # Process time, so that the threads the phase started are included
+            cpu = time.process_time() - start_cpu
+            self._local.phase = previous_phase
+            if is_owner:
+                self._default_stage = previous_stage
+
+            with self._lock:
+                stats = self._get_stage(name)
+                stats['phases'] += 1
+                stats['phase_seconds'] += wall
+                stats['phase_cpu_seconds'] += cpu
+                stats['peak_rss'] = get_peak_rss()
+                if self.trace_memory and tracemalloc.is_tracing():
+                    stats['python_peak_memory'] = tracemalloc.get_traced_memory()[1]
+
+    def get_report(self):
+        """
+        Returns:
+            dict: 'total_seconds', 'peak_rss' and the metrics of every stage in 'stages'.
+        """
+        stages = {}
+        with self._lock:
+            for name, stats in self.stages.items():
+                if stats['phases']:
+                    wall, cpu = stats['phase_seconds'], stats['phase_cpu_seconds']
+                elif stats['items']:
+                    wall, cpu = stats['last_end'] - stats['first_start'], stats['item_cpu_seconds']
+                else:
+                    # Only counters, e.g. I/O outside of any measured stage
+                    wall = cpu = 0.0
+                stages[name] = {'wall_seconds': wall, 'cpu_seconds': cpu, 'busy_seconds': stats['busy_seconds'],
+                                'items': stats['items'], 'peak_rss': stats['peak_rss'],
+                                'python_peak_memory': stats['python_peak_memory'],
+                                **{counter: stats[counter] for counter in COUNTERS}}
+        return {'total_seconds': self.total_seconds, 'peak_rss': get_peak_rss(), 'profile': self.profile,
+                'trace_memory': self.trace_memory, 'stages': stages}
+
+    def format_report(self):
+        """Formats the report as a text table."""
+        from backend.duplicates_checker import convert_size
+
+        report = self.get_report()
+        lines = [f"{'stage':<10} {'wall':>8} {'busy':>8} {'cpu':>8} {'items':>8} {'read':>10} "
+                 f"{'opened':>8} {'listed':>8} {'stats':>8}"]
+        for name, stats in report['stages'].items():
+            lines.append(f"{name:<10} {stats['wall_seconds']:7.2f}s {stats['busy_seconds']:7.2f}s "
+                         f"{stats['cpu_seconds']:7.2f}s {stats['items']:>8} {convert_size(stats['bytes_read']):>10} "
+                         f"{stats['files_opened']:>8} {stats['dirs_listed']:>8} {stats['stat_calls']:>8}")
+
+        summary = []
+        if report['total_seconds'] is not None:
+            summary.append(f"total {report['total_seconds']:.2f}s")
+        if report['peak_rss'] is not None:
+            summary.append(f"peak RSS {convert_size(report['peak_rss'])}")
+        python_peaks = [stats['python_peak_memory'] for stats in report['stages'].values() if stats['python_peak_memory']]
+        if python_peaks:
+            summary.append(f"peak Python memory {convert_size(max(python_peaks))}")
+        if summary:
+            lines.append(', '.join(summary))
+        return '\n'.join(lines)
+
+    def get_profile_stats(self, limit=30):
+        """Returns the merged cProfile statistics as text, sorted by cumulative time."""
+        if not self._profilers:
+            return ''
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profilers[0], stream=stream)
+        for profiler in self._profilers[1:]:
+            stats.add(profiler)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return stream.getvalue()
+
+    def get_memory_stats(self, limit=30):
+        """Returns the source lines that allocated the most memory still held at stop() as text."""
+        if self._memory_snapshot is None:
+            return ''
+        top_lines = self._memory_snapshot.statistics('lineno')[:limit]
+        return '\n'.join(str(line) for line in top_lines)
+
+    def save(self, name, directory='folder_analysis_data'):
+        """
+        Saves the report as '{name}_report.json', plus the cProfile data ('{name}_profile.prof'
+        and a text summary) and the tracemalloc top allocations when they were captured.
+
+        Returns:
+            list: Paths of the written files.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        paths = []
+
+        report_path = directory / f"{name}_report.json"
+        with open(report_path, 'w', encoding='utf-8') as report_file:
+            json.dump(self.get_report(), report_file, indent=4)
+        paths.append(report_path)
+
+        if self._profilers:
+            profile_path = directory / f"{name}_profile.prof"
+            stats = pstats.Stats(self._profilers[0])
+            for profiler in self._profilers[1:]:
+                stats.add(profiler)
+            stats.dump_stats(profile_path)
+            paths.append(profile_path)
+
+            summary_path = directory / f"{name}_profile.txt"
+            summary_path.write_text(self.get_profile_stats(), encoding='utf-8')
+            paths.append(summary_path)
+
+        if self._memory_snapshot is not None:
+            memory_path = directory / f"{name}_tracemalloc.txt"
+            memory_path.write_text(self.get_memory_stats(), encoding='utf-8')
+            paths.append(memory_path)
+
+        return paths
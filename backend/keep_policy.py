@@ -0,0 +1,101 @@
+import os
+import re
+import numpy as np
+
+# Criteria choosing the file kept in every duplicate group
+OLDEST = 'oldest'
+NEWEST = 'newest'
+SHORTEST_PATH = 'shortest_path'
+FEWEST_COMPONENTS = 'fewest_components'
+PREFERRED_ROOT = 'preferred_root'
+
+CRITERIA = (OLDEST, NEWEST, SHORTEST_PATH, FEWEST_COMPONENTS, PREFERRED_ROOT)
+
+def get_separator_pattern():
+    """Regular expression matching a path separator of this platform."""
+    separators = {os.sep, os.altsep} - {None}
+    return '|'.join(re.escape(separator) for separator in separators)
+
+def get_preferred_ranks(paths, preferred_roots):
+    """
+    Returns the rank of every path in the priority list: the position of the first preferred
+    folder containing it, len(preferred_roots) when none does.
+
+    Args:
+        paths (pd.Series): The file paths.
+        preferred_roots (list): Folders, most preferred first.
+    """
+    ranks = np.full(len(paths), len(preferred_roots), dtype=np.int64)
+    # From the least preferred, so the most preferred folder containing a path wins
+    for rank in range(len(preferred_roots) - 1, -1, -1):
+        # Canonical like the scanned roots, see normalize_roots
+        folder = os.path.join(os.path.realpath(preferred_roots[rank]), '')
+        ranks[paths.str.startswith(folder).to_numpy(dtype=bool)] = rank
+    return ranks
+
+class KeepPolicy():
+    """
+    Picks the file to keep in every duplicate group, the others are the excess duplicates.
+
+    A file also hardlinked from outside the scanned tree is always kept: removing it frees
+    nothing, which is what GroupIndex.reclaimable_sizes assumes. The criteria are applied
+    in order after that, each one only breaking the ties of the previous ones; the first
+    row of the group breaks the remaining ties, so the choice is deterministic.
+    Every criterion is turned into one key per row (lower is kept) and a single lexsort of
+    the keys with the group codes orders every group at once, the kept file of a group is
+    the first of its slice.
+
+    Args:
+        criteria (list): Criteria from CRITERIA, e.g. [NEWEST, SHORTEST_PATH].
+        preferred_roots (list): Folders in order of preference, used by PREFERRED_ROOT.
+
+    Examples:
+        >>> KeepPolicy([PREFERRED_ROOT, OLDEST], preferred_roots=['/mnt/archive', '/home'])
+    """
+
+    def __init__(self, criteria, preferred_roots=()):
+        unknown = [criterion for criterion in criteria if criterion not in CRITERIA]
+        if unknown:
+            raise ValueError(f"Unknown keep criteria: {', '.join(unknown)}")
+        self.criteria = list(criteria)
+        self.preferred_roots = list(preferred_roots)
+
+    def get_keys(self, criterion, dataframe, modified_times):
+        """
+        Returns:
+            np.ndarray: The key of every row for 'criterion', the lowest is kept.
+        """
+        if criterion == OLDEST:
+            return modified_times
+        if criterion == NEWEST:
+            return -modified_times
+        if criterion == SHORTEST_PATH:
+            return dataframe['FilePath'].str.len().to_numpy()
+        if criterion == FEWEST_COMPONENTS:
+            return dataframe['FilePath'].str.count(get_separator_pattern()).to_numpy()
+        return get_preferred_ranks(dataframe['FilePath'], self.preferred_roots)
+
+    def get_kept_mask(self, dataframe, group_index, modified_times):
+        """
+        Args:
+            dataframe (pd.DataFrame): The duplicate files.
+            group_index (GroupIndex): The duplicate groups of the rows.
+            modified_times (np.ndarray): Modification time of every row in seconds since the epoch.
+                The DataFrame holds local wall clock times, which are not monotonic around DST changes.
+
+        Returns:
+            np.ndarray: True for the one row kept in every group.
+        """
+        if not len(dataframe):
+            # Without rows the path columns are not even strings
+            return np.zeros(0, dtype=bool)
+
+        # lexsort sorts by the last key first: the group, the external links, then the criteria
+        # in order. It is stable, so the first row of a group wins the remaining ties
+        keys = [self.get_keys(criterion, dataframe, modified_times) for criterion in reversed(self.criteria)]
+        linked_outside = dataframe['External Links'].to_numpy() > 0
+        order = np.lexsort(keys + [~linked_outside, group_index.codes])
+
+        kept = np.zeros(len(dataframe), dtype=bool)
+        kept[order[group_index.offsets[:-1]]] = True
+        return kept
@@ -1,34 +1,108 @@
+import os
 import pandas as pd
+import numpy as np
 import math
+from dateutil.tz import tzlocal, gettz
 from pathlib import Path
-import datetime
-import json
+
+from backend.duplicates_checker import convert_size
+from backend.group_index import GroupIndex, factorize_digests
+from backend.result_store import save_results, load_results, record_analysis
+from backend import instrumentation
+
+# Key column of the grouping selected by the 'idx' / 'index' arguments
+GROUP_COLUMNS = ['Hash', 'Hash on 1k']
+
+def format_sizes(sizes):
+    """Formats an array of sizes in bytes, every distinct size is formatted once and the rows share the strings."""
+    unique_sizes, size_codes = np.unique(sizes, return_inverse=True)
+    formatted_sizes = np.array([convert_size(int(size)) for size in unique_sizes], dtype=object)
+    return formatted_sizes[size_codes]
 
 class PandasManager():
 
-    def __init__(self, list_of_dicts):
-        
-        self._dataframe = pd.DataFrame.from_dict(list_of_dicts)
-        
-        self._dataframe['Hash'] = self._dataframe['Hash'].astype(str)
-        self._dataframe['Hash on 1k'] = self._dataframe['Hash on 1k'].astype(str)
-        self._dataframe['Total Hashes'] = self._dataframe['Hash'].map(self._dataframe['Hash'].value_counts())
-        self._dataframe['Total 1k Hashes'] = self._dataframe['Hash on 1k'].map(self._dataframe['Hash on 1k'].value_counts())
-        
-        self._dataframe['File Name'] = self._dataframe['FilePath'].apply(lambda x: Path(x).name)
+    @instrumentation.instrumented('dataframe')
+    def __init__(self, result_columns, metadata=None):
+        """
+        Args:
+            result_columns (ResultColumns): The duplicate files found by the scan.
+            metadata (dict, optional): Saved with the analysis by export, e.g. the roots.
+        """
+        # Kept for export, the DataFrame shares its buffers
+        self.result_columns = result_columns
+        self.metadata = metadata if metadata is not None else {}
+        hash_codes, hashes = factorize_digests(result_columns.digests)
+        hash_1k_codes, hashes_1k = factorize_digests(result_columns.prefix_digests)
+
+        self._dataframe = self.build_dataframe(result_columns, hash_codes, hashes, hash_1k_codes, hashes_1k)
+        # The keep policies compare the raw timestamps, see KeepPolicy.get_kept_mask
+        self.modified_times = np.frombuffer(result_columns.mtimes, dtype=np.float64)
+
+        # Built once, every group lookup and summary below is a slice of these arrays
+        sizes = self._dataframe['Size In Bytes'].to_numpy()
+        external_links = self._dataframe['External Links'].to_numpy()
+        self.group_indexes = [GroupIndex(hash_codes, hashes, sizes, external_links),
+                              GroupIndex(hash_1k_codes, hashes_1k, sizes, external_links)]
+
+        self._dataframe['Total Hashes'] = self.group_indexes[0].counts[hash_codes]
+        self._dataframe['Total 1k Hashes'] = self.group_indexes[1].counts[hash_1k_codes]
 
         desired_order = ['File Name','FilePath','Size', 'Size In Bytes', 'Hash', 'Hash on 1k',
-        'Modified Date', 'Creation Date','Total Hashes','Total 1k Hashes']
+        'Modified Date', 'Creation Date','Total Hashes','Total 1k Hashes', 'Hash Algorithm', 'Hash on 1k Algorithm',
+        'Aliases', 'External Links', 'Root']
         # Rearrange the columns
         self._dataframe = self._dataframe.reindex(columns=desired_order)
-        
-        self.column_group_full_hash, self.median_group_by_full_hash = self.group_dataframe_by_column('Hash')
-        self.column_group_1k, self.median_group_by_1k_hash = self.group_dataframe_by_column('Hash on 1k')
 
-    def group_dataframe_by_column(self, column_name):
-        grouped_by_column = self._dataframe.groupby(column_name)
-        median_grouped_by_hash = grouped_by_column.median()
-        return grouped_by_column, median_grouped_by_hash
+        self.group_dataframes = [self.build_group_dataframe(index) for index in range(len(GROUP_COLUMNS))]
+
+    @staticmethod
+    def build_dataframe(result_columns, hash_codes, hashes, hash_1k_codes, hashes_1k):
+        """
+        Builds the DataFrame straight from the typed buffers of 'result_columns'. The numeric
+        columns are NumPy views of the buffers and the digests (as hex strings) and repeated
+        strings become categoricals, so no Python object is created per row except for the paths.
+        """
+        sizes = np.frombuffer(result_columns.sizes, dtype=np.int64)
+
+        # The zone file of the local time zone converts in bulk from its transitions, tzlocal
+        # asks the C library one row at a time. It is the fallback where there is no zone file (Windows)
+        local_zone = gettz() or tzlocal()
+
+        def local_times(seconds):
+            # Local wall clock time, like datetime.fromtimestamp
+            times = pd.to_datetime(np.frombuffer(seconds, dtype=np.float64), unit='s', utc=True)
+            return times.tz_convert(local_zone).tz_localize(None)
+
+        def categorical(column):
+            return pd.Categorical.from_codes(np.frombuffer(column.codes, dtype=np.int32), categories=column.values)
+
+        return pd.DataFrame({
+            'File Name': [os.path.basename(path) for path in result_columns.paths],
+            'Hash': pd.Categorical.from_codes(hash_codes, categories=hashes),
+            'FilePath': result_columns.paths,
+            'Size': format_sizes(sizes),
+            'Size In Bytes': sizes,
+            'Hash on 1k': pd.Categorical.from_codes(hash_1k_codes, categories=hashes_1k),
+            'Modified Date': local_times(result_columns.mtimes),
+            # st_ctime: the creation time on Windows, the last metadata change elsewhere
+            'Creation Date': local_times(result_columns.ctimes),
+            'Hash Algorithm': categorical(result_columns.algorithms),
+            'Hash on 1k Algorithm': categorical(result_columns.prefix_algorithms),
+            'Aliases': categorical(result_columns.aliases),
+            'External Links': np.frombuffer(result_columns.external_links, dtype=np.int64),
+            'Root': categorical(result_columns.roots),
+        }, copy=False)
+
+    def build_group_dataframe(self, index):
+        """Builds the table of the groups of GROUP_COLUMNS[index], one row per group."""
+        group_index = self.group_indexes[index]
+        return pd.DataFrame({
+            GROUP_COLUMNS[index]: group_index.keys,
+            'Size In Bytes': group_index.median_sizes,
+            'Files': group_index.counts,
+            'Reclaimable In Bytes': group_index.reclaimable_sizes,
+            'Size': format_sizes(group_index.median_sizes.astype(np.int64)),
+        })
 
     def get_dataframe_copy(self):
         """Returns a copy of the DataFrame."""
@@ -40,29 +114,24 @@ class PandasManager():
  
     def get_modified_group_dataframe(self, idx):
         """
-        Returns a modified group DataFrame based on the given index.
+        Returns the table of the groups based on the given index: the key, median size, file count
+        and reclaimable bytes of every group.
         """
-        if idx == 0:
-            group_df = self.median_group_by_full_hash
-        elif idx == 1:
-            group_df = self.median_group_by_1k_hash
-
-        modified_df = group_df.reset_index()
-        modified_df['Size'] = modified_df['Size In Bytes'].apply(self.get_readable_size)
-        
-
-        return modified_df
+        # The table models sort in place, the cached table must stay as built
+        return self.group_dataframes[idx].copy()
 
     def get_total_duplicates_size(self, idex):
+        """
+        Returns the space that can actually be reclaimed by removing the excess duplicates.
 
-        return self.get_total_filesize() - self.get_unique_filesize(idex)
+        Every row is one physical file (hardlinks are folded into 'Aliases'). A file that is
+        also hardlinked from outside the scanned tree frees nothing when removed, so such a
+        file is the one kept in its group and the others are counted.
+        """
+        return self.group_indexes[idex].reclaimable_sizes.sum()
 
     def get_unique_filesize(self, idex):
-        if idex == 0:
-            selected_group = self.median_group_by_full_hash
-        elif idex == 1:
-            selected_group = self.median_group_by_1k_hash
-        return selected_group['Size In Bytes'].sum()
+        return self.group_indexes[idex].median_sizes.sum()
 
     def get_total_filesize(self):
         """
@@ -112,119 +181,182 @@ class PandasManager():
 
         Args:
             index: The index representing the group type.
-                0 corresponds to median_group_by_full_hash.
-                1 corresponds to median_group_by_1k_hash.
+                0 corresponds to the full hash groups.
+                1 corresponds to the hash on 1k groups.
 
         Returns:
             The total number of unique files.
         """
-        # Select the appropriate group based on the index
-        if index == 0:
-            selected_group = self.median_group_by_full_hash
-        elif index == 1:
-            selected_group = self.median_group_by_1k_hash
-
-        # Get the length of the group DataFrame to determine the number of unique files
-        unique_file_count = len(selected_group.index)
-
-        return unique_file_count
+        return len(self.group_indexes[index])
 
     def get_group_by_value(self, value, index):
         """
         Returns the group associated with the given value based on the provided index.
 
         Args:
-            value: The value to search for in the group.
+            value: The hash identifying the group.
             index: The index representing the group type.
-                0 corresponds to column_group_full_hash.
-                1 corresponds to column_group_1k.
+                0 corresponds to the full hash groups.
+                1 corresponds to the hash on 1k groups.
 
         Returns:
             The group associated with the given value.
         """
-        # Select the appropriate group based on the index
-        if index == 0:
-            selected_group = self.column_group_full_hash
-        elif index == 1:
-            selected_group = self.column_group_1k
-
-        # Return the group associated with the given value
-        return selected_group.get_group(value)
+        return self._dataframe.iloc[self.group_indexes[index].get_rows(value)]
 
     def get_group_summary(self, value, index):
         """
-        Calculates the total size, count, and duplicate size of a group associated with the given value.
+        Returns the total size, count, and duplicate size of a group associated with the given value.
 
         Args:
-            value: The value used to identify the group.
+            value: The hash identifying the group.
             index: The index representing the group type.
-                0 corresponds to column_group_full_hash.
-                1 corresponds to column_group_1k.
+                0 corresponds to the full hash groups.
+                1 corresponds to the hash on 1k groups.
 
         Returns:
             A tuple containing the total size, count, and duplicate size of the group.
         """
-        # Select the appropriate group based on the index
-        if index == 0:
-            selected_group = self.column_group_full_hash
-        elif index == 1:
-            selected_group = self.column_group_1k
-
-        # Retrieve the group associated with the given value
-        group_df = selected_group.get_group(value)
-
-        # Calculate the sum of sizes
-        total_size = group_df['Size In Bytes'].sum()
-
-        # Calculate the number of records in the group
-        record_count = len(group_df.index)
-
-        # Calculate the duplicate size
-        median_size = group_df['Size In Bytes'].median()
-        duplicate_size = total_size - median_size
-
-        return total_size, record_count, duplicate_size
-
-    def save_dataframe_to_csv(self, path):
-        """
-        Save DataFrame to a CSV file with the same headers and no index.
-        """
-        # Save the DataFrame to a CSV file
-        folder_path = Path(path)
-        file_name = folder_path.stem + '.csv'
-        filepath = Path('folder_analysis_data') / file_name
-        self._dataframe.to_csv(filepath, index=False)
-        self.save_metadata(file_name, path)
-
-    # Save CSV path and datetime to an JSON file
-    def save_metadata(self, file_name, path): 
-        # Get the current UTC time
-        current_time = datetime.datetime.utcnow()
-        # Format the time in a readable form
-        formatted_time = current_time.strftime('%Y-%m-%d %H:%M:%S UTC')
-
-        # Create JSON entry
-        csv_metadata = {
-            "path": path,
-            "save_datetime": formatted_time
-        }
-        json_path = 'folder_analysis_data/metadata.json'
-        # Load existing JSON file or create a new one
-        try:
-            with open(json_path, 'r') as jsonfile:
-                json_data = json.load(jsonfile)
-        except FileNotFoundError:
-            json_data = {}
-
-        # Append the new entry
-        json_data[file_name] = csv_metadata
-
-        # Save the updated JSON file
-        with open(json_path, 'w') as jsonfile:
-            json.dump(json_data, jsonfile, indent=4)     
-
-    def get_excess_duplicates(self, order):
-        df_sorted = self._dataframe.sort_values('Modified Date', ascending=order)
-        unique_files_df = df_sorted.groupby('Hash').nth(1).reset_index()
-        excess_duplicates_df = df_sorted.merge(unique_files_df, indicator=True, how='outer').loc[lambda x: x['_merge'] == 'left_only'].drop(columns='_merge')
-        return excess_duplicates_df
\ No newline at end of file
+        return self.group_indexes[index].get_summary(value)
+
+    def save_metadata(self, filepath, path):
+        """Records the saved file and the scanned path in the metadata log, see record_analysis."""
+        record_analysis(filepath, {'path': path, 'rows': len(self._dataframe.index)})
+
+    def export(self, filepath, path=''):
+        """
+        Saves the analysis with typed columns, in the format given by the suffix of 'filepath'
+        (see result_store.FORMATS, or '.csv' for the table as shown). Unlike the CSV, every
+        format of result_store can be opened again with from_file.
+
+        Args:
+            filepath (str): The file to write.
+            path (str): The scanned path, recorded in the metadata log.
+        """
+        if str(filepath).lower().endswith('.csv'):
+            Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+            self._dataframe.to_csv(filepath, index=False)
+        else:
+            metadata = dict(self.metadata, roots=self.get_roots())
+            save_results(self.result_columns, filepath, metadata)
+        self.save_metadata(filepath, path)
+
+    @classmethod
+    def from_file(cls, filepath):
+        """
+        Opens an analysis saved by export, without scanning again.
+
+        Raises:
+            ValueError: If the file is not a readable analysis.
+            OSError: If the file cannot be opened.
+        """
+        result_columns, metadata = load_results(filepath)
+        return cls(result_columns, metadata)
+
+    def get_roots(self):
+        """Returns the scanned roots the files were found in."""
+        return sorted(self._dataframe['Root'].dropna().unique())
+
+    def get_cross_root_duplicates(self, root=None, other_root=None, idex=0):
+        """
+        Returns the rows of the duplicate groups that span more than one scanned root.
+
+        Args:
+            root (str, optional): Only return the rows found in this root.
+            other_root (str, optional): Only return groups that also have a file in this root.
+                With 'root' set too, this answers e.g. "everything on the SSD that is already archived".
+            idex: 0 groups by full hash, 1 by hash on 1k.
+
+        Returns:
+            DataFrame: The matching rows.
+        """
+        group_index = self.group_indexes[idex]
+        roots = self._dataframe['Root'].cat
+        root_codes = roots.codes.to_numpy()
+        mask = (group_index.count_distinct(root_codes, len(roots.categories)) > 1)[group_index.codes]
+
+        if other_root is not None:
+            mask &= group_index.any((self._dataframe['Root'] == other_root).to_numpy())[group_index.codes]
+        if root is not None:
+            mask &= (self._dataframe['Root'] == root).to_numpy()
+
+        return self._dataframe[mask]
+
+    def get_kept_mask(self, policy, idex=0):
+        """
+        Returns the row kept in every group by 'policy' (a KeepPolicy), as a boolean mask.
+
+        Args:
+            policy (KeepPolicy): Chooses the file kept in every group.
+            idex: 0 groups by full hash, 1 by hash on 1k.
+        """
+        return policy.get_kept_mask(self._dataframe, self.group_indexes[idex], self.modified_times)
+
+    def get_excess_duplicates(self, policy, idex=0):
+        """
+        Returns the rows of every group except the one kept by 'policy', the files that can go.
+
+        Args:
+            policy (KeepPolicy): Chooses the file kept in every group.
+            idex: 0 groups by full hash, 1 by hash on 1k.
+
+        Returns:
+            DataFrame: The excess duplicates.
+        """
+        return self._dataframe[~self.get_kept_mask(policy, idex)]
+
+    def get_excess_paths(self, policy, idex=0):
+        """
+        Returns every path of the excess duplicates of 'policy': the primary paths and their
+        'Aliases'. A hardlinked file only goes away with the last of its paths, moving the
+        primary path alone would free nothing.
+
+        Args:
+            policy (KeepPolicy): Chooses the file kept in every group.
+            idex: 0 groups by full hash, 1 by hash on 1k.
+
+        Returns:
+            list: The paths.
+        """
+        excess = self.get_excess_duplicates(policy, idex)
+        paths = []
+        for path, aliases in zip(excess['FilePath'], excess['Aliases']):
+            paths.append(path)
+            if aliases:
+                paths.extend(aliases.split('; '))
+        return paths
+
+    def get_link_plan(self, policy):
+        """
+        Pairs every excess duplicate with the file 'policy' keeps in its group, for replacing
+        the duplicates by links to the kept files. Only the full hash groups are used: a link
+        must never join files that merely share their first bytes.
+
+        The other paths of an excess duplicate ('Aliases') are planned too, the space of a
+        file is only freed once none of its paths is left.
+
+        Returns:
+            list: The paths to replace.
+            list: The kept file every path is linked to.
+            list: [algorithm, hex digest] both files of every pair must still have.
+        """
+        group_index = self.group_indexes[0]
+        kept = self.get_kept_mask(policy, 0)
+        # Kept row of every group, then of every excess row through its group code
+        kept_rows = np.empty(len(group_index), dtype=np.int64)
+        kept_rows[group_index.codes[kept]] = np.flatnonzero(kept)
+        excess_rows = np.flatnonzero(~kept)
+
+        paths = self._dataframe['FilePath'].to_numpy()
+        hashes = self._dataframe['Hash'].to_numpy()
+        algorithms = self._dataframe['Hash Algorithm'].to_numpy()
+        aliases = self._dataframe['Aliases'].to_numpy()
+
+        sources, targets, digests = [], [], []
+        for row, kept_row in zip(excess_rows, kept_rows[group_index.codes[excess_rows]]):
+            digest = [algorithms[row], hashes[row]]
+            for path in [paths[row]] + (aliases[row].split('; ') if aliases[row] else []):
+                sources.append(path)
+                targets.append(paths[kept_row])
+                digests.append(digest)
+        return sources, targets, digests
@@ -0,0 +1,132 @@
+import time
+from collections import namedtuple
+
+from backend.duplicates_checker import convert_size
+
+# Progress updates per second forwarded to the callback, the GUI cannot show more anyway
+DEFAULT_PROGRESS_RATE = 10
+
+# Weight of the newest measurement in the smoothed rates
+RATE_SMOOTHING = 0.3
+
+def format_duration(seconds):
+    """Formats a duration as H:MM:SS or M:SS."""
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+class ProgressStats(namedtuple('ProgressStats', ['done', 'total', 'bytes_done', 'bytes_total', 'files_per_second',
+                                                 'bytes_per_second', 'eta_seconds', 'elapsed_seconds'])):
+    """Progress of one stage, as passed to the callback of a ProgressAggregator."""
+    __slots__ = ()
+
+    @property
+    def bytes_remaining(self):
+        return max(0, self.bytes_total - self.bytes_done)
+
+    @property
+    def percentage(self):
+        # Bytes are a better measure of the remaining work than files when a stage knows them
+        if self.bytes_total:
+            return min(100, int(self.bytes_done / self.bytes_total * 100))
+        if self.total:
+            return min(100, int(self.done / self.total * 100))
+        return 0
+
+    def format(self):
+        """Returns a short description like '1200/5000 files, 3000 files/s, 95.4 MB/s, ETA 0:12'."""
+        parts = [f"{self.done}/{self.total} files", f"{self.files_per_second:.0f} files/s"]
+        if self.bytes_total:
+            parts.append(f"{convert_size(int(self.bytes_per_second))}/s")
+            parts.append(f"{convert_size(self.bytes_remaining)} left")
+        if self.eta_seconds is not None:
+            parts.append(f"ETA {format_duration(self.eta_seconds)}")
+        return ', '.join(parts)
+
+class ProgressAggregator():
+    """
+    Coalesces progress updates of one stage and forwards them at a fixed rate.
+
+    The scan reports progress far more often than anyone can read it; forwarding every
+    update as a Qt signal floods the event loop of the GUI thread. The aggregator is
+    called with the raw counters as often as the stage likes, and calls 'callback' with
+    a ProgressStats at most 'rate' times per second, plus once when the stage completes.
+
+    Files/s and bytes/s are smoothed over the forwarded updates. The ETA is derived from
+    the remaining bytes when the stage knows them, otherwise from the remaining files.
+
+    Args:
+        callback (callable): Called with a ProgressStats.
+        rate (float): Maximum number of forwarded updates per second.
+    """
+
+    def __init__(self, callback, rate=DEFAULT_PROGRESS_RATE):
+        self.callback = callback
+        self.interval = 1 / rate if rate else 0
+
+        self.start_time = time.perf_counter()
+        self._last_time = self.start_time
+        self._last_done = 0
+        self._last_bytes = 0
+        self._files_per_second = None
+        self._bytes_per_second = None
+        self._pending = None
+        self._last_counters = None
+        self._finished = False
+
+    def __call__(self, done, total, bytes_done=0, bytes_total=0):
+        """Records the current counters, forwarding them if the last update is old enough or the stage is complete."""
+        counters = (done, total, bytes_done, bytes_total)
+        if counters == self._last_counters:
+            # Nothing happened since the last update, a stalled stage should not decay its rates to zero
+            self._pending = None
+            return
+        self._pending = counters
+        now = time.perf_counter()
+        if now - self._last_time >= self.interval or (total and done >= total and not self._finished):
+            self._emit(now)
+
+    def _smooth(self, previous, current):
+        if previous is None:
+            return current
+        return previous + RATE_SMOOTHING * (current - previous)
+
+    def _emit(self, now):
+        done, total, bytes_done, bytes_total = self._pending
+        self._last_counters = self._pending
+        self._pending = None
+        self._finished = bool(total) and done >= total
+
+        elapsed = now - self._last_time
+        if self._finished and now > self.start_time:
+            # A completed stage reports its average throughput
+            self._files_per_second = done / (now - self.start_time)
+            self._bytes_per_second = bytes_done / (now - self.start_time)
+        elif elapsed > 0:
+            self._files_per_second = self._smooth(self._files_per_second, (done - self._last_done) / elapsed)
+            self._bytes_per_second = self._smooth(self._bytes_per_second, (bytes_done - self._last_bytes) / elapsed)
+        self._last_time = now
+        self._last_done = done
+        self._last_bytes = bytes_done
+
+        files_per_second = self._files_per_second or 0
+        bytes_per_second = self._bytes_per_second or 0
+        if self._finished:
+            eta_seconds = 0
+        elif bytes_total and bytes_per_second > 0:
+            eta_seconds = max(0, bytes_total - bytes_done) / bytes_per_second
+        elif total and files_per_second > 0:
+            eta_seconds = max(0, total - done) / files_per_second
+        else:
+            eta_seconds = None
+
+        self.callback(ProgressStats(done, total, bytes_done, bytes_total, files_per_second, bytes_per_second,
+                                    eta_seconds, now - self.start_time))
+
+    def finish(self):
+        """Forwards the last recorded update, if it was held back by the rate limit."""
+        if self._pending is not None:
+            self._emit(time.perf_counter())
@@ -0,0 +1,121 @@
+from array import array
+
+class DigestColumn():
+    """
+    Digests packed back to back into one bytearray, 'width' bytes per row.
+
+    Digests of different algorithms (e.g. the fast and the confirming hash of a tiered scan)
+    can have different lengths; the width grows to the longest one and the real length of
+    every digest is kept, so no digest is ever altered.
+    """
+
+    def __init__(self):
+        self.width = 0
+        self.buffer = bytearray()
+        self.lengths = array('B')
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def _widen(self, width):
+        # Rare: only happens when a longer digest arrives, the rows are repacked once
+        packed = bytearray(len(self.lengths) * width)
+        for row in range(len(self.lengths)):
+            packed[row * width:row * width + self.width] = self.buffer[row * self.width:(row + 1) * self.width]
+        self.buffer = packed
+        self.width = width
+
+    def append(self, digest):
+        if len(digest) > self.width:
+            self._widen(len(digest))
+        self.buffer += digest
+        self.buffer += bytes(self.width - len(digest))
+        self.lengths.append(len(digest))
+
+    def __getitem__(self, row):
+        start = row * self.width
+        return bytes(self.buffer[start:start + self.lengths[row]])
+
+    def to_list(self):
+        """Returns the digests as a list of bytes."""
+        view = memoryview(self.buffer)
+        return [bytes(view[row * self.width:row * self.width + length]) for row, length in enumerate(self.lengths)]
+
+class DictionaryColumn():
+    """
+    A column of strings that repeat a lot (roots, algorithm names, aliases): every distinct
+    value is stored once and the rows hold its index.
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codes = array('i')
+        self._index = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def append(self, value):
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def __getitem__(self, row):
+        return self.values[self.codes[row]]
+
+class ResultColumns():
+    """
+    The duplicate files found by a scan, stored column by column in typed buffers.
+
+    Sizes, timestamps and link counts live in array buffers that NumPy reads without
+    copying, digests in fixed-width DigestColumns and repeated strings in DictionaryColumns.
+    The paths are the string objects the walker created, so they are not duplicated either.
+    Compared to one dictionary per file (with formatted sizes and datetime objects) this
+    needs a fraction of the memory for millions of rows.
+    """
+
+    def __init__(self):
+        self.paths = []
+        self.sizes = array('q')
+        # Seconds since the epoch; stats restored from a directory snapshot only keep st_ctime as float
+        self.ctimes = array('d')
+        self.mtimes = array('d')
+        self.external_links = array('q')
+        self.digests = DigestColumn()
+        self.prefix_digests = DigestColumn()
+        self.algorithms = DictionaryColumn()
+        self.prefix_algorithms = DictionaryColumn()
+        self.aliases = DictionaryColumn()
+        self.roots = DictionaryColumn()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def append(self, path, file_stat, digest, algorithm, prefix_digest, prefix_algorithm, aliases=(), root=''):
+        """
+        Adds a duplicate file.
+
+        Args:
+            path (str): Primary path of the file.
+            file_stat (os.stat_result): Stat of the file.
+            digest (bytes): Full content hash.
+            algorithm (str): Algorithm of 'digest'.
+            prefix_digest (bytes): Hash of the first chunk.
+            prefix_algorithm (str): Algorithm of 'prefix_digest'.
+            aliases (list): Other paths of the same physical file.
+            root (str): Scanned root the file belongs to.
+        """
+        self.paths.append(path)
+        self.sizes.append(file_stat.st_size)
+        self.ctimes.append(file_stat.st_ctime)
+        self.mtimes.append(file_stat.st_mtime_ns / 1e9)
+        # Hardlinks outside the scanned tree keep the data alive even if every scanned path is removed
+        self.external_links.append(max(0, file_stat.st_nlink - 1 - len(aliases)))
+        self.digests.append(digest)
+        self.prefix_digests.append(prefix_digest)
+        self.algorithms.append(algorithm)
+        self.prefix_algorithms.append(prefix_algorithm)
+        self.aliases.append('; '.join(aliases))
+        self.roots.append(root)
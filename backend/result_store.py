@@ -0,0 +1,459 @@
+import os
+import sys
+import json
+import codecs
+import gzip
+import zlib
+import mmap
+import datetime
+from pathlib import Path
+
+from backend.result_columns import ResultColumns, DigestColumn
+
+# Parquet and Arrow files are available when the optional package is installed
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_RESULTS_DIR = Path('folder_analysis_data')
+
+# Append-only log of the saved analyses, one JSON line per save
+DEFAULT_METADATA_LOG = DEFAULT_RESULTS_DIR / 'metadata.jsonl'
+
+# Formats of a saved analysis, told apart by the suffix of the file
+COLUMNS = '.cols'
+PARQUET = '.parquet'
+ARROW = '.arrow'
+NDJSON_GZIP = '.ndjson.gz'
+NDJSON_ZSTD = '.ndjson.zst'
+FORMATS = (COLUMNS, PARQUET, ARROW, NDJSON_GZIP, NDJSON_ZSTD)
+
+FORMAT_NAMES = {
+    COLUMNS: "Columns",
+    PARQUET: "Parquet",
+    ARROW: "Arrow",
+    NDJSON_GZIP: "NDJSON (gzip)",
+    NDJSON_ZSTD: "NDJSON (zstd)",
+}
+
+COLUMNS_MAGIC = b'DUPCOLS\n'
+COLUMNS_VERSION = 1
+# Every buffer of a columns file starts on a multiple of this, so the mapped arrays are aligned
+COLUMNS_ALIGNMENT = 64
+
+# Numeric columns of ResultColumns and their array typecode
+NUMERIC_COLUMNS = {'sizes': 'q', 'ctimes': 'd', 'mtimes': 'd', 'external_links': 'q'}
+DIGEST_COLUMNS = ('digests', 'prefix_digests')
+DICTIONARY_COLUMNS = ('algorithms', 'prefix_algorithms', 'aliases', 'roots')
+
+# Paths written at once to a columns file
+PATH_CHUNK_ROWS = 65536
+
+def get_format(path):
+    """
+    Returns the format of a saved analysis from the suffix of 'path'.
+
+    Raises:
+        ValueError: If the suffix is not one of FORMATS.
+    """
+    name = str(path).lower()
+    for result_format in FORMATS:
+        if name.endswith(result_format):
+            return result_format
+    raise ValueError(f"Unknown analysis format '{path}'. Available: {', '.join(FORMATS)}")
+
+def available_formats():
+    """Returns the formats whose optional package is installed."""
+    unavailable = set()
+    if pa is None:
+        unavailable.update((PARQUET, ARROW))
+    if zstandard is None:
+        unavailable.add(NDJSON_ZSTD)
+    return [result_format for result_format in FORMATS if result_format not in unavailable]
+
+def _check_available(result_format):
+    if result_format not in available_formats():
+        package = 'pyarrow' if result_format in (PARQUET, ARROW) else 'zstandard'
+        raise ValueError(f"{FORMAT_NAMES[result_format]} files need the '{package}' package")
+
+def _encode_path(path):
+    # Paths that are not valid UTF-8 hold surrogates, see os.fsdecode
+    return path.encode('utf-8', 'surrogateescape')
+
+def save_results(result_columns, path, metadata=None):
+    """
+    Saves the duplicate files of a scan with their typed columns: sizes and link counts as
+    integers, times as timestamps, digests as bytes and repeated strings dictionary encoded.
+
+    Args:
+        result_columns (ResultColumns): The files to save.
+        path (str): The file, its suffix picks the format (see FORMATS).
+        metadata (dict, optional): Kept with the data where the format allows, e.g. the roots.
+
+    Raises:
+        ValueError: If the format is unknown or its optional package is missing.
+    """
+    result_format = get_format(path)
+    _check_available(result_format)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(path.name + '.tmp')
+
+    if result_format == COLUMNS:
+        _write_columns(result_columns, temp_path, metadata or {})
+    elif result_format == PARQUET:
+        pyarrow.parquet.write_table(to_arrow_table(result_columns, metadata), temp_path, compression='zstd')
+    elif result_format == ARROW:
+        # Uncompressed, so loading maps the file instead of decoding it
+        table = to_arrow_table(result_columns, metadata)
+        with pa.OSFile(str(temp_path), 'wb') as sink, pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        _write_ndjson(result_columns, temp_path, result_format)
+    # Atomic, a failed save keeps the previous file
+    os.replace(temp_path, path)
+    return path
+
+def load_results(path):
+    """
+    Loads an analysis saved by save_results.
+
+    Columns and Arrow files are memory-mapped: the numeric columns and the digests are read
+    from the file as the pages are touched, only the paths are decoded up front.
+
+    Returns:
+        ResultColumns: The files, ready for PandasManager.
+        dict: The metadata saved with them, empty for NDJSON.
+
+    Raises:
+        ValueError: If the file is not a readable analysis.
+        OSError: If the file cannot be opened.
+    """
+    result_format = get_format(path)
+    _check_available(result_format)
+
+    if result_format == COLUMNS:
+        try:
+            return _read_columns(path)
+        except (KeyError, TypeError) as error:
+            raise ValueError(f"'{path}' has an invalid header: {error}") from error
+    if result_format == PARQUET:
+        return from_arrow_table(pyarrow.parquet.read_table(path, memory_map=True))
+    if result_format == ARROW:
+        with pa.memory_map(str(path)) as source:
+            return from_arrow_table(pyarrow.ipc.open_file(source).read_all())
+    return _read_ndjson(path, result_format)
+
+def _align(offset):
+    return -offset % COLUMNS_ALIGNMENT
+
+def _write_columns(result_columns, path, metadata):
+    """
+    Writes the raw buffers of 'result_columns' after a JSON header giving the offset of every
+    buffer. The paths come last, NUL separated, so they are encoded a chunk at a time.
+    """
+    buffers = [(name, memoryview(getattr(result_columns, name)).cast('B')) for name in NUMERIC_COLUMNS]
+    for name in DIGEST_COLUMNS:
+        column = getattr(result_columns, name)
+        buffers.append((name, memoryview(column.buffer).cast('B')))
+        buffers.append((f"{name}_lengths", memoryview(column.lengths).cast('B')))
+    for name in DICTIONARY_COLUMNS:
+        buffers.append((f"{name}_codes", memoryview(getattr(result_columns, name).codes).cast('B')))
+
+    offsets = {}
+    offset = 0
+    for name, buffer in buffers:
+        offsets[name] = [offset, buffer.nbytes]
+        offset += buffer.nbytes + _align(buffer.nbytes)
+    offsets['paths'] = [offset, None]
+
+    header = json.dumps({
+        'version': COLUMNS_VERSION,
+        'byteorder': sys.byteorder,
+        'rows': len(result_columns),
+        'metadata': metadata,
+        'buffers': offsets,
+        'digest_widths': {name: getattr(result_columns, name).width for name in DIGEST_COLUMNS},
+        'dictionaries': {name: getattr(result_columns, name).values for name in DICTIONARY_COLUMNS},
+    }).encode('utf-8')
+    preamble = COLUMNS_MAGIC + len(header).to_bytes(8, 'little') + header
+    preamble += bytes(_align(len(preamble)))
+
+    with open(path, 'wb') as columns_file:
+        columns_file.write(preamble)
+        for name, buffer in buffers:
+            columns_file.write(buffer)
+            columns_file.write(bytes(_align(buffer.nbytes)))
+        paths = result_columns.paths
+        for start in range(0, len(paths), PATH_CHUNK_ROWS):
+            if start:
+                columns_file.write(b'\0')
+            columns_file.write(b'\0'.join(_encode_path(path) for path in paths[start:start + PATH_CHUNK_ROWS]))
+
+def _read_columns(path):
+    with open(path, 'rb') as columns_file:
+        # A private copy-on-write mapping, the arrays built on it stay writable
+        mapped = mmap.mmap(columns_file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    preamble_length = len(COLUMNS_MAGIC) + 8
+    if mapped[:len(COLUMNS_MAGIC)] != COLUMNS_MAGIC:
+        raise ValueError(f"'{path}' is not a columns file")
+    header_length = int.from_bytes(mapped[len(COLUMNS_MAGIC):preamble_length], 'little')
+    header = json.loads(mapped[preamble_length:preamble_length + header_length])
+    if header.get('version') != COLUMNS_VERSION:
+        raise ValueError(f"Unsupported columns file version: {header.get('version')}")
+    if header['byteorder'] != sys.byteorder:
+        raise ValueError(f"'{path}' was written on a {header['byteorder']} endian machine")
+
+    data = memoryview(mapped)[preamble_length + header_length + _align(preamble_length + header_length):]
+
+    def get_buffer(name, typecode='B'):
+        offset, length = header['buffers'][name]
+        return data[offset:offset + length].cast(typecode)
+
+    result_columns = ResultColumns()
+    for name, typecode in NUMERIC_COLUMNS.items():
+        setattr(result_columns, name, get_buffer(name, typecode))
+    for name in DIGEST_COLUMNS:
+        column = getattr(result_columns, name)
+        column.width = header['digest_widths'][name]
+        column.buffer = get_buffer(name)
+        column.lengths = get_buffer(f"{name}_lengths")
+    for name in DICTIONARY_COLUMNS:
+        column = getattr(result_columns, name)
+        column.values = header['dictionaries'][name]
+        column.codes = get_buffer(f"{name}_codes", 'i')
+        column._index = {value: code for code, value in enumerate(column.values)}
+
+    paths_offset = header['buffers']['paths'][0]
+    result_columns.paths = str(data[paths_offset:], 'utf-8', 'surrogateescape').split('\0') if header['rows'] else []
+    if len(result_columns.paths) != header['rows']:
+        raise ValueError(f"'{path}' is truncated")
+    return result_columns, header['metadata']
+
+def _pack_digests(values):
+    """Returns a DigestColumn holding the digests of a pyarrow binary array, padded without a loop over the rows."""
+    import numpy as np
+
+    column = DigestColumn()
+    offsets = np.frombuffer(values.buffers()[1], dtype=np.int32, count=len(values) + 1, offset=values.offset * 4)
+    data = np.frombuffer(values.buffers()[2], dtype=np.uint8) if len(values) else np.zeros(0, dtype=np.uint8)
+    lengths = np.diff(offsets)
+    column.width = int(lengths.max()) if len(lengths) else 0
+
+    # Every byte goes to its row times the width plus its position within the digest
+    rows = np.repeat(np.arange(len(values)), lengths)
+    positions = np.arange(offsets[-1] - offsets[0]) - np.repeat(offsets[:-1] - offsets[0], lengths)
+    packed = np.zeros(len(values) * column.width, dtype=np.uint8)
+    packed[rows * column.width + positions] = data[offsets[0]:offsets[-1]]
+
+    column.buffer = memoryview(packed)
+    column.lengths = memoryview(lengths.astype(np.uint8))
+    return column
+
+def _unpack_digests(column):
+    """Returns the digests of a DigestColumn as a pyarrow binary array."""
+    import numpy as np
+
+    lengths = np.frombuffer(column.lengths, dtype=np.uint8)
+    packed = np.frombuffer(column.buffer, dtype=np.uint8).reshape(len(lengths), column.width)
+    # Row by row, the bytes of every digest without its padding
+    data = packed[np.arange(column.width) < lengths[:, None]]
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+    return pa.BinaryArray.from_buffers(pa.binary(), len(lengths), [None, pa.py_buffer(offsets), pa.py_buffer(data)])
+
+def to_arrow_table(result_columns, metadata=None):
+    """
+    Returns the files as a pyarrow Table. The numeric columns are not copied; paths that are
+    not valid UTF-8 make the path column binary.
+    """
+    import numpy as np
+
+    try:
+        paths = pa.array(result_columns.paths, pa.string())
+    except UnicodeEncodeError:
+        paths = pa.array([_encode_path(path) for path in result_columns.paths], pa.binary())
+
+    def timestamps(seconds):
+        nanoseconds = np.round(np.frombuffer(seconds, dtype=np.float64) * 1e9).astype(np.int64)
+        return pa.array(nanoseconds, pa.timestamp('ns', tz='UTC'))
+
+    def dictionary(column):
+        return pa.DictionaryArray.from_arrays(pa.array(np.frombuffer(column.codes, dtype=np.int32)),
+                                              pa.array(column.values, pa.string()))
+
+    columns = {
+        'path': paths,
+        'size': pa.array(np.frombuffer(result_columns.sizes, dtype=np.int64)),
+        'mtime': timestamps(result_columns.mtimes),
+        'ctime': timestamps(result_columns.ctimes),
+        'hash': _unpack_digests(result_columns.digests),
+        'hash_algorithm': dictionary(result_columns.algorithms),
+        'hash_1k': _unpack_digests(result_columns.prefix_digests),
+        'hash_1k_algorithm': dictionary(result_columns.prefix_algorithms),
+        'aliases': dictionary(result_columns.aliases),
+        'external_links': pa.array(np.frombuffer(result_columns.external_links, dtype=np.int64)),
+        'root': dictionary(result_columns.roots),
+    }
+    return pa.table(columns, metadata={'duplicate_checker': json.dumps(metadata or {})})
+
+def from_arrow_table(table):
+    """Returns the ResultColumns and the metadata of a Table written by to_arrow_table."""
+    import numpy as np
+
+    try:
+        table = table.unify_dictionaries().combine_chunks()
+        result_columns = ResultColumns()
+
+        paths = table['path']
+        if pa.types.is_string(paths.type) or pa.types.is_large_string(paths.type):
+            result_columns.paths = paths.to_pylist()
+        else:
+            result_columns.paths = [path.decode('utf-8', 'surrogateescape') for path in paths.to_pylist()]
+
+        def numbers(name, dtype):
+            values = table[name].cast(pa.int64()).to_numpy()
+            return memoryview(np.ascontiguousarray(values, dtype=dtype))
+
+        result_columns.sizes = numbers('size', np.int64)
+        result_columns.external_links = numbers('external_links', np.int64)
+        result_columns.mtimes = memoryview(table['mtime'].cast(pa.int64()).to_numpy() / 1e9)
+        result_columns.ctimes = memoryview(table['ctime'].cast(pa.int64()).to_numpy() / 1e9)
+
+        for name, column_name in (('digests', 'hash'), ('prefix_digests', 'hash_1k')):
+            values = table[column_name].combine_chunks().cast(pa.binary())
+            setattr(result_columns, name, _pack_digests(values))
+
+        for name, column_name in (('algorithms', 'hash_algorithm'), ('prefix_algorithms', 'hash_1k_algorithm'),
+                                  ('aliases', 'aliases'), ('roots', 'root')):
+            values = table[column_name].combine_chunks()
+            if not pa.types.is_dictionary(values.type):
+                values = values.dictionary_encode()
+            column = getattr(result_columns, name)
+            column.values = values.dictionary.to_pylist()
+            column.codes = memoryview(values.indices.cast(pa.int32()).to_numpy(zero_copy_only=False))
+            column._index = {value: code for code, value in enumerate(column.values)}
+    except (KeyError, pa.ArrowException) as error:
+        raise ValueError(f"Not an analysis table: {error}") from error
+
+    metadata = (table.schema.metadata or {}).get(b'duplicate_checker', b'{}')
+    return result_columns, json.loads(metadata)
+
+def _open_ndjson(path, result_format, mode):
+    if result_format == NDJSON_ZSTD:
+        return zstandard.open(path, mode, encoding='utf-8', errors='surrogateescape')
+    return gzip.open(path, mode, encoding='utf-8', errors='surrogateescape', compresslevel=6)
+
+def _write_ndjson(result_columns, path, result_format):
+    """One JSON object per file, with numbers for sizes and times (seconds since the epoch) and hex digests."""
+    with _open_ndjson(path, result_format, 'wt') as ndjson_file:
+        for row, file_path in enumerate(result_columns.paths):
+            aliases = result_columns.aliases[row]
+            ndjson_file.write(json.dumps({
+                'path': file_path,
+                'size': result_columns.sizes[row],
+                'mtime': result_columns.mtimes[row],
+                'ctime': result_columns.ctimes[row],
+                'hash': result_columns.digests[row].hex(),
+                'hash_algorithm': result_columns.algorithms[row],
+                'hash_1k': result_columns.prefix_digests[row].hex(),
+                'hash_1k_algorithm': result_columns.prefix_algorithms[row],
+                'aliases': aliases.split('; ') if aliases else [],
+                'external_links': result_columns.external_links[row],
+                'root': result_columns.roots[row],
+            }, ensure_ascii=False) + '\n')
+
+def _read_ndjson_lines(path, result_format):
+    """
+    Yields the lines of a compressed NDJSON file. Unlike gzip, the zstandard readers end
+    silently at a truncated frame, so zstd files are decompressed by hand and a frame that
+    did not end raises EOFError like a truncated gzip file does.
+    """
+    if result_format != NDJSON_ZSTD:
+        with _open_ndjson(path, result_format, 'rt') as ndjson_file:
+            yield from ndjson_file
+        return
+
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='surrogateescape')
+    pending = ''
+    with open(path, 'rb') as ndjson_file:
+        for chunk in iter(lambda: ndjson_file.read(1024 * 1024), b''):
+            pending += decoder.decode(decompressor.decompress(chunk))
+            *lines, pending = pending.split('\n')
+            yield from lines
+    if not decompressor.eof:
+        raise EOFError("Compressed file ended before the end of its frame")
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+def _read_ndjson(path, result_format):
+    # A corrupt or truncated stream fails in the decompressor, a damaged line in the JSON decoder
+    corrupt_errors = (gzip.BadGzipFile, zlib.error, EOFError) + ((zstandard.ZstdError,) if zstandard else ())
+    result_columns = ResultColumns()
+    try:
+        for line in _read_ndjson_lines(path, result_format):
+            record = json.loads(line)
+            result_columns.paths.append(record['path'])
+            result_columns.sizes.append(record['size'])
+            result_columns.mtimes.append(record['mtime'])
+            result_columns.ctimes.append(record['ctime'])
+            result_columns.digests.append(bytes.fromhex(record['hash']))
+            result_columns.algorithms.append(record['hash_algorithm'])
+            result_columns.prefix_digests.append(bytes.fromhex(record['hash_1k']))
+            result_columns.prefix_algorithms.append(record['hash_1k_algorithm'])
+            result_columns.aliases.append('; '.join(record['aliases']))
+            result_columns.external_links.append(record['external_links'])
+            result_columns.roots.append(record['root'])
+    except (KeyError, TypeError, ValueError) + corrupt_errors as error:
+        raise ValueError(f"'{path}' is not an analysis: {error}") from error
+    return result_columns, {}
+
+def record_analysis(path, metadata=None, log_path=DEFAULT_METADATA_LOG):
+    """
+    Appends a saved analysis to the metadata log. The log is never rewritten, every save
+    is a single line appended to it.
+
+    Args:
+        path (Path): The saved file.
+        metadata (dict, optional): Recorded with it, e.g. the scanned path.
+    """
+    entry = {
+        'file': str(path),
+        'saved': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC'),
+    }
+    entry.update(metadata or {})
+    log_path = Path(log_path)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, 'a', encoding='utf-8') as log_file:
+        log_file.write(json.dumps(entry) + '\n')
+
+def list_analyses(log_path=DEFAULT_METADATA_LOG):
+    """
+    Returns:
+        list: The entries of the metadata log whose file still exists, the most recent save of every file first.
+    """
+    entries = {}
+    try:
+        with open(log_path, encoding='utf-8') as log_file:
+            for line in log_file:
+                try:
+                    entry = json.loads(line)
+                    entries.pop(entry['file'], None)
+                    entries[entry['file']] = entry
+                except (ValueError, KeyError, TypeError):
+                    # A line cut by an interrupted save
+                    continue
+    except FileNotFoundError:
+        return []
+    return [entry for entry in reversed(entries.values()) if os.path.exists(entry['file'])]
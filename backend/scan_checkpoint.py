@@ -0,0 +1,153 @@
+import os
+import gzip
+import json
+import zlib
+from pathlib import Path
+
+from backend.dir_snapshot import SnapshotStat, to_snapshot_stat, realpath_roots, get_roots_name
+
+DEFAULT_CHECKPOINT_DIR = Path('folder_analysis_data') / 'checkpoints'
+
+# Seconds between two checkpoints of a running scan
+DEFAULT_CHECKPOINT_INTERVAL = 60
+
+CHECKPOINT_VERSION = 2
+
+class ScanCheckpoint():
+    """
+    State of an interrupted DuplicatePipeline: the files it walked (the size buckets),
+    whether the walk had finished, and the digest every completed stage computed for
+    each file together with the size and mtime the file had when it was hashed.
+
+    Resuming replays the saved files through the pipeline; stages whose digest is in the
+    checkpoint and whose file did not change are not hashed again, so the prefix groups
+    and the completed full hashes are rebuilt without reading any file content. The
+    checkpoint only applies to a scan with the same roots and hash settings.
+
+    The file is a gzipped JSON line log: a header with the roots and settings, then one
+    line per save with the files walked and the digests computed since the previous save.
+    A running scan only appends what changed, so a save costs the work done since the
+    last one, not the whole state.
+    """
+
+    def __init__(self, root, settings, walk_done=False, file_count=0, files=None, aliases=None, digests=None):
+        self.roots = realpath_roots(root)
+        self.settings = settings
+        self.walk_done = walk_done
+        self.file_count = file_count
+        # (path, SnapshotStat) of every walked file of at least the minimum size
+        self.files = files if files is not None else []
+        self.aliases = aliases if aliases is not None else {}
+        # Stage name mapped to {path: (size, mtime_ns, digest)}
+        self.digests = digests if digests is not None else {}
+
+    @staticmethod
+    def get_checkpoint_path(root, checkpoint_dir=DEFAULT_CHECKPOINT_DIR):
+        """Checkpoints are named after a hash of the roots, see get_roots_name."""
+        return Path(checkpoint_dir) / f"{get_roots_name(root)}.jsonl.gz"
+
+    @classmethod
+    def load(cls, root, settings, checkpoint_dir=DEFAULT_CHECKPOINT_DIR):
+        """
+        Loads the checkpoint left by an interrupted scan of 'root'.
+
+        A save cut short by the interruption only loses its own line, the earlier ones are kept.
+
+        Returns:
+            ScanCheckpoint: The checkpoint, or None if there is none, it cannot be read or it
+                            was written by a scan with different 'settings'.
+        """
+        checkpoint = None
+        try:
+            with gzip.open(cls.get_checkpoint_path(root, checkpoint_dir), 'rt', encoding='utf-8',
+                           errors='surrogateescape') as checkpoint_file:
+                header = json.loads(checkpoint_file.readline())
+                if header['version'] != CHECKPOINT_VERSION or header['settings'] != settings:
+                    return None
+                checkpoint = cls(root, settings)
+
+                for line in checkpoint_file:
+                    if not line.endswith('\n'):
+                        break
+                    checkpoint._add_record(json.loads(line))
+        except (OSError, EOFError, zlib.error, ValueError, TypeError, KeyError):
+            # A truncated or unreadable line ends the log, see above
+            pass
+        return checkpoint
+
+    def _add_record(self, record):
+        # Decoded first, so a bad record leaves the checkpoint as it was
+        files = [(path, SnapshotStat(*stat_fields)) for path, *stat_fields in record['files']]
+        digests = {stage: {path: (size, mtime_ns, bytes.fromhex(digest))
+                           for path, (size, mtime_ns, digest) in stage_digests.items()}
+                   for stage, stage_digests in record['digests'].items()}
+
+        self.files.extend(files)
+        for stage, stage_digests in digests.items():
+            self.digests.setdefault(stage, {}).update(stage_digests)
+        self.aliases.update(record['aliases'])
+        self.walk_done = record['walk_done']
+        self.file_count = record['file_count']
+
+    def save(self, checkpoint_dir=DEFAULT_CHECKPOINT_DIR, append=False):
+        """
+        Writes the checkpoint.
+
+        Args:
+            checkpoint_dir (Path): Location of the checkpoints.
+            append (bool): Add the files, aliases and digests of this checkpoint to the saved one
+                           instead of replacing it. They must only hold what changed since that save.
+                           Otherwise the file is replaced atomically, an interruption while saving
+                           keeps the previous one.
+
+        Returns:
+            Path: The checkpoint, or None if there was none to append to.
+        """
+        checkpoint_path = self.get_checkpoint_path(self.roots, checkpoint_dir)
+        record = {
+            'walk_done': self.walk_done,
+            'file_count': self.file_count,
+            'files': [[path, *to_snapshot_stat(file_stat)] for path, file_stat in self.files],
+            'aliases': self.aliases,
+            'digests': {stage: {path: [size, mtime_ns, digest.hex()]
+                                for path, (size, mtime_ns, digest) in stage_digests.items()}
+                        for stage, stage_digests in self.digests.items()},
+        }
+        line = json.dumps(record) + '\n'
+
+        if append:
+            if not checkpoint_path.exists():
+                # The log was deleted, appending would leave it without its start
+                return None
+            # Every save is a gzip member of its own, the file stays a valid gzip stream
+            with gzip.open(checkpoint_path, 'at', encoding='utf-8', errors='surrogateescape',
+                           compresslevel=1) as checkpoint_file:
+                checkpoint_file.write(line)
+            return checkpoint_path
+
+        checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = checkpoint_path.with_suffix('.tmp')
+        header = {'version': CHECKPOINT_VERSION, 'roots': self.roots, 'settings': self.settings}
+        with gzip.open(temp_path, 'wt', encoding='utf-8', errors='surrogateescape', compresslevel=1) as checkpoint_file:
+            checkpoint_file.write(json.dumps(header) + '\n')
+            checkpoint_file.write(line)
+        os.replace(temp_path, checkpoint_path)
+        return checkpoint_path
+
+    @classmethod
+    def remove(cls, root, checkpoint_dir=DEFAULT_CHECKPOINT_DIR):
+        """Deletes the checkpoint of 'root' once its scan completed."""
+        try:
+            os.remove(cls.get_checkpoint_path(root, checkpoint_dir))
+        except FileNotFoundError:
+            pass
+
+    def lookup(self, stage, path, file_stat):
+        """
+        Returns:
+            bytes: The digest 'stage' computed for 'path', or None if there is none or the file changed since.
+        """
+        entry = self.digests.get(stage, {}).get(path)
+        if entry is None or entry[0] != file_stat.st_size or entry[1] != file_stat.st_mtime_ns:
+            return None
+        return entry[2]
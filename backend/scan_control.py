@@ -0,0 +1,49 @@
+import threading
+
+class WorkerKilledException(Exception):
+    """Raised inside a scan that was cancelled through its ScanControl."""
+    pass
+
+class ScanControl():
+    """
+    Cooperative cancellation and pause of a running scan.
+
+    The scan calls check() between units of work (a directory listing, a hashed file);
+    the GUI or another thread calls cancel(), pause() and resume(). Work that already
+    started is finished, so a pause or cancel takes effect within one file per thread.
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # A paused scan has to wake up to notice the cancellation
+        self._running.set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def check(self):
+        """
+        Blocks while the scan is paused.
+
+        Raises:
+            WorkerKilledException: If the scan was cancelled.
+        """
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise WorkerKilledException()
@@ -0,0 +1,129 @@
+import os
+import stat
+from fnmatch import fnmatch
+
+# Files below this size are not worth deduplicating
+DEFAULT_MIN_SIZE = 1024
+
+# Version control metadata, dependency trees, caches and filesystem snapshots
+COMMON_EXCLUDED_DIRS = ('.git', '.hg', '.svn', 'node_modules', '__pycache__', '.venv', '.tox', '.cache',
+                        '.snapshot', '.snapshots', '.zfs', '.Trash-*', '$RECYCLE.BIN', 'System Volume Information')
+
+class ScanFilter():
+    """
+    Decides which directories and files the walk visits.
+
+    The walker applies the filter while listing a directory: a pruned directory is never
+    opened, and files are rejected by name before their stat is taken whenever possible.
+    Only the size range needs the stat.
+
+    Args:
+        min_size (int): Smallest file size in bytes.
+        max_size (int, optional): Largest file size in bytes.
+        include_globs (list): If given, only files whose path or name matches one of these patterns.
+        exclude_globs (list): Files and directories whose path or name matches one of these patterns are skipped.
+        extensions (list): If given, only files with one of these extensions (case-insensitive, with or without dot).
+        exclude_dirs (list): Directory names (or name patterns) whose subtrees are skipped.
+        same_filesystem (bool): Do not descend into directories on another filesystem than their parent.
+        skip_hidden (bool): Skip dot files and directories (and files flagged hidden on Windows).
+    """
+
+    def __init__(self, min_size=DEFAULT_MIN_SIZE, max_size=None, include_globs=(), exclude_globs=(), extensions=(),
+                 exclude_dirs=(), same_filesystem=False, skip_hidden=False):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.include_globs = list(include_globs)
+        self.exclude_globs = list(exclude_globs)
+        self.extensions = sorted({self._normalize_extension(extension) for extension in extensions})
+        self.exclude_dirs = list(exclude_dirs)
+        self.same_filesystem = same_filesystem
+        self.skip_hidden = skip_hidden
+
+        # Exact names are looked up in a set, only real patterns go through fnmatch
+        self._excluded_names = {name for name in self.exclude_dirs if not self._is_pattern(name)}
+        self._excluded_patterns = [name for name in self.exclude_dirs if self._is_pattern(name)]
+        self._extension_set = set(self.extensions)
+
+    @staticmethod
+    def _is_pattern(name):
+        return any(character in name for character in '*?[')
+
+    @staticmethod
+    def _normalize_extension(extension):
+        extension = extension.strip().lower()
+        return extension if extension.startswith('.') else '.' + extension
+
+    @staticmethod
+    def _matches(patterns, name, path):
+        return any(fnmatch(name, pattern) or fnmatch(path, pattern) for pattern in patterns)
+
+    @staticmethod
+    def _is_hidden(name, stat_result=None):
+        if name.startswith('.'):
+            return True
+        attributes = getattr(stat_result, 'st_file_attributes', 0)
+        return bool(attributes & getattr(stat, 'FILE_ATTRIBUTE_HIDDEN', 0))
+
+    def to_spec(self):
+        """Returns the filter as a JSON serializable dictionary, see from_spec."""
+        return {'min_size': self.min_size, 'max_size': self.max_size, 'include_globs': self.include_globs,
+                'exclude_globs': self.exclude_globs, 'extensions': self.extensions,
+                'exclude_dirs': self.exclude_dirs, 'same_filesystem': self.same_filesystem,
+                'skip_hidden': self.skip_hidden}
+
+    @classmethod
+    def from_spec(cls, spec):
+        return cls(**spec)
+
+    def prune_directory(self, name, path, stat_result=None):
+        """
+        Returns:
+            str: Why the directory is pruned ('hidden', 'excluded'), or None to descend into it.
+        """
+        if self.skip_hidden and self._is_hidden(name, stat_result):
+            return 'hidden'
+        if name in self._excluded_names or self._matches(self._excluded_patterns, name, path):
+            return 'excluded'
+        if self.exclude_globs and self._matches(self.exclude_globs, name, path):
+            return 'excluded'
+        return None
+
+    def prune_file_name(self, name, path):
+        """
+        Checks everything that needs no stat.
+
+        Returns:
+            str: Why the file is pruned ('hidden', 'excluded', 'extension', 'not included'), or None.
+        """
+        if self.skip_hidden and name.startswith('.'):
+            return 'hidden'
+        if self._extension_set and os.path.splitext(name)[1].lower() not in self._extension_set:
+            return 'extension'
+        if self.include_globs and not self._matches(self.include_globs, name, path):
+            return 'not included'
+        if self.exclude_globs and self._matches(self.exclude_globs, name, path):
+            return 'excluded'
+        return None
+
+    def prune_file_stat(self, name, stat_result):
+        """
+        Returns:
+            str: Why the file is pruned ('size', 'hidden'), or None to keep it.
+        """
+        if stat_result.st_size < self.min_size or (self.max_size is not None and stat_result.st_size > self.max_size):
+            return 'size'
+        if self.skip_hidden and self._is_hidden(name, stat_result):
+            return 'hidden'
+        return None
+
+def format_pruned(pruned_dirs, pruned_files):
+    """Formats the pruned counts of a walk, e.g. '12 directories (excluded: 12), 340 files (size: 300, hidden: 40)'."""
+    def format_counts(counts):
+        return ', '.join(f"{reason}: {count}" for reason, count in sorted(counts.items()))
+
+    parts = []
+    if pruned_dirs:
+        parts.append(f"{sum(pruned_dirs.values())} directories ({format_counts(pruned_dirs)})")
+    if pruned_files:
+        parts.append(f"{sum(pruned_files.values())} files ({format_counts(pruned_files)})")
+    return ', '.join(parts) or 'nothing'
@@ -0,0 +1,264 @@
+import os
+import json
+import datetime
+from pathlib import Path
+from collections import namedtuple
+
+import numpy as np
+
+from backend.dir_snapshot import realpath_roots, get_roots_name
+from backend.duplicates_checker import convert_size
+from backend.group_index import GroupIndex, factorize_digests
+from backend.result_store import save_results, load_results, COLUMNS
+
+DEFAULT_HISTORY_DIR = Path('folder_analysis_data') / 'history'
+
+# Snapshots are named by their time, so the names sort chronologically
+SNAPSHOT_TIME_FORMAT = '%Y%m%d_%H%M%S_%f'
+
+# Snapshots kept per set of roots, the oldest are deleted. 0 keeps every scan
+DEFAULT_HISTORY_KEEP = 30
+
+# Groups listed per section of a text report
+DEFAULT_REPORT_LIMIT = 20
+
+# A duplicate group in two snapshots. 'reclaimable' is 0 where it is not a group, 'files' where no file has its hash
+GroupChange = namedtuple('GroupChange', ['key', 'size', 'files_before', 'files_after',
+                                         'reclaimable_before', 'reclaimable_after', 'path'])
+
+def get_group_index(result_columns):
+    """Returns the GroupIndex of the full hash groups of a scan, like PandasManager builds it."""
+    codes, keys = factorize_digests(result_columns.digests)
+    return GroupIndex(codes, keys, np.frombuffer(result_columns.sizes, dtype=np.int64),
+                      np.frombuffer(result_columns.external_links, dtype=np.int64))
+
+def get_group_algorithms(result_columns, group_index):
+    """Returns the names of the hash algorithms of the files in groups of at least two files."""
+    in_groups = group_index.counts[group_index.codes] >= 2
+    algorithm_codes = np.frombuffer(result_columns.algorithms.codes, dtype=np.int32)[in_groups]
+    return {result_columns.algorithms.values[code] for code in np.unique(algorithm_codes)}
+
+class ScanHistory():
+    """
+    Every saved scan of a set of roots, one analysis file (see result_store) per scan named
+    by its time, in a directory named after the roots (see get_roots_name). Scans of
+    different folders with the same name are kept apart, and every snapshot can also be
+    opened in the GUI.
+
+    Args:
+        roots (list): The scanned roots.
+        history_dir (Path): Holds one directory per set of roots.
+    """
+
+    def __init__(self, roots, history_dir=DEFAULT_HISTORY_DIR):
+        self.roots = realpath_roots(roots)
+        self.directory = Path(history_dir) / get_roots_name(self.roots)
+
+    @staticmethod
+    def list_histories(history_dir=DEFAULT_HISTORY_DIR):
+        """Returns a ScanHistory for every set of roots with saved snapshots."""
+        histories = []
+        for roots_path in sorted(Path(history_dir).glob('*/roots.json')):
+            try:
+                with open(roots_path, encoding='utf-8') as roots_file:
+                    histories.append(ScanHistory(json.load(roots_file), history_dir))
+            except (OSError, ValueError, TypeError):
+                continue
+        return histories
+
+    @staticmethod
+    def get_created(snapshot_path):
+        """Returns the time a snapshot was saved, from its name."""
+        return datetime.datetime.strptime(Path(snapshot_path).name[:-len(COLUMNS)], SNAPSHOT_TIME_FORMAT)
+
+    def list_snapshots(self):
+        """Returns the paths of the snapshots, the oldest first."""
+        return sorted(self.directory.glob(f"*{COLUMNS}"))
+
+    def find_snapshot(self, before):
+        """Returns the most recent snapshot saved before the datetime 'before', or None."""
+        earlier = [path for path in self.list_snapshots() if self.get_created(path) < before]
+        return earlier[-1] if earlier else None
+
+    def save(self, result_columns, created=None, metadata=None, keep=None):
+        """
+        Saves a scan as a new snapshot.
+
+        Args:
+            result_columns (ResultColumns): The duplicate files found by the scan.
+            created (datetime, optional): Time of the scan, now by default.
+            metadata (dict, optional): Saved with the snapshot, e.g. the hash algorithm.
+            keep (int, optional): Only keep this many snapshots, the oldest are deleted. None or 0 keeps every one.
+
+        Returns:
+            Path: The snapshot.
+        """
+        created = created or datetime.datetime.now()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        roots_path = self.directory / 'roots.json'
+        if not roots_path.exists():
+            with open(roots_path, 'w', encoding='utf-8') as roots_file:
+                json.dump(self.roots, roots_file)
+
+        snapshot_path = self.directory / f"{created.strftime(SNAPSHOT_TIME_FORMAT)}{COLUMNS}"
+        save_results(result_columns, snapshot_path,
+                     dict(metadata or {}, roots=self.roots, created=created.isoformat(timespec='seconds')))
+
+        if keep:
+            for old_path in self.list_snapshots()[:-keep]:
+                os.remove(old_path)
+        return snapshot_path
+
+    def diff(self, older_path, newer_path):
+        """Returns the SnapshotDiff between two snapshots of this history (or any two analysis files)."""
+        older_columns, _ = load_results(older_path)
+        newer_columns, _ = load_results(newer_path)
+        return SnapshotDiff(older_columns, newer_columns, self.get_created(older_path), self.get_created(newer_path))
+
+class SnapshotDiff():
+    """
+    What changed in the duplicate groups between two scans.
+
+    The groups are joined on their full hash: the GroupIndex of each scan maps every hash to
+    its group, so every group of the newer scan is looked up once in the older one and the
+    sizes, counts and reclaimable bytes of the matched groups are compared as arrays. No row
+    of either scan is compared or merged.
+
+    Args:
+        older (ResultColumns): The earlier scan.
+        newer (ResultColumns): The later scan.
+        older_created (datetime, optional): Time of the earlier scan, for the report.
+        newer_created (datetime, optional): Time of the later scan, for the report.
+
+    Only groups of at least two files count: a file alone with its full hash only shared its
+    prefix or samples with another file.
+
+    Attributes:
+        new_groups (list): GroupChange of every group only in the newer scan.
+        resolved_groups (list): GroupChange of every group only in the older scan, or down to one file.
+        grown_groups (list): GroupChange of every group in both scans with more reclaimable bytes.
+        shrunk_groups (list): GroupChange of every group in both scans with fewer reclaimable bytes.
+        All sorted by the change of their reclaimable bytes, the largest first.
+
+    Raises:
+        ValueError: If the groups of the scans were hashed with different algorithms.
+    """
+
+    def __init__(self, older, newer, older_created=None, newer_created=None):
+        self.older_created = older_created
+        self.newer_created = newer_created
+        older_index = get_group_index(older)
+        newer_index = get_group_index(newer)
+
+        older_algorithms = get_group_algorithms(older, older_index)
+        newer_algorithms = get_group_algorithms(newer, newer_index)
+        if older_algorithms and newer_algorithms and older_algorithms != newer_algorithms:
+            # The same content has other digests, every group would show up as new and resolved
+            raise ValueError(f"The scans were hashed with different algorithms "
+                             f"({', '.join(sorted(older_algorithms))} and {', '.join(sorted(newer_algorithms))}), "
+                             f"their duplicate groups cannot be compared")
+
+        self.reclaimable_before = int(older_index.reclaimable_sizes.sum())
+        self.reclaimable_after = int(newer_index.reclaimable_sizes.sum())
+
+        # A full hash seen once is not a duplicate group, only a file whose prefix or samples
+        # collided with another one: it is left out on both sides, so a group that falls to a
+        # single file is resolved and one that reaches two files is new
+        older_duplicates = older_index.counts >= 2
+        newer_duplicates = np.flatnonzero(newer_index.counts >= 2)
+
+        # Group of the older scan with the hash of every group of the newer one, -1 for new groups
+        matches = np.fromiter((older_index.group_ids.get(newer_index.keys[group], -1) for group in newer_duplicates),
+                              dtype=np.int64, count=len(newer_duplicates))
+        found = matches >= 0
+        found[found] = older_duplicates[matches[found]]
+        matches[~found] = -1
+        matched = np.flatnonzero(matches >= 0)
+        still_present = np.zeros(len(older_index), dtype=bool)
+        still_present[matches[matched]] = True
+
+        growth = newer_index.reclaimable_sizes[newer_duplicates[matched]] - older_index.reclaimable_sizes[matches[matched]]
+
+        def get_count(index, key):
+            # A file alone with the hash of a group of the other scan is still counted
+            group = index.group_ids.get(key)
+            return int(index.counts[group]) if group is not None else 0
+
+        def get_changes(newer_groups, older_groups):
+            changes = []
+            for newer_group, older_group in zip(newer_groups, older_groups):
+                index, group = (newer_index, newer_group) if newer_group >= 0 else (older_index, older_group)
+                columns = newer if newer_group >= 0 else older
+                key = index.keys[group]
+                changes.append(GroupChange(
+                    key, int(index.median_sizes[group]),
+                    int(older_index.counts[older_group]) if older_group >= 0 else get_count(older_index, key),
+                    int(newer_index.counts[newer_group]) if newer_group >= 0 else get_count(newer_index, key),
+                    int(older_index.reclaimable_sizes[older_group]) if older_group >= 0 else 0,
+                    int(newer_index.reclaimable_sizes[newer_group]) if newer_group >= 0 else 0,
+                    # A file of the group, to show where it is
+                    columns.paths[index.order[index.offsets[group]]]))
+            return sorted(changes, key=lambda change: abs(change.reclaimable_after - change.reclaimable_before),
+                          reverse=True)
+
+        new = np.flatnonzero(matches < 0)
+        resolved = np.flatnonzero(older_duplicates & ~still_present)
+        grown = matched[growth > 0]
+        shrunk = matched[growth < 0]
+        self.new_groups = get_changes(newer_duplicates[new], np.full(len(new), -1))
+        self.resolved_groups = get_changes(np.full(len(resolved), -1), resolved)
+        self.grown_groups = get_changes(newer_duplicates[grown], matches[grown])
+        self.shrunk_groups = get_changes(newer_duplicates[shrunk], matches[shrunk])
+
+    def has_changes(self):
+        return bool(self.new_groups or self.resolved_groups or self.grown_groups or self.shrunk_groups)
+
+    def format_summary(self):
+        """Returns the counts of the changes and the change of the reclaimable bytes on one line."""
+        if not self.has_changes():
+            return "no duplicate group changed"
+        change = self.reclaimable_after - self.reclaimable_before
+        return (f"{len(self.new_groups)} new groups, {len(self.resolved_groups)} resolved, "
+                f"{len(self.grown_groups)} grown, {len(self.shrunk_groups)} shrunk, "
+                f"reclaimable {'+' if change >= 0 else '-'}{convert_size(abs(change))}")
+
+    def to_dict(self):
+        """Returns the diff as JSON-serializable data."""
+        return {
+            'older': self.older_created.isoformat(timespec='seconds') if self.older_created else None,
+            'newer': self.newer_created.isoformat(timespec='seconds') if self.newer_created else None,
+            'reclaimable_before': self.reclaimable_before,
+            'reclaimable_after': self.reclaimable_after,
+            'new_groups': [change._asdict() for change in self.new_groups],
+            'resolved_groups': [change._asdict() for change in self.resolved_groups],
+            'grown_groups': [change._asdict() for change in self.grown_groups],
+            'shrunk_groups': [change._asdict() for change in self.shrunk_groups],
+        }
+
+    def format_report(self, limit=DEFAULT_REPORT_LIMIT):
+        """Returns a text report of the changes only, with the 'limit' largest groups of each kind."""
+        def signed_size(size):
+            return ('+' if size >= 0 else '-') + convert_size(abs(size))
+
+        since = f" since {self.older_created:%Y-%m-%d %H:%M}" if self.older_created else ""
+        lines = [f"Reclaimable{since}: {convert_size(self.reclaimable_before)} -> "
+                 f"{convert_size(self.reclaimable_after)} "
+                 f"({signed_size(self.reclaimable_after - self.reclaimable_before)})"]
+        if not self.has_changes():
+            lines.append("No duplicate group changed")
+            return "\n".join(lines)
+
+        sections = [("new groups", self.new_groups), ("resolved groups", self.resolved_groups),
+                    ("grown groups", self.grown_groups), ("shrunk groups", self.shrunk_groups)]
+        for title, changes in sections:
+            if not changes:
+                continue
+            total = sum(change.reclaimable_after - change.reclaimable_before for change in changes)
+            lines.append(f"{len(changes)} {title} ({signed_size(total)} reclaimable):")
+            for change in changes[:limit]:
+                lines.append(f"  {signed_size(change.reclaimable_after - change.reclaimable_before):>12}  "
+                             f"{change.files_before} -> {change.files_after} files of "
+                             f"{convert_size(change.size)}  {change.path}")
+            if len(changes) > limit:
+                lines.append(f"  ... and {len(changes) - limit} more")
+        return "\n".join(lines)
@@ -0,0 +1,85 @@
+"""
+Compares the throughput of the full-file hashing paths.
+
+Run from the repository root:
+    python -m benchmarks.bench_hash_io [--size-mb 256] [--repeat 3] [--algorithm sha1]
+
+The files are hashed from the page cache (the first pass warms it), so the numbers
+measure the copy and allocation overhead of each path rather than the disk.
+"""
+import os
+import time
+import argparse
+import tempfile
+
+from backend.duplicates_checker import chunk_reader
+from backend.hash_algorithms import get_hash_algorithm, DEFAULT_HASH_ALGORITHM
+from backend.hash_io import update_hash_from_file
+
+def hash_with_chunk_reader(hash_constructor, filename):
+    hash_obj = hash_constructor()
+    with open(filename, 'rb') as file_object:
+        for chunk in chunk_reader(file_object):
+            hash_obj.update(chunk)
+    return hash_obj.digest()
+
+def hash_with_readinto(hash_constructor, filename):
+    hash_obj = hash_constructor()
+    update_hash_from_file(hash_obj, filename, use_mmap=False, drop_cache=False)
+    return hash_obj.digest()
+
+def hash_with_mmap(hash_constructor, filename):
+    hash_obj = hash_constructor()
+    update_hash_from_file(hash_obj, filename, use_mmap=True, drop_cache=False)
+    return hash_obj.digest()
+
+METHODS = {
+    'chunk_reader (baseline)': hash_with_chunk_reader,
+    'readinto': hash_with_readinto,
+    'mmap': hash_with_mmap,
+}
+
+def write_random_file(path, size):
+    block = os.urandom(1024 * 1024)
+    with open(path, 'wb') as file_object:
+        remaining = size
+        while remaining > 0:
+            file_object.write(block[:remaining])
+            remaining -= len(block)
+
+def run(size_mb, repeat, algorithm):
+    hash_constructor = get_hash_algorithm(algorithm)
+    size = size_mb * 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'sample.bin')
+        write_random_file(filename, size)
+
+        # Warm the page cache and check every path produces the same digest
+        digests = {name: method(hash_constructor, filename) for name, method in METHODS.items()}
+        if len(set(digests.values())) != 1:
+            raise RuntimeError(f"Hashing paths disagree: {digests}")
+
+        results = {}
+        for name, method in METHODS.items():
+            best = min(_time_once(method, hash_constructor, filename) for _ in range(repeat))
+            results[name] = size / best / (1024 * 1024)
+
+    baseline = results['chunk_reader (baseline)']
+    print(f"{algorithm}, {size_mb} MB file, best of {repeat}")
+    for name, throughput in results.items():
+        print(f"  {name:<24} {throughput:8.1f} MB/s  x{throughput / baseline:.2f}")
+    return results
+
+def _time_once(method, hash_constructor, filename):
+    start = time.perf_counter()
+    method(hash_constructor, filename)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--algorithm', default=DEFAULT_HASH_ALGORITHM)
+    args = parser.parse_args()
+    run(args.size_mb, args.repeat, args.algorithm)
@@ -0,0 +1,251 @@
+"""
+Times every stage of the duplicate search on a deterministic synthetic tree.
+
+Run from the repository root:
+    python -m benchmarks.bench_pipeline [--preset small] [--repeat 3] [--save-baseline]
+
+Stages, each timed on its own with the output of the previous stage as input:
+    walk        get_files_by_size
+    prefix      get_duplicate_files_hashes_and_count
+    samples     refine_by_samples
+    full        find_duplicate_files
+    pandas      PandasManager built from the rows
+    pipeline    DuplicatePipeline, walking and hashing overlapped
+    worker      app.Worker.process() headless, as the GUI runs it (needs PySide6)
+
+No hash cache is used except by the worker, which gets a fresh cache per run. The tree
+is freshly written, so the first run reads from the page cache; the hashing drops the
+pages it read, so later runs may read from the disk. Use --tree-dir on a tmpfs to
+measure CPU cost only.
+
+Results are written as JSON. With a baseline (--baseline, by default the file written
+by --save-baseline) every stage is compared to it and the exit code is 1 when a stage
+got slower than the tolerance allows.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import traceback
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.synthetic_tree import PRESETS, generate_tree
+from backend.duplicates_checker import (get_files_by_size, get_duplicate_files_hashes_and_count, refine_by_samples,
+                                        find_duplicate_files, DuplicatePipeline, DEFAULT_HASH_WORKERS)
+from backend.hash_algorithms import DEFAULT_HASH_ALGORITHM
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+DEFAULT_BASELINE = RESULTS_DIR / 'baseline.json'
+
+# Slowdown tolerated before a stage counts as a regression, runs on a busy machine vary
+DEFAULT_TOLERANCE = 0.15
+
+def ignore_progress(*args):
+    pass
+
+class StageTimer():
+    """Collects the wall times of the runs of every stage and the error of a failing stage."""
+
+    def __init__(self):
+        self.runs = {}
+        self.errors = {}
+
+    def time(self, stage, function, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            self.errors[stage] = traceback.format_exc(limit=3)
+            return None
+        self.runs.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+def run_staged(tree, timer, workers, algorithm):
+    """Runs the staged functions one after the other, returns the rows or None if a stage failed."""
+    walked = timer.time('walk', get_files_by_size, tree, ignore_progress)
+    if walked is None:
+        return None
+    files_by_size, _, _, aliases = walked
+
+    prefix_hashed = timer.time('prefix', get_duplicate_files_hashes_and_count, files_by_size, ignore_progress,
+                               workers=workers, hash_algorithm=algorithm)
+    if prefix_hashed is None:
+        return None
+
+    sampled = timer.time('samples', refine_by_samples, prefix_hashed[0], ignore_progress, workers=workers,
+                         hash_algorithm=algorithm)
+    if sampled is None:
+        return None
+
+    return timer.time('full', find_duplicate_files, sampled[0], ignore_progress, workers=workers,
+                      hash_algorithm=algorithm, aliases=aliases)
+
+def run_pandas(rows, timer):
+    try:
+        from backend.pandas_manager import PandasManager
+    except ImportError as error:
+        timer.errors['pandas'] = f"skipped: {error}"
+        return
+    timer.time('pandas', PandasManager, rows)
+
+def run_pipeline(tree, timer, workers, algorithm):
+    def scan():
+        pipeline = DuplicatePipeline(tree, workers=workers, hash_algorithm=algorithm)
+        for _ in pipeline.run():
+            pass
+        return pipeline.get_columns()
+    return timer.time('pipeline', scan)
+
+def run_worker(tree, timer, workers, algorithm):
+    try:
+        from app import Worker
+    except ImportError as error:
+        timer.errors['worker'] = f"skipped: {error}"
+        return
+
+    # The worker keeps its cache and checkpoints below the working directory
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as data_directory:
+        os.chdir(data_directory)
+        try:
+            worker = Worker([tree], workers=workers, hash_algorithm=algorithm)
+            timer.time('worker', worker.process)
+        finally:
+            os.chdir(working_directory)
+
+def run_benchmark(spec, repeat, workers, algorithm, tree_dir=None, stages=None):
+    """
+    Generates the tree of 'spec' and times the stages 'repeat' times.
+
+    Returns:
+        dict: The benchmark results, see compare_results for the layout of 'stages'.
+    """
+    tree = tempfile.mkdtemp(prefix='dupbench-', dir=tree_dir)
+    try:
+        generate_start = time.perf_counter()
+        tree_stats = generate_tree(tree, spec)
+        generate_seconds = time.perf_counter() - generate_start
+
+        timer = StageTimer()
+        found = {}
+        for _ in range(repeat):
+            if not stages or {'walk', 'prefix', 'samples', 'full', 'pandas'} & set(stages):
+                rows = run_staged(tree, timer, workers, algorithm)
+                found['staged'] = len(rows) if rows is not None else None
+                if rows and (not stages or 'pandas' in stages):
+                    run_pandas(rows, timer)
+            if not stages or 'pipeline' in stages:
+                rows = run_pipeline(tree, timer, workers, algorithm)
+                found['pipeline'] = len(rows) if rows is not None else None
+            if not stages or 'worker' in stages:
+                run_worker(tree, timer, workers, algorithm)
+    finally:
+        shutil.rmtree(tree, ignore_errors=True)
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'workers': workers,
+            'algorithm': algorithm,
+            'repeat': repeat,
+        },
+        'spec': spec._asdict(),
+        'tree': dict(tree_stats, generate_seconds=round(generate_seconds, 3)),
+        'found_rows': found,
+        'stages': {stage: {'best': min(runs), 'median': sorted(runs)[len(runs) // 2], 'runs': runs}
+                   for stage, runs in timer.runs.items()},
+        'errors': timer.errors,
+    }
+
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares the best time of every stage with the baseline.
+
+    Returns:
+        list: (stage, baseline seconds, seconds, ratio, regressed) for the stages both results have.
+    """
+    comparison = []
+    for stage, timing in results['stages'].items():
+        baseline_timing = baseline.get('stages', {}).get(stage)
+        if baseline_timing is None:
+            continue
+        ratio = timing['best'] / baseline_timing['best'] if baseline_timing['best'] else float('inf')
+        comparison.append((stage, baseline_timing['best'], timing['best'], ratio, ratio > 1 + tolerance))
+    return comparison
+
+def print_results(results, comparison=None):
+    tree = results['tree']
+    print(f"Tree: {tree['files']} files, {tree['bytes'] / 1024 ** 2:.1f} MB, "
+          f"{tree['expected duplicate files']} duplicate files in {tree['expected duplicate groups']} groups")
+    for source, rows in results['found_rows'].items():
+        if rows is not None and rows != tree['expected duplicate files']:
+            print(f"  warning: {source} found {rows} duplicate files")
+
+    compared = {stage: (baseline, ratio, regressed) for stage, baseline, _, ratio, regressed in comparison or []}
+    for stage, timing in results['stages'].items():
+        line = f"  {stage:<10} {timing['best']:8.3f}s best  {timing['median']:8.3f}s median"
+        if stage in compared:
+            baseline, ratio, regressed = compared[stage]
+            line += f"  baseline {baseline:8.3f}s  x{ratio:.2f}{'  REGRESSION' if regressed else ''}"
+        print(line)
+
+    for stage, error in results['errors'].items():
+        print(f"  {stage:<10} {error.strip().splitlines()[-1]}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--preset', choices=PRESETS, default='small', help='Tree shape to generate')
+    parser.add_argument('--files', type=int, help='Override the file count of the preset')
+    parser.add_argument('--duplicate-ratio', type=float, help='Override the duplicate ratio of the preset')
+    parser.add_argument('--shared-prefix-ratio', type=float, help='Override the shared prefix ratio of the preset')
+    parser.add_argument('--depth', type=int, help='Override the directory depth of the preset')
+    parser.add_argument('--seed', type=int, help='Override the seed of the preset')
+    parser.add_argument('--stages', help='Comma separated subset of walk,prefix,samples,full,pandas,pipeline,worker')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=DEFAULT_HASH_WORKERS)
+    parser.add_argument('--algorithm', default=DEFAULT_HASH_ALGORITHM)
+    parser.add_argument('--tree-dir', help='Where to generate the tree, e.g. a tmpfs')
+    parser.add_argument('--output', default=str(RESULTS_DIR / 'latest.json'), help='Where to write the results')
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Also store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Relative slowdown that counts as a regression')
+    args = parser.parse_args(argv)
+
+    overrides = {'file_count': args.files, 'duplicate_ratio': args.duplicate_ratio,
+                 'shared_prefix_ratio': args.shared_prefix_ratio, 'depth': args.depth, 'seed': args.seed}
+    spec = PRESETS[args.preset]._replace(**{field: value for field, value in overrides.items() if value is not None})
+    stages = [stage for stage in args.stages.split(',') if stage] if args.stages else None
+
+    results = run_benchmark(spec, args.repeat, args.workers, args.algorithm, args.tree_dir, stages)
+    results['meta']['preset'] = args.preset
+
+    comparison = None
+    baseline_path = Path(args.baseline)
+    if baseline_path.exists() and not args.save_baseline:
+        with open(baseline_path, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('spec') != results['spec']:
+            print(f"warning: the baseline in {baseline_path} was measured on a different tree", file=sys.stderr)
+        comparison = compare_results(results, baseline, args.tolerance)
+
+    print_results(results, comparison)
+
+    output_paths = [Path(args.output)] + ([baseline_path] if args.save_baseline else [])
+    for output_path in output_paths:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, indent=4)
+
+    return 1 if comparison and any(regressed for *_, regressed in comparison) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Deterministic synthetic directory trees for the benchmarks.
+
+The same TreeSpec and seed always produce the same paths and the same content, so
+two benchmark runs (or two machines) measure exactly the same work.
+
+Every file is one of:
+    unique          random content
+    duplicate       a byte-identical copy of an earlier file
+    shared prefix   same size and the same first 'prefix_size' bytes as an earlier file,
+                    different afterwards; it survives the size and first-chunk stages
+                    and is only eliminated by sampling or the full hash
+
+Run from the repository root to create a tree by hand:
+    python -m benchmarks.synthetic_tree /tmp/tree --files 5000 --duplicate-ratio 0.2
+"""
+import os
+import json
+import random
+import argparse
+from collections import namedtuple, Counter
+
+from backend.scan_filter import DEFAULT_MIN_SIZE
+
+TreeSpec = namedtuple('TreeSpec', ['file_count', 'min_size', 'max_size', 'duplicate_ratio', 'shared_prefix_ratio',
+                                   'depth', 'fanout', 'prefix_size', 'seed'])
+
+CONTENT_BLOCK_SIZE = 64 * 1024
+
+# Sizes are drawn log-uniformly, most files are small like on a real disk
+PRESETS = {
+    'small': TreeSpec(file_count=2000, min_size=512, max_size=256 * 1024, duplicate_ratio=0.2,
+                      shared_prefix_ratio=0.1, depth=3, fanout=4, prefix_size=4096, seed=1),
+    'medium': TreeSpec(file_count=20000, min_size=512, max_size=2 * 1024 * 1024, duplicate_ratio=0.2,
+                       shared_prefix_ratio=0.1, depth=4, fanout=5, prefix_size=4096, seed=1),
+    'large-files': TreeSpec(file_count=200, min_size=8 * 1024 * 1024, max_size=128 * 1024 * 1024, duplicate_ratio=0.3,
+                            shared_prefix_ratio=0.3, depth=2, fanout=3, prefix_size=4096, seed=1),
+}
+
+def get_directories(spec):
+    """Returns the relative paths of every directory of a tree 'depth' levels deep with 'fanout' children each."""
+    directories = ['']
+    level = ['']
+    for depth in range(spec.depth):
+        level = [os.path.join(parent, f"d{depth}_{index}") for parent in level for index in range(spec.fanout)]
+        directories.extend(level)
+    return directories
+
+def _random_size(rng, spec):
+    if spec.min_size >= spec.max_size:
+        return spec.min_size
+    # Rounded to 512 so that sizes collide like they do for real files
+    size = int(spec.min_size * (spec.max_size / spec.min_size) ** rng.random())
+    return max(spec.min_size, size - size % 512)
+
+def plan_tree(spec):
+    """
+    Plans the files of a tree without writing anything.
+
+    Returns:
+        list: (relative path, kind, size, content seed, source index) per file. 'source index' is the
+              file a duplicate copies or a shared prefix file shares its prefix with, else None.
+    """
+    rng = random.Random(spec.seed)
+    directories = get_directories(spec)
+    plan = []
+    originals = []
+
+    for index in range(spec.file_count):
+        directory = rng.choice(directories)
+        path = os.path.join(directory, f"f{index:07d}.bin")
+        roll = rng.random()
+
+        if originals and roll < spec.duplicate_ratio:
+            source = rng.choice(originals)
+            plan.append((path, 'duplicate', plan[source][2], plan[source][3], source))
+            continue
+
+        if originals and roll < spec.duplicate_ratio + spec.shared_prefix_ratio:
+            source = rng.choice(originals)
+            # A file no longer than the shared prefix would be an exact copy
+            if plan[source][2] > spec.prefix_size:
+                plan.append((path, 'shared prefix', plan[source][2], rng.getrandbits(64), source))
+                continue
+
+        originals.append(len(plan))
+        plan.append((path, 'unique', _random_size(rng, spec), rng.getrandbits(64), None))
+
+    return plan
+
+def _content(size, content_seed):
+    """Random content built from whole blocks, so a shorter call returns a prefix of a longer one."""
+    rng = random.Random(content_seed)
+    block_count = -(-size // CONTENT_BLOCK_SIZE)
+    return b''.join(rng.randbytes(CONTENT_BLOCK_SIZE) for _ in range(block_count))[:size]
+
+def generate_tree(root, spec):
+    """
+    Writes the tree described by 'spec' under 'root'.
+
+    Returns:
+        dict: Counts of the generated files and bytes, and the duplicate groups and files a scan
+              with the default minimum size must find.
+    """
+    plan = plan_tree(spec)
+    for directory in get_directories(spec):
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    for path, kind, size, content_seed, source in plan:
+        if kind == 'shared prefix':
+            data = _content(spec.prefix_size, plan[source][3]) + _content(size - spec.prefix_size, content_seed)
+        else:
+            data = _content(size, content_seed)
+        with open(os.path.join(root, path), 'wb') as file_object:
+            file_object.write(data)
+
+    group_sizes = Counter(source for _, kind, size, _, source in plan if kind == 'duplicate' and size >= DEFAULT_MIN_SIZE)
+    kinds = Counter(entry[1] for entry in plan)
+    return {
+        'files': len(plan),
+        'bytes': sum(entry[2] for entry in plan),
+        'unique': kinds['unique'],
+        'duplicate copies': kinds['duplicate'],
+        'shared prefix': kinds['shared prefix'],
+        'expected duplicate groups': len(group_sizes),
+        # Every group also holds its original
+        'expected duplicate files': sum(count + 1 for count in group_sizes.values()),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('root', help='Directory to create the tree in')
+    parser.add_argument('--preset', choices=PRESETS, default='small')
+    for field in TreeSpec._fields:
+        parser.add_argument('--' + field.replace('_', '-').replace('file-count', 'files'), dest=field,
+                            type=float if field.endswith('ratio') else int)
+    args = parser.parse_args()
+
+    spec = PRESETS[args.preset]._replace(**{field: getattr(args, field) for field in TreeSpec._fields
+                                            if getattr(args, field) is not None})
+    print(json.dumps({'spec': spec._asdict(), 'tree': generate_tree(args.root, spec)}, indent=4))
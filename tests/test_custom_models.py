@@ -0,0 +1,72 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtCore = pytest.importorskip('PySide6.QtCore')
+
+from backend.custom_models import PandasModel
+
+@pytest.fixture(scope='module')
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+@pytest.fixture
+def dataframe():
+    return pd.DataFrame({
+        'FilePath': [f"/data/file{index:02d}" for index in range(25)],
+        'Size In Bytes': [(index * 7) % 10 for index in range(25)],
+        'Hash': pd.Categorical(['b', 'a', 'c', 'b', 'a'] * 5, categories=['c', 'b', 'a']),
+    })
+
+def get_column(model, column):
+    return [model.data(model.index(row, column), QtCore.Qt.DisplayRole) for row in range(model.rowCount())]
+
+def wait_for_sort(app, model, column, order=QtCore.Qt.AscendingOrder):
+    finished = []
+    model.sortingFinished.connect(lambda: finished.append(True))
+    model.sort(column, order)
+    deadline = time.monotonic() + 5
+    while not finished and time.monotonic() < deadline:
+        app.processEvents()
+    assert finished
+
+def test_rows_are_fetched_in_batches(app, dataframe):
+    model = PandasModel(dataframe, fetch_batch=10)
+    assert (model.rowCount(), model.columnCount()) == (10, 3)
+    model.fetchMore()
+    model.fetchMore()
+    assert model.rowCount() == 25 and not model.canFetchMore()
+    assert PandasModel(dataframe, fetch_batch=None).rowCount() == 25
+
+def test_cells_and_headers(app, dataframe):
+    model = PandasModel(dataframe, fetch_batch=None)
+    assert get_column(model, 0)[:2] == ['/data/file00', '/data/file01']
+    assert get_column(model, 1)[:3] == ['0', '7', '4']
+    assert get_column(model, 2)[:3] == ['b', 'a', 'c']
+    assert model.headerData(1, QtCore.Qt.Horizontal, QtCore.Qt.DisplayRole) == 'Size In Bytes'
+    assert model.headerData(0, QtCore.Qt.Vertical, QtCore.Qt.DisplayRole) == '1'
+
+def test_sort_never_reorders_the_dataframe(app, dataframe):
+    model = PandasModel(dataframe, fetch_batch=None)
+    wait_for_sort(app, model, 1, QtCore.Qt.DescendingOrder)
+    assert get_column(model, 1) == sorted(get_column(model, 1), reverse=True)
+    assert dataframe['FilePath'].iloc[0] == '/data/file00'
+
+    # Categoricals sort by their text, not by the order of their categories
+    wait_for_sort(app, model, 2)
+    assert get_column(model, 2) == sorted(get_column(model, 2))
+
+def test_filters_keep_the_sort_order(app, dataframe):
+    model = PandasModel(dataframe, fetch_batch=None)
+    wait_for_sort(app, model, 1)
+    model.set_filter('Hash', 'a')
+    assert get_column(model, 2) == ['a'] * 10
+    assert get_column(model, 1) == sorted(get_column(model, 1))
+    rows = [model.get_source_row(row) for row in range(model.rowCount())]
+    assert all(dataframe['Hash'].iloc[row] == 'a' for row in rows)
+
+    model.set_filter('Hash', '')
+    assert model.rowCount() == 25
@@ -0,0 +1,64 @@
+import os
+
+from backend.dir_snapshot import DirectorySnapshot, get_roots_name
+from backend.duplicates_checker import DuplicatePipeline
+from backend.file_walker import ParallelWalker
+from backend.scan_filter import ScanFilter
+
+def write_tree(root, contents):
+    for name, data in contents.items():
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_bytes(data)
+
+def walk(root, snapshot=None, scan_filter=None):
+    walker = ParallelWalker(str(root), snapshot=snapshot, record_snapshot=True, scan_filter=scan_filter)
+    files = sorted((path, file_stat.st_size) for path, file_stat in walker.walk())
+    return walker, files
+
+def test_save_and_load(tmp_path):
+    root = tmp_path / 'root'
+    write_tree(root, {'a': b'a' * 2000, 'sub/b': b'b' * 3000})
+    walker, _ = walk(root)
+    walker.new_snapshot.save(tmp_path / 'snapshots')
+
+    loaded = DirectorySnapshot.load(str(root), tmp_path / 'snapshots')
+    assert loaded.directories == walker.new_snapshot.directories
+    assert DirectorySnapshot.load(str(tmp_path), tmp_path / 'snapshots') is None
+
+def test_lookup_needs_the_same_mtime(tmp_path):
+    write_tree(tmp_path, {'a': b'a' * 2000})
+    walker, _ = walk(tmp_path)
+    mtime_ns = os.stat(tmp_path).st_mtime_ns
+    assert walker.new_snapshot.lookup(str(tmp_path), mtime_ns) is not None
+    assert walker.new_snapshot.lookup(str(tmp_path), mtime_ns + 1) is None
+
+def test_unchanged_directories_are_reused(tmp_path):
+    write_tree(tmp_path, {'a': b'a' * 2000, 'sub/b': b'b' * 3000})
+    first_walker, first_files = walk(tmp_path)
+    (tmp_path / 'c').write_bytes(b'c' * 4000)
+
+    walker, files = walk(tmp_path, first_walker.new_snapshot)
+    assert files == sorted(first_files + [(str(tmp_path / 'c'), 4000)])
+    # The root changed, 'sub' did not
+    assert (walker.dirs_reused, walker.dirs_scanned) == (1, 2)
+
+def test_files_edited_in_place_are_stat_again(tmp_path):
+    write_tree(tmp_path, {'a': b'a' * 2000, 'b': b'a' * 2000, 'c': b'c' * 4000})
+    # The snapshot of a walk with the filter of the pipeline
+    first_walker, _ = walk(tmp_path, scan_filter=ScanFilter())
+    # Rewriting a file leaves the mtime of its directory alone
+    with open(tmp_path / 'c', 'r+b') as file_object:
+        file_object.write(b'a' * 2000)
+        file_object.truncate()
+
+    pipeline = DuplicatePipeline(str(tmp_path), snapshot=first_walker.new_snapshot)
+    list(pipeline.run())
+    assert pipeline.walker.dirs_reused == 1
+    assert [files for _, _, _, files in pipeline.get_duplicate_groups()] == \
+        [[str(tmp_path / 'a'), str(tmp_path / 'b'), str(tmp_path / 'c')]]
+    assert list(pipeline.get_columns().sizes) == [2000, 2000, 2000]
+
+def test_roots_name():
+    assert get_roots_name('/data/photos') != get_roots_name('/backup/photos')
+    assert get_roots_name('/data/photos').startswith('photos-')
+    assert get_roots_name(['/data/photos', '/backup']).startswith('photos+1-')
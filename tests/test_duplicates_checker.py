@@ -0,0 +1,199 @@
+import os
+import time
+import random
+import hashlib
+
+import pytest
+
+from backend.duplicates_checker import (map_in_order, hash_files, get_hash, find_duplicate_files, refine_by_samples,
+                                        get_stage_sample_hash, SAMPLE_BLOCK_SIZE, search_duplicate_files,
+                                        DuplicatePipeline)
+from backend.hash_cache import HashCache
+from backend.hash_algorithms import HASH_ALGORITHMS
+
+def write_files(directory, contents):
+    """Writes every {name: bytes} entry under 'directory' and returns the paths by name."""
+    paths = {}
+    for name, data in contents.items():
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        paths[name] = str(path)
+    return paths
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_map_in_order_keeps_input_order(workers):
+    def slow_square(number):
+        # Later items finish first
+        time.sleep(random.random() / 1000)
+        return number * number
+
+    assert list(map_in_order(slow_square, range(50), workers)) == [(number, number * number) for number in range(50)]
+
+def test_map_in_order_raises_errors():
+    def fail_on_three(number):
+        if number == 3:
+            raise RuntimeError(number)
+        return number
+
+    with pytest.raises(RuntimeError):
+        list(map_in_order(fail_on_three, range(10), workers=2))
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_hash_files(tmp_path, workers):
+    contents = {f"file{index}": os.urandom(3000 + index) for index in range(20)}
+    paths = write_files(tmp_path, contents)
+    filenames = [paths[name] for name in sorted(contents)]
+
+    hashed = list(hash_files(filenames, workers=workers, hash_algorithm='sha256'))
+    assert hashed == [(paths[name], hashlib.sha256(contents[name]).digest()) for name in sorted(contents)]
+
+    first_chunks = list(hash_files(filenames, first_chunk_only=True, workers=workers, hash_algorithm='sha256'))
+    assert first_chunks == [(paths[name], hashlib.sha256(contents[name][:2048]).digest()) for name in sorted(contents)]
+
+def test_hash_files_yields_none_for_unreadable_files(tmp_path):
+    paths = write_files(tmp_path, {'a': b'a' * 2000})
+    missing = str(tmp_path / 'missing')
+    assert list(hash_files([missing, paths['a']], workers=2, hash_algorithm='sha256')) == \
+        [(missing, None), (paths['a'], hashlib.sha256(b'a' * 2000).digest())]
+
+class ConstantHash():
+    """A pre-filter hash where every file collides."""
+    name = 'constant'
+
+    def update(self, data):
+        pass
+
+    def digest(self):
+        return b'c' * 16
+
+def ignore_progress(progress, total):
+    pass
+
+def test_get_hash_accepts_a_name_or_a_constructor(tmp_path):
+    paths = write_files(tmp_path, {'a': b'a' * 3000})
+    assert get_hash(paths['a'], hash_algorithm='sha256') == get_hash(paths['a'], hash_algorithm=hashlib.sha256) == \
+        hashlib.sha256(b'a' * 3000).digest()
+
+def test_tiered_mode_confirms_fast_hash_collisions(tmp_path, monkeypatch):
+    monkeypatch.setitem(HASH_ALGORITHMS, 'constant', ConstantHash)
+    paths = write_files(tmp_path, {'a': b'a' * 3000, 'b': b'a' * 3000, 'c': b'c' * 3000})
+    hashes_on_1k = {b'prefix': [paths['a'], paths['b'], paths['c']]}
+
+    columns = find_duplicate_files(hashes_on_1k, ignore_progress, hash_algorithm='constant', hash_1k_algorithm='sha1')
+    assert {columns.digests[row] for row in range(len(columns))} == {b'c' * 16}
+    assert {columns.algorithms[row] for row in range(len(columns))} == {'constant'}
+
+    columns = find_duplicate_files(hashes_on_1k, ignore_progress, hash_algorithm='constant', confirm_algorithm='sha256',
+                                   hash_1k_algorithm='sha1')
+    digests = dict(zip(columns.paths, (columns.digests[row] for row in range(len(columns)))))
+    assert digests == {paths['a']: hashlib.sha256(b'a' * 3000).digest(), paths['b']: hashlib.sha256(b'a' * 3000).digest(),
+                       paths['c']: hashlib.sha256(b'c' * 3000).digest()}
+    assert {columns.algorithms[row] for row in range(len(columns))} == {'sha256'}
+    assert {columns.prefix_algorithms[row] for row in range(len(columns))} == {'sha1'}
+
+def test_refine_by_samples_drops_files_differing_outside_the_first_chunk(tmp_path):
+    size = 200 * 1024
+    base = bytearray(b'x' * size)
+    other_tail = bytearray(base)
+    other_tail[-1:] = b'y'
+    other_middle = bytearray(base)
+    other_middle[size // 2] = ord('y')
+    paths = write_files(tmp_path, {'a': bytes(base), 'b': bytes(base), 'tail': bytes(other_tail),
+                                   'middle': bytes(other_middle), 'small1': b's' * 1500, 'small2': b's' * 1500})
+    hashes_on_1k = {b'big': [paths['a'], paths['b'], paths['tail'], paths['middle']],
+                    b'small': [paths['small1'], paths['small2']]}
+
+    refined, stage_stats = refine_by_samples(hashes_on_1k, ignore_progress, hash_algorithm='sha256')
+    assert {key: sorted(files) for key, files in refined.items()} == \
+        {b'big': [paths['a'], paths['b']], b'small': [paths['small1'], paths['small2']]}
+    assert stage_stats == [{'stage': 'tail', 'files_in': 6, 'files_out': 5, 'eliminated': 1},
+                           {'stage': 'middle', 'files_in': 5, 'files_out': 4, 'eliminated': 1}]
+
+def test_stage_sample_hash_is_cached(tmp_path):
+    data = os.urandom(100 * 1024)
+    paths = write_files(tmp_path, {'a': data})
+    with HashCache(tmp_path / 'hash_cache.sqlite3') as cache:
+        digest = get_stage_sample_hash(paths['a'], 'tail', hash_algorithm='sha256', cache=cache)
+        assert digest == hashlib.sha256(data[-SAMPLE_BLOCK_SIZE:]).digest()
+        assert cache.get_sample(os.stat(paths['a']), 'sha256', f"tail:{SAMPLE_BLOCK_SIZE}") == digest
+
+def test_hardlinks_are_not_duplicates_of_each_other(tmp_path, tmp_path_factory):
+    root = tmp_path / 'root'
+    paths = write_files(root, {'a': b'a' * 3000, 'copy': b'a' * 3000})
+    os.link(paths['a'], root / 'link')
+    external = tmp_path_factory.mktemp('outside') / 'external'
+    os.link(paths['copy'], external)
+
+    columns = search_duplicate_files(str(root), hash_algorithm='sha256')
+    assert sorted(columns.paths) == [paths['a'], paths['copy']]
+    rows = {path: row for row, path in enumerate(columns.paths)}
+    assert columns.aliases[rows[paths['a']]] == str(root / 'link')
+    assert columns.external_links[rows[paths['a']]] == 0
+    assert columns.external_links[rows[paths['copy']]] == 1
+
+def test_a_file_and_its_hardlink_alone_are_no_duplicates(tmp_path):
+    paths = write_files(tmp_path, {'a': b'a' * 3000})
+    os.link(paths['a'], tmp_path / 'b')
+    assert len(search_duplicate_files(str(tmp_path))) == 0
+
+@pytest.fixture
+def duplicates_tree(tmp_path):
+    """Groups of 2 and 3 copies next to files that only share their size, first chunk or tail."""
+    size = 100 * 1024
+    base = os.urandom(size)
+    other_middle = bytearray(base)
+    other_middle[size // 2] ^= 1
+    contents = {'a/one': base, 'b/one': base, 'c/d/one': base, 'middle': bytes(other_middle),
+                'two': b'2' * 5000, 'a/two': b'2' * 5000, 'same_size': b'3' * 5000,
+                'unique': os.urandom(7000), 'small': b'x' * 100, 'a/small': b'x' * 100}
+    write_files(tmp_path, contents)
+    return tmp_path
+
+def get_groups(columns):
+    groups = {}
+    for row, path in enumerate(columns.paths):
+        groups.setdefault(columns.digests[row], []).append(path)
+    return sorted(sorted(files) for files in groups.values() if len(files) >= 2)
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_pipeline_finds_the_groups_of_the_staged_scan(duplicates_tree, workers):
+    root = str(duplicates_tree)
+    pipeline = DuplicatePipeline(root, workers=workers, hash_algorithm='sha256')
+    latest = {}
+    for digest, algorithm, size, files in pipeline.run():
+        latest[digest] = (algorithm, size, sorted(files))
+
+    expected = get_groups(search_duplicate_files(root, workers=workers, hash_algorithm='sha256'))
+    assert expected == [[os.path.join(root, 'a', 'one'), os.path.join(root, 'b', 'one'), os.path.join(root, 'c', 'd', 'one')],
+                        [os.path.join(root, 'a', 'two'), os.path.join(root, 'two')]]
+    # The last update of every digest is its complete group
+    assert sorted(files for _, _, files in latest.values()) == expected
+    assert sorted(files for _, _, _, files in pipeline.get_duplicate_groups()) == expected
+    assert sorted((algorithm, size) for algorithm, size, _ in latest.values()) == [('sha256', 5000), ('sha256', 100 * 1024)]
+    assert get_groups(pipeline.get_columns()) == expected
+
+def test_pipeline_stage_stats(duplicates_tree):
+    pipeline = DuplicatePipeline(str(duplicates_tree), hash_algorithm='sha256')
+    list(pipeline.run())
+    stats = {stats['stage']: stats for stats in pipeline.get_stage_stats()}
+    assert [stage for stage in stats] == ['prefix', 'tail', 'middle', 'full']
+    # Files smaller than 1 KB are never walked, 'unique' has no other file of its size
+    assert pipeline.file_count == 8
+    assert stats['prefix']['files_in'] == 7
+    assert stats['prefix']['eliminated'] == 1
+    assert stats['middle']['eliminated'] == 1
+    assert stats['full']['files_out'] == 5
+
+def test_duplicates_are_found_across_roots(tmp_path):
+    paths = write_files(tmp_path, {'photos/a': b'a' * 3000, 'backup/a': b'a' * 3000, 'backup/b': b'b' * 3000,
+                                   'photos/b': b'c' * 3000})
+    roots = [str(tmp_path / 'photos'), str(tmp_path / 'backup')]
+
+    columns = search_duplicate_files(roots)
+    assert get_groups(columns) == [[paths['backup/a'], paths['photos/a']]]
+    assert dict(zip(columns.paths, (columns.roots[row] for row in range(len(columns))))) == \
+        {paths['photos/a']: roots[0], paths['backup/a']: roots[1]}
+
+    pipeline = DuplicatePipeline(roots)
+    assert [set(pipeline.get_root(filename) for filename in files) for _, _, _, files in pipeline.run()] == [set(roots)]
@@ -0,0 +1,118 @@
+import os
+import hashlib
+
+import pytest
+
+from backend.file_actions import (ActionJournal, FileActionExecutor, MOVE, DELETE, HARDLINK, DONE, MISSING, FAILED,
+                                  UNDONE, UNDO_FAILED)
+from backend.scan_control import ScanControl, WorkerKilledException
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(content)
+
+def read(path):
+    with open(path, encoding='utf-8') as file:
+        return file.read()
+
+@pytest.fixture
+def sources(tmp_path):
+    # Two pairs of files with the same name in different folders
+    paths = [str(tmp_path / 'scan' / f"dir{index % 2}" / ('same_name' if index < 2 else 'other')) for index in range(4)]
+    for index, path in enumerate(paths):
+        write(path, f"content {index}")
+    return paths
+
+def create_move(tmp_path, sources):
+    return ActionJournal.create(MOVE, sources, str(tmp_path / 'bin'), journal_dir=tmp_path / 'journals')
+
+def test_targets_are_free_and_distinct(tmp_path, sources):
+    write(str(tmp_path / 'bin' / 'same_name'), 'already there')
+    journal = create_move(tmp_path, sources)
+    assert len({target.casefold() for target in journal.targets}) == len(sources)
+    assert str(tmp_path / 'bin' / 'same_name') not in journal.targets
+
+def test_move_and_undo(tmp_path, sources):
+    journal = create_move(tmp_path, sources)
+    FileActionExecutor(journal).run()
+    assert journal.statuses == [DONE] * 4
+    assert [read(target) for target in journal.targets] == [f"content {index}" for index in range(4)]
+    assert not any(os.path.exists(source) for source in sources)
+
+    FileActionExecutor(journal).undo()
+    assert journal.statuses == [UNDONE] * 4
+    assert [read(source) for source in sources] == [f"content {index}" for index in range(4)]
+
+def test_journal_reloads_outcomes(tmp_path, sources):
+    journal = create_move(tmp_path, sources)
+    os.remove(sources[2])
+    FileActionExecutor(journal).run()
+
+    loaded = ActionJournal.load(journal.path)
+    assert loaded.sources == journal.sources and loaded.targets == journal.targets
+    assert loaded.statuses == [DONE, DONE, MISSING, DONE]
+    assert loaded.get_pending() == []
+
+def test_cancelled_run_resumes_from_the_journal(tmp_path, sources):
+    journal = create_move(tmp_path, sources)
+    control = ScanControl()
+
+    def cancel_after_first_batch(done, total):
+        control.cancel()
+
+    with pytest.raises(WorkerKilledException):
+        FileActionExecutor(journal, control=control, progress_callback=cancel_after_first_batch, batch_size=1).run()
+    assert journal.get_counts()[DONE] == 1
+
+    resumed = ActionJournal.load(journal.path)
+    assert len(resumed.get_pending()) == 3
+    FileActionExecutor(resumed).run()
+    assert resumed.statuses == [DONE] * 4
+    assert ActionJournal.load(journal.path).statuses == [DONE] * 4
+
+def test_move_never_replaces_a_file_on_the_target(tmp_path, sources):
+    journal = create_move(tmp_path, sources)
+    # A file took a planned name after the journal was created
+    write(journal.targets[1], 'precious')
+    FileActionExecutor(journal).run()
+
+    assert journal.statuses == [DONE, FAILED, DONE, DONE]
+    assert read(journal.targets[1]) == 'precious'
+    assert read(sources[1]) == 'content 1'
+
+def test_resume_after_link_before_unlink(tmp_path, sources):
+    journal = create_move(tmp_path, sources)
+    # Interrupted after the target was linked, before the source was removed
+    os.link(sources[0], journal.targets[0])
+    FileActionExecutor(journal).run()
+    assert journal.statuses[0] == DONE
+    assert not os.path.exists(sources[0]) and read(journal.targets[0]) == 'content 0'
+
+def test_undo_leaves_a_file_that_took_the_place(tmp_path, sources):
+    journal = create_move(tmp_path, sources)
+    FileActionExecutor(journal).run()
+    write(sources[0], 'newer file')
+    FileActionExecutor(journal).undo()
+    assert journal.statuses[0] == UNDO_FAILED
+    assert read(sources[0]) == 'newer file' and read(journal.targets[0]) == 'content 0'
+
+def test_delete(tmp_path, sources):
+    journal = ActionJournal.create(DELETE, sources[:2], journal_dir=tmp_path / 'journals')
+    FileActionExecutor(journal).run()
+    assert journal.statuses == [DONE, DONE]
+    assert not os.path.exists(sources[0]) and journal.get_undoable() == []
+
+def test_hardlink_verifies_both_files(tmp_path):
+    kept, duplicate, changed = (str(tmp_path / name) for name in ('kept', 'duplicate', 'changed'))
+    for path in (kept, duplicate, changed):
+        write(path, 'same content')
+    digest = ['sha256', hashlib.sha256(b'same content').hexdigest()]
+    journal = ActionJournal.create(HARDLINK, [duplicate, changed], journal_dir=tmp_path / 'journals',
+                                   targets=[kept, kept], hashes=[digest, digest])
+    write(changed, 'changed since the scan')
+    FileActionExecutor(journal).run()
+
+    assert journal.statuses == [DONE, FAILED]
+    assert os.path.samefile(kept, duplicate)
+    assert not os.path.samefile(kept, changed) and read(changed) == 'changed since the scan'
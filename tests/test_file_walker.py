@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from backend.file_walker import ParallelWalker, scan_directory, normalize_roots, get_root_of
+from backend.duplicates_checker import get_files_by_size
+
+@pytest.fixture
+def tree(tmp_path):
+    """Three levels of directories, files of 1, 2 and 3 KB."""
+    for index in range(30):
+        directory = tmp_path / f"d{index % 3}" / f"e{index % 5}"
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"f{index}").write_bytes(b'x' * 1024 * (index % 3 + 1))
+    (tmp_path / 'top').write_bytes(b'y' * 1024)
+    return tmp_path
+
+def list_tree(root):
+    return sorted(os.path.join(directory, name) for directory, _, names in os.walk(root) for name in names)
+
+@pytest.mark.parametrize('workers', [1, 8])
+def test_walk_lists_every_file_once(tree, workers):
+    walker = ParallelWalker(str(tree), workers=workers)
+    walked = [path for path, _ in walker.walk()]
+    assert sorted(walked) == list_tree(tree)
+    assert walker.files_seen == 31
+    assert walker.dirs_scanned == 1 + 3 + 15
+    assert walker.estimated_total() == 31
+
+def test_walk_returns_the_stat_of_every_file(tree):
+    for path, file_stat in ParallelWalker(str(tree)).walk():
+        assert file_stat.st_size == os.path.getsize(path)
+
+def test_symlinked_directories_are_not_followed(tree, tmp_path_factory):
+    outside = tmp_path_factory.mktemp('outside')
+    (outside / 'hidden').write_bytes(b'z' * 1024)
+    os.symlink(outside, tree / 'link')
+    assert all(not path.startswith(str(tree / 'link')) for path, _ in ParallelWalker(str(tree)).walk())
+
+def test_unreadable_directory_is_skipped(tmp_path):
+    assert scan_directory(str(tmp_path / 'missing'))[:2] == ([], [])
+
+def test_get_files_by_size(tree):
+    progress = []
+    files_by_size, file_count, total, aliases = get_files_by_size(str(tree), lambda *args: progress.append(args))
+    assert file_count == total == 31
+    assert sorted(files_by_size) == [1024, 2048, 3072]
+    assert sum(len(files) for files in files_by_size.values()) == 31
+    assert all(files == sorted(files) for files in files_by_size.values())
+    assert progress[-1] == (31, 31)
+    assert aliases == {}
+
+def test_hardlinks_are_listed_once_with_aliases(tmp_path):
+    (tmp_path / 'b').write_bytes(b'x' * 1024)
+    os.link(tmp_path / 'b', tmp_path / 'a')
+    os.link(tmp_path / 'b', tmp_path / 'c')
+    walker = ParallelWalker(str(tmp_path))
+    assert [path for path, _ in walker.walk()] == [str(tmp_path / 'a')]
+    assert walker.aliases == {str(tmp_path / 'a'): [str(tmp_path / 'b'), str(tmp_path / 'c')]}
+
+def test_symlinked_files_are_listed_by_their_real_path(tmp_path, tmp_path_factory):
+    (tmp_path / 'real').write_bytes(b'x' * 1024)
+    os.symlink(tmp_path / 'real', tmp_path / 'inside')
+    outside = tmp_path_factory.mktemp('outside') / 'target'
+    outside.write_bytes(b'y' * 1024)
+    os.symlink(outside, tmp_path / 'to_outside')
+    walker = ParallelWalker(str(tmp_path))
+    # The symlink into the root is the file the walk already lists
+    assert sorted(path for path, _ in walker.walk()) == sorted([str(tmp_path / 'real'), os.path.realpath(outside)])
+    assert walker.aliases == {}
+
+def test_normalize_roots_drops_overlapping_roots(tmp_path):
+    (tmp_path / 'a' / 'inner').mkdir(parents=True)
+    (tmp_path / 'b').mkdir()
+    os.symlink(tmp_path / 'b', tmp_path / 'b_link')
+    roots = normalize_roots([str(tmp_path / 'b'), str(tmp_path / 'a' / 'inner'), str(tmp_path / 'a'),
+                             str(tmp_path / 'b_link')])
+    assert roots == [os.path.realpath(tmp_path / 'a'), os.path.realpath(tmp_path / 'b')]
+    # A sibling sharing the name prefix is not inside the root
+    assert normalize_roots([str(tmp_path / 'a'), str(tmp_path / 'ab')]) == \
+        [os.path.realpath(tmp_path / 'a'), os.path.realpath(tmp_path / 'ab')]
+
+def test_get_root_of():
+    roots = ['/data/a', '/data/b']
+    assert get_root_of('/data/b/file', roots) == '/data/b'
+    assert get_root_of('/data/a', roots) == '/data/a'
+    assert get_root_of('/data/ab/file', roots) is None
+
+def test_walk_several_roots(tmp_path):
+    for root in ('a', 'b'):
+        (tmp_path / root).mkdir()
+        (tmp_path / root / 'file').write_bytes(b'x' * 1024)
+    walker = ParallelWalker([str(tmp_path / 'b'), str(tmp_path / 'a'), str(tmp_path / 'a')])
+    assert sorted(path for path, _ in walker.walk()) == [str(tmp_path / 'a' / 'file'), str(tmp_path / 'b' / 'file')]
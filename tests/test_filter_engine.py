@@ -0,0 +1,72 @@
+import re
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.filter_engine import FilterEngine, NgramIndex, CONTAINS, EXACT, REGEX
+
+@pytest.fixture
+def dataframe():
+    return pd.DataFrame({
+        'FilePath': ['/Photos/IMG_001.jpg', '/photos/img_002.JPG', '/docs/report.pdf', '/docs/photo_notes.txt'],
+        'Size In Bytes': [1024, 2048, 1024, 4096],
+        'Hash': pd.Categorical(['aa', 'aa', 'bb', 'cc']),
+    })
+
+def test_modes(dataframe):
+    engine = FilterEngine(dataframe)
+    engine.set_filter('FilePath', 'PHOTO')
+    assert engine.get_rows().tolist() == [0, 1, 3]
+    engine.set_filter('FilePath', r'img_\d+\.jpg$', REGEX)
+    assert engine.get_rows().tolist() == [0, 1]
+    engine.set_filter('FilePath', '/docs/report.pdf', EXACT)
+    assert engine.get_rows().tolist() == [2]
+
+def test_filters_on_several_columns(dataframe):
+    engine = FilterEngine(dataframe)
+    assert engine.set_filter('FilePath', 'photo')
+    assert not engine.set_filter('FilePath', 'photo')
+    engine.set_filter('Size In Bytes', '1024', EXACT)
+    engine.set_filter('Hash', 'a')
+    assert (len(engine), engine.get_rows().tolist()) == (3, [0])
+    assert engine.clear_filter('Size In Bytes')
+    assert engine.get_rows().tolist() == [0, 1]
+    assert engine.set_filter('Hash', '')
+    assert engine.get_rows().tolist() == [0, 1, 3]
+    assert engine.clear() and engine.get_mask() is None
+
+def test_extending_a_filter_only_checks_previous_matches(dataframe):
+    engine = FilterEngine(dataframe)
+    engine.set_filter('FilePath', 'photo')
+    engine.set_filter('FilePath', 'photos/')
+    assert engine.get_rows().tolist() == [0, 1]
+    # Shortening the text widens the matches again
+    engine.set_filter('FilePath', 'o')
+    assert engine.get_rows().tolist() == [0, 1, 2, 3]
+
+def test_invalid_regex_keeps_the_previous_filter(dataframe):
+    engine = FilterEngine(dataframe)
+    engine.set_filter('FilePath', 'docs')
+    with pytest.raises(re.error):
+        engine.set_filter('FilePath', '(', REGEX)
+    assert engine.filters == {'FilePath': ('docs', CONTAINS)}
+    assert engine.get_rows().tolist() == [2, 3]
+
+def test_ngram_index_matches_a_column_scan():
+    rng = random.Random(3)
+    alphabet = 'abcdeABCDE/_.é'
+    strings = [''.join(rng.choice(alphabet) for _ in range(rng.randrange(0, 30))) for _ in range(3000)]
+    index = NgramIndex(np.array(strings, dtype=object), chunk_rows=500)
+    for query in ['abc', 'ABc', 'a/b_', 'éa', 'xyz', 'e.d/a', 'cab']:
+        expected = [row for row, text in enumerate(strings) if query.lower() in text.lower()]
+        assert index.search(query).tolist() == expected
+    assert index.search('ab') is None
+
+def test_large_columns_use_the_ngram_index():
+    paths = [f"/root/dir{index % 17}/file{index}.bin" for index in range(500)]
+    engine = FilterEngine(pd.DataFrame({'FilePath': paths}), ngram_columns=['FilePath'], ngram_min_rows=100)
+    engine.set_filter('FilePath', 'DIR3/')
+    assert engine._ngram_indexes
+    assert engine.get_rows().tolist() == [row for row, path in enumerate(paths) if 'dir3/' in path]
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from backend.group_index import GroupIndex, factorize_digests
+from backend.result_columns import DigestColumn
+
+def make_digests(digests):
+    column = DigestColumn()
+    for digest in digests:
+        column.append(digest)
+    return column
+
+def test_factorize_digests_orders_codes_by_digest():
+    codes, keys = factorize_digests(make_digests([b'\x02' * 4, b'\x01' * 4, b'\x02' * 4]))
+    assert codes.tolist() == [1, 0, 1]
+    assert keys == ['01010101', '02020202']
+    assert factorize_digests(make_digests([]))[0].tolist() == []
+
+def test_factorize_digests_of_different_lengths():
+    # The short digest is padded with zeros to the width of the long one
+    codes, keys = factorize_digests(make_digests([b'\x01', b'\x01\x00', b'\x01']))
+    assert codes[0] == codes[2] != codes[1]
+    assert sorted(keys) == ['01', '0100']
+
+@pytest.fixture
+def index():
+    # Group 'a' of three rows, 'b' of two rows, one of them hardlinked from outside the scan
+    codes, keys = factorize_digests(make_digests([b'a', b'b', b'a', b'b', b'a']))
+    sizes = np.array([100, 200, 100, 200, 130], dtype=np.int64)
+    external_links = np.array([0, 1, 0, 0, 0], dtype=np.int64)
+    return GroupIndex(codes, keys, sizes, external_links)
+
+def test_rows_and_summary(index):
+    assert index.get_rows(b'a'.hex()).tolist() == [0, 2, 4]
+    assert index.get_rows(b'b'.hex()).tolist() == [1, 3]
+    assert index.get_summary(b'a'.hex()) == (330, 3, 230.0)
+    assert index.get_summary(b'b'.hex()) == (400, 2, 200.0)
+    with pytest.raises(KeyError):
+        index.get_rows('ff')
+
+def test_reclaimable_sizes_keep_the_externally_linked_file(index):
+    assert index.median_sizes.tolist() == [100, 200]
+    # Group 'b' keeps its externally linked file, removing the other one frees its size
+    assert index.reclaimable_sizes.tolist() == [200, 200]
+    external_links = np.array([0, 1, 0, 1, 0], dtype=np.int64)
+    both_linked = GroupIndex(index.codes, index.keys, np.array([100, 200, 100, 200, 130]), external_links)
+    assert both_linked.reclaimable_sizes.tolist() == [200, 0]
+
+def test_count_distinct_and_any(index):
+    roots = np.array([0, 0, 1, 0, 1])
+    assert index.count_distinct(roots, 2).tolist() == [2, 1]
+    assert index.any(roots == 1).tolist() == [True, False]
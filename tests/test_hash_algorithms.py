@@ -0,0 +1,20 @@
+import pytest
+
+from backend.hash_algorithms import (get_hash_algorithm, available_algorithms, get_fast_algorithm, get_hash_presets,
+                                     STRONG_HASH_ALGORITHM)
+
+def test_registered_algorithms():
+    for name in ('sha1', 'sha256', 'blake2b'):
+        assert name in available_algorithms()
+        assert get_hash_algorithm(name)(b'data').digest()
+
+def test_unknown_algorithm():
+    with pytest.raises(ValueError, match='Available'):
+        get_hash_algorithm('md4-fast')
+
+def test_presets():
+    presets = get_hash_presets()
+    assert presets['sha256'] == ('sha256', None)
+    fast_algorithm = get_fast_algorithm()
+    assert fast_algorithm in available_algorithms()
+    assert presets[f'Tiered: {fast_algorithm} -> {STRONG_HASH_ALGORITHM}'] == (fast_algorithm, STRONG_HASH_ALGORITHM)
@@ -0,0 +1,72 @@
+import os
+import hashlib
+
+import pytest
+
+from backend.duplicates_checker import get_hash
+from backend.hash_cache import HashCache
+
+@pytest.fixture
+def cache(tmp_path):
+    with HashCache(tmp_path / 'cache' / 'hash_cache.sqlite3') as cache:
+        yield cache
+
+def write_file(path, data, mtime_ns=None):
+    path.write_bytes(data)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path
+
+def test_put_and_get(tmp_path, cache):
+    path = write_file(tmp_path / 'a', b'content')
+    file_stat = os.stat(path)
+    assert cache.get(file_stat, 'sha256') is None
+    cache.put(file_stat, 'sha256', b'digest')
+    assert cache.get(file_stat, 'sha256') == b'digest'
+    # The first-chunk hash, other algorithms and sampled blocks are stored apart
+    assert cache.get(file_stat, 'sha256', first_chunk_only=True) is None
+    assert cache.get(file_stat, 'sha1') is None
+    assert cache.get_sample(file_stat, 'sha256', 'head') is None
+    cache.put_sample(file_stat, 'sha256', 'head', b'sample')
+    assert cache.get_sample(file_stat, 'sha256', 'head') == b'sample'
+
+def test_changed_file_misses(tmp_path, cache):
+    path = write_file(tmp_path / 'a', b'content', mtime_ns=10**18)
+    cache.put(os.stat(path), 'sha256', b'digest')
+    write_file(path, b'changed', mtime_ns=2 * 10**18)
+    assert cache.get(os.stat(path), 'sha256') is None
+
+def test_entries_survive_reopening(tmp_path):
+    path = write_file(tmp_path / 'a', b'content')
+    db_path = tmp_path / 'hash_cache.sqlite3'
+    with HashCache(db_path) as cache:
+        cache.put(os.stat(path), 'sha256', b'digest')
+    with HashCache(db_path) as cache:
+        assert cache.get(os.stat(path), 'sha256') == b'digest'
+
+def test_get_hash_is_served_from_the_cache(tmp_path, cache):
+    data = os.urandom(5000)
+    path = write_file(tmp_path / 'a', data)
+    digest = get_hash(str(path), hash_algorithm='sha256', cache=cache)
+    assert digest == hashlib.sha256(data).digest()
+    assert get_hash(str(path), first_chunk_only=True, hash_algorithm='sha256', cache=cache) == \
+        hashlib.sha256(data[:2048]).digest()
+
+    # An entry only a cache hit can return proves the file is not read again
+    cache.put(os.stat(path), 'sha256', b'cached')
+    assert get_hash(str(path), hash_algorithm='sha256', cache=cache) == b'cached'
+
+def test_get_hash_rehashes_a_changed_file(tmp_path, cache):
+    path = write_file(tmp_path / 'a', b'old content', mtime_ns=10**18)
+    get_hash(str(path), hash_algorithm='sha256', cache=cache)
+    write_file(path, b'new content', mtime_ns=2 * 10**18)
+    assert get_hash(str(path), hash_algorithm='sha256', cache=cache) == hashlib.sha256(b'new content').digest()
+
+def test_get_hash_caches_under_the_stat_of_the_hashed_file(tmp_path, cache):
+    path = write_file(tmp_path / 'a', b'old content', mtime_ns=10**18)
+    get_hash(str(path), hash_algorithm='sha256', cache=cache)
+    # A file replaced under the same name is another inode, the old digest never applies to it
+    replacement = write_file(tmp_path / 'b', b'new content', mtime_ns=10**18)
+    os.replace(replacement, path)
+    assert get_hash(str(path), hash_algorithm='sha256', cache=cache) == hashlib.sha256(b'new content').digest()
+    assert cache.get(os.stat(path), 'sha256') == hashlib.sha256(b'new content').digest()
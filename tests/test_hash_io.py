@@ -0,0 +1,43 @@
+import os
+import hashlib
+
+import pytest
+
+from backend import hash_io
+from backend.hash_io import adaptive_chunk_size, update_hash_from_file, update_hash_from_open_file
+
+@pytest.fixture
+def data_file(tmp_path):
+    # Spans several chunks and ends with a partial one
+    data = os.urandom(3 * 1024 * 1024 + 123)
+    path = tmp_path / 'data'
+    path.write_bytes(data)
+    return path, data
+
+@pytest.mark.parametrize('use_mmap', [False, True])
+def test_digest_matches_hashlib(data_file, monkeypatch, use_mmap):
+    path, data = data_file
+    monkeypatch.setattr(hash_io, 'MMAP_THRESHOLD', 1024)
+    hash_obj = hashlib.sha256()
+    file_stat = update_hash_from_file(hash_obj, str(path), use_mmap=use_mmap)
+    assert hash_obj.digest() == hashlib.sha256(data).digest()
+    assert (file_stat.st_ino, file_stat.st_size) == (os.stat(path).st_ino, len(data))
+
+def test_open_file_is_hashed_from_its_stat(data_file):
+    path, data = data_file
+    hash_obj = hashlib.sha256()
+    with open(path, 'rb', buffering=0) as file_object:
+        update_hash_from_open_file(hash_obj, file_object, os.fstat(file_object.fileno()))
+    assert hash_obj.digest() == hashlib.sha256(data).digest()
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'empty'
+    path.write_bytes(b'')
+    hash_obj = hashlib.sha256()
+    update_hash_from_file(hash_obj, str(path), use_mmap=True)
+    assert hash_obj.digest() == hashlib.sha256(b'').digest()
+
+def test_adaptive_chunk_size():
+    assert adaptive_chunk_size(0) == 64 * 1024
+    assert adaptive_chunk_size(1024 * 1024) == 256 * 1024
+    assert adaptive_chunk_size(1024 ** 3) == 1024 * 1024
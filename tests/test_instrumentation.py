@@ -0,0 +1,55 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import instrumentation
+from backend.instrumentation import Instrumentation
+
+def test_counters_go_to_the_enclosing_stage(tmp_path):
+    with Instrumentation() as active:
+        instrumentation.count(stat_calls=1)
+        with instrumentation.stage('walk'):
+            instrumentation.count(dirs_listed=2)
+            with instrumentation.measure('prefix'):
+                instrumentation.count(bytes_read=100, files_opened=1)
+    report = active.get_report()['stages']
+    assert report['other']['stat_calls'] == 1
+    assert report['walk']['dirs_listed'] == 2
+    assert (report['prefix']['bytes_read'], report['prefix']['files_opened'], report['prefix']['items']) == (100, 1, 1)
+    assert [path.name for path in active.save('scan', tmp_path)] == ['scan_report.json']
+
+def test_pool_threads_count_towards_the_phase_that_started_them():
+    with Instrumentation() as active:
+        with instrumentation.stage('prefix'):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(lambda _: instrumentation.count(bytes_read=10), range(4)))
+    assert active.get_report()['stages']['prefix']['bytes_read'] == 40
+
+def test_phases_of_other_threads_stay_on_their_thread():
+    in_phase = threading.Event()
+    counted = threading.Event()
+
+    def other_thread():
+        with instrumentation.stage('dataframe'):
+            in_phase.set()
+            counted.wait(5)
+            instrumentation.count(stat_calls=1)
+
+    with Instrumentation() as active:
+        with instrumentation.stage('pipeline'):
+            thread = threading.Thread(target=other_thread)
+            thread.start()
+            in_phase.wait(5)
+            instrumentation.count(bytes_read=10)
+            counted.set()
+            thread.join()
+        instrumentation.count(files_opened=1)
+
+    report = active.get_report()['stages']
+    assert report['pipeline']['bytes_read'] == 10
+    assert report['dataframe']['stat_calls'] == 1
+    assert report['other']['files_opened'] == 1
+
+def test_inactive_instrumentation_is_a_no_op():
+    with instrumentation.stage('walk'), instrumentation.measure('prefix'):
+        instrumentation.count(bytes_read=1)
+    assert instrumentation.get_active() is None
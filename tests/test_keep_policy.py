@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pytest
+
+from backend.keep_policy import (KeepPolicy, OLDEST, NEWEST, SHORTEST_PATH, FEWEST_COMPONENTS,
+                                 PREFERRED_ROOT)
+from backend.dir_snapshot import SnapshotStat
+from backend.pandas_manager import PandasManager
+from backend.result_columns import ResultColumns
+
+def make_manager(rows, mtimes, link_counts=None):
+    """A PandasManager of (path, size, digest) rows modified at 'mtimes' (seconds) with 'link_counts' hardlinks."""
+    columns = ResultColumns()
+    link_counts = link_counts or [1] * len(rows)
+    for row, ((path, size, digest), mtime, link_count) in enumerate(zip(rows, mtimes, link_counts)):
+        columns.append(path, SnapshotStat(size, int(mtime * 1e9), mtime, 1, row, link_count), digest, 'sha256',
+                       digest[:4], 'sha256')
+    return PandasManager(columns)
+
+def get_kept_paths(manager, policy):
+    return sorted(manager.get_dataframe_copy()['FilePath'][manager.get_kept_mask(policy)])
+
+@pytest.fixture
+def manager():
+    # Two groups of three files: 'a' and 'b'
+    rows = [('/data/archive/x/a1', 100, b'a' * 32), ('/data/a2', 100, b'a' * 32), ('/data/new/a3_long', 100, b'a' * 32),
+            ('/data/b1', 200, b'b' * 32), ('/data/archive/b2', 200, b'b' * 32), ('/data/b3', 200, b'b' * 32)]
+    mtimes = [30, 10, 20, 50, 60, 40]
+    return make_manager(rows, mtimes)
+
+def test_oldest_and_newest(manager):
+    assert get_kept_paths(manager, KeepPolicy([OLDEST])) == ['/data/a2', '/data/b3']
+    assert get_kept_paths(manager, KeepPolicy([NEWEST])) == ['/data/archive/b2', '/data/archive/x/a1']
+
+def test_path_criteria(manager):
+    assert get_kept_paths(manager, KeepPolicy([SHORTEST_PATH])) == ['/data/a2', '/data/b1']
+    assert get_kept_paths(manager, KeepPolicy([FEWEST_COMPONENTS])) == ['/data/a2', '/data/b1']
+
+def test_preferred_root_breaks_ties_with_next_criterion(manager):
+    archive = os.path.realpath('/data/archive')
+    if archive != '/data/archive':
+        pytest.skip("/data resolves elsewhere on this machine")
+    policy = KeepPolicy([PREFERRED_ROOT, NEWEST], preferred_roots=['/data/archive'])
+    assert get_kept_paths(manager, policy) == ['/data/archive/b2', '/data/archive/x/a1']
+    # Files outside every preferred folder tie, the next criterion decides
+    policy = KeepPolicy([PREFERRED_ROOT, OLDEST], preferred_roots=['/elsewhere'])
+    assert get_kept_paths(manager, policy) == ['/data/a2', '/data/b3']
+
+def test_one_file_kept_per_group(manager):
+    kept = manager.get_kept_mask(KeepPolicy([SHORTEST_PATH, OLDEST]))
+    assert kept.sum() == 2
+    assert len(manager.get_excess_duplicates(KeepPolicy([OLDEST]))) == 4
+
+def test_remaining_ties_keep_the_first_row():
+    manager = make_manager([('/d/y', 10, b'c' * 32), ('/d/x', 10, b'c' * 32)], [5, 5])
+    assert get_kept_paths(manager, KeepPolicy([OLDEST])) == ['/d/y']
+
+def test_externally_linked_file_is_kept():
+    rows = [('/d/a', 10, b'c' * 32), ('/d/b', 10, b'c' * 32), ('/d/c', 10, b'c' * 32)]
+    # '/d/b' is also linked from outside the scan, removing it would free nothing
+    manager = make_manager(rows, [5, 9, 1], link_counts=[1, 2, 1])
+    assert get_kept_paths(manager, KeepPolicy([OLDEST])) == ['/d/b']
+    assert get_kept_paths(manager, KeepPolicy([SHORTEST_PATH, NEWEST])) == ['/d/b']
+
+def test_empty_scan():
+    manager = PandasManager(ResultColumns())
+    assert manager.get_kept_mask(KeepPolicy([OLDEST])).dtype == np.bool_
+    assert len(manager.get_kept_mask(KeepPolicy([OLDEST]))) == 0
+
+def test_unknown_criterion():
+    with pytest.raises(ValueError):
+        KeepPolicy(['largest'])
@@ -0,0 +1,36 @@
+import json
+import hashlib
+
+import pytest
+
+from backend.__main__ import main, parse_size
+
+def test_parse_size():
+    assert parse_size('4096') == 4096
+    assert parse_size('64K') == 64 * 1024
+    assert parse_size('1.5g') == int(1.5 * 1024 ** 3)
+
+def test_groups_are_streamed_as_ndjson(tmp_path, capsys):
+    root = tmp_path / 'root'
+    root.mkdir()
+    for name, data in {'a': b'a' * 3000, 'b': b'a' * 3000, 'c': b'a' * 3000, 'unique': b'u' * 3000}.items():
+        (root / name).write_bytes(data)
+    output = tmp_path / 'groups.ndjson'
+
+    assert main([str(root), '--no-cache', '--no-checkpoint', '--algorithm', 'sha256', '--output', str(output)]) == 0
+
+    # A group is written again when it grows, the last line of a hash is the complete group
+    groups = {}
+    for line in output.read_text(encoding='utf-8').splitlines():
+        group = json.loads(line)
+        groups[group['hash']] = group
+    assert list(groups) == [hashlib.sha256(b'a' * 3000).hexdigest()]
+    group = groups[hashlib.sha256(b'a' * 3000).hexdigest()]
+    assert sorted(group['files']) == [str(root / name) for name in 'abc']
+    assert (group['algorithm'], group['size'], group['count'], group['reclaimable']) == ('sha256', 3000, 3, 6000)
+    assert group['roots'] == [str(root)]
+    assert '1 groups, 3 files' in capsys.readouterr().err
+
+def test_unknown_sampling_stage(tmp_path):
+    with pytest.raises(SystemExit):
+        main([str(tmp_path), '--samples', 'tail,everywhere'])
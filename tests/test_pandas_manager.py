@@ -0,0 +1,25 @@
+from backend.dir_snapshot import SnapshotStat
+from backend.keep_policy import KeepPolicy, OLDEST
+from backend.pandas_manager import PandasManager
+from backend.result_columns import ResultColumns
+
+def make_manager(rows):
+    """A PandasManager of (path, digest, mtime, aliases) rows of 2000 bytes."""
+    columns = ResultColumns()
+    for row, (path, digest, mtime, aliases) in enumerate(rows):
+        columns.append(path, SnapshotStat(2000, mtime * 10**9, mtime, 1, row, 1 + len(aliases)), digest, 'sha256',
+                       digest[:4], 'sha256', aliases, '/d')
+    return PandasManager(columns)
+
+def test_excess_paths_include_the_aliases():
+    manager = make_manager([('/d/a', b'a' * 32, 1, []), ('/d/b', b'a' * 32, 2, ['/d/b_link', '/d/sub/b']),
+                            ('/d/c', b'c' * 32, 2, ['/d/c_link']), ('/d/d', b'c' * 32, 1, [])])
+    assert manager.get_excess_paths(KeepPolicy([OLDEST])) == ['/d/b', '/d/b_link', '/d/sub/b', '/d/c', '/d/c_link']
+
+def test_link_plan_pairs_every_path_with_the_kept_file():
+    manager = make_manager([('/d/a', b'a' * 32, 1, []), ('/d/b', b'a' * 32, 2, ['/d/b_link']),
+                            ('/d/c', b'c' * 32, 2, []), ('/d/d', b'c' * 32, 1, [])])
+    sources, targets, hashes = manager.get_link_plan(KeepPolicy([OLDEST]))
+    assert sources == ['/d/b', '/d/b_link', '/d/c']
+    assert targets == ['/d/a', '/d/a', '/d/d']
+    assert hashes == [['sha256', (b'a' * 32).hex()], ['sha256', (b'a' * 32).hex()], ['sha256', (b'c' * 32).hex()]]
@@ -0,0 +1,67 @@
+import pytest
+
+from backend import progress
+from backend.progress import ProgressAggregator, ProgressStats, format_duration
+
+class FakeClock():
+    def __init__(self):
+        self.now = 100.0
+
+    def perf_counter(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(progress, 'time', clock)
+    return clock
+
+def test_updates_are_rate_limited(clock):
+    forwarded = []
+    aggregator = ProgressAggregator(forwarded.append, rate=10)
+    for done in range(1, 50):
+        clock.now += 0.01
+        aggregator(done, 100)
+    # One update per 0.1 s over 0.49 s
+    assert [stats.done for stats in forwarded] == [10, 20, 30, 40]
+
+    aggregator.finish()
+    assert forwarded[-1].done == 49
+    aggregator.finish()
+    assert len(forwarded) == 5
+
+def test_completion_is_always_forwarded(clock):
+    forwarded = []
+    aggregator = ProgressAggregator(forwarded.append, rate=1)
+    clock.now += 0.5
+    aggregator(5, 10)
+    clock.now += 0.5
+    aggregator(10, 10)
+    assert [stats.done for stats in forwarded] == [10]
+    # The completed stage reports its average throughput and nothing left
+    assert forwarded[0].files_per_second == pytest.approx(10)
+    assert forwarded[0].eta_seconds == 0
+
+def test_eta_from_the_remaining_bytes(clock):
+    forwarded = []
+    aggregator = ProgressAggregator(forwarded.append, rate=10)
+    clock.now += 1
+    aggregator(10, 100, 1000, 5000)
+    assert forwarded[-1].bytes_per_second == pytest.approx(1000)
+    assert forwarded[-1].eta_seconds == pytest.approx(4)
+    assert forwarded[-1].percentage == 20
+
+def test_stalled_stage_keeps_its_rates(clock):
+    forwarded = []
+    aggregator = ProgressAggregator(forwarded.append, rate=10)
+    clock.now += 1
+    aggregator(10, 100)
+    clock.now += 1
+    aggregator(10, 100)
+    assert len(forwarded) == 1
+
+def test_format():
+    stats = ProgressStats(1200, 5000, 0, 0, 3000, 0, 12, 1)
+    assert stats.format() == '1200/5000 files, 3000 files/s, ETA 0:12'
+    assert stats.percentage == 24
+    assert format_duration(3725) == '1:02:05'
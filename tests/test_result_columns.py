@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+
+from backend.dir_snapshot import SnapshotStat
+from backend.result_columns import ResultColumns, DigestColumn, DictionaryColumn
+
+def test_digests_of_different_lengths_are_kept_intact():
+    column = DigestColumn()
+    digests = [b'\x01' * 20, b'\x02' * 32, b'', b'\x03\x00' * 8]
+    for digest in digests:
+        column.append(digest)
+    assert column.width == 32
+    assert [column[row] for row in range(len(column))] == column.to_list() == digests
+
+def test_repeated_values_are_stored_once():
+    column = DictionaryColumn()
+    for value in ['sha1', 'sha256', 'sha1', 'sha1']:
+        column.append(value)
+    assert column.values == ['sha1', 'sha256']
+    assert list(column.codes) == [0, 1, 0, 0]
+    assert [column[row] for row in range(len(column))] == ['sha1', 'sha256', 'sha1', 'sha1']
+
+def test_append(tmp_path):
+    path = tmp_path / 'a'
+    path.write_bytes(b'a' * 3000)
+    file_stat = os.stat(path)
+    columns = ResultColumns()
+    columns.append(str(path), file_stat, b'd' * 20, 'sha1', b'p' * 20, 'sha1', root=str(tmp_path))
+    # Three links in total: two scanned paths, one outside the scan
+    columns.append('/data/b', SnapshotStat(100, 2_500_000_000, 1.5, 1, 2, 3), b'e' * 32, 'sha256', b'q' * 20, 'sha1',
+                   aliases=['/data/c'], root='/data')
+
+    assert len(columns) == 2
+    assert list(columns.sizes) == [3000, 100]
+    assert columns.mtimes[0] == file_stat.st_mtime_ns / 1e9
+    assert (columns.mtimes[1], columns.ctimes[1]) == (2.5, 1.5)
+    assert list(columns.external_links) == [0, 1]
+    assert (columns.aliases[0], columns.aliases[1]) == ('', '/data/c')
+    assert (columns.roots[0], columns.roots[1]) == (str(tmp_path), '/data')
+    assert (columns.digests[1], columns.algorithms[1], columns.prefix_algorithms[1]) == (b'e' * 32, 'sha256', 'sha1')
+    # The numeric buffers are read by NumPy without a copy
+    assert np.frombuffer(columns.sizes, dtype=np.int64).tolist() == [3000, 100]
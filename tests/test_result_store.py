@@ -0,0 +1,98 @@
+import gzip
+
+import numpy as np
+import pytest
+
+from backend.dir_snapshot import SnapshotStat
+from backend.result_columns import ResultColumns
+from backend.result_store import (save_results, load_results, available_formats, get_format, record_analysis,
+                                  list_analyses, FORMATS, COLUMNS, NDJSON_GZIP, NDJSON_ZSTD)
+
+# (path, size, digest, link count, aliases)
+ROWS = [('/scan/a', 100, b'\x01' * 32, 1, []), ('/scan/b', 100, b'\x01' * 32, 3, ['/scan/b_link']),
+        # Not valid UTF-8, the path holds a surrogate
+        ('/scan/caf\udce9', 2048, b'\x02' * 16, 1, []), ('/scan/d', 2048, b'\x02' * 16, 1, [])]
+
+def make_columns(rows=ROWS):
+    columns = ResultColumns()
+    for row, (path, size, digest, link_count, aliases) in enumerate(rows):
+        mtime = 1_700_000_000.25 + row
+        columns.append(path, SnapshotStat(size, int(mtime * 1e9), mtime, 1, row, link_count), digest, 'sha256',
+                       digest[:4], 'sha1', aliases, '/scan')
+    return columns
+
+def assert_same_columns(loaded, columns):
+    assert loaded.paths == columns.paths
+    for name in ('sizes', 'external_links'):
+        assert np.array_equal(np.frombuffer(getattr(loaded, name), dtype=np.int64),
+                              np.frombuffer(getattr(columns, name), dtype=np.int64))
+    # Arrow timestamps keep microseconds
+    assert np.allclose(np.frombuffer(loaded.mtimes, dtype=np.float64), np.frombuffer(columns.mtimes, dtype=np.float64),
+                       rtol=0, atol=1e-6)
+    assert loaded.digests.to_list() == columns.digests.to_list()
+    assert loaded.prefix_digests.to_list() == columns.prefix_digests.to_list()
+    for name in ('algorithms', 'prefix_algorithms', 'aliases', 'roots'):
+        assert [getattr(loaded, name)[row] for row in range(len(loaded))] == \
+               [getattr(columns, name)[row] for row in range(len(columns))]
+
+@pytest.mark.parametrize('result_format', FORMATS)
+def test_round_trip(tmp_path, result_format):
+    if result_format not in available_formats():
+        pytest.skip(f"{result_format} needs an optional package")
+    columns = make_columns()
+    path = save_results(columns, tmp_path / f"analysis{result_format}", {'roots': ['/scan']})
+
+    loaded, metadata = load_results(path)
+    assert_same_columns(loaded, columns)
+    # NDJSON has no room for metadata
+    if result_format not in (NDJSON_GZIP, NDJSON_ZSTD):
+        assert metadata['roots'] == ['/scan']
+
+def test_empty_analysis(tmp_path):
+    loaded, _ = load_results(save_results(make_columns([]), tmp_path / f"empty{COLUMNS}"))
+    assert len(loaded) == 0
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        get_format(tmp_path / 'analysis.xlsx')
+
+def test_invalid_columns_file(tmp_path):
+    path = tmp_path / f"broken{COLUMNS}"
+    path.write_bytes(b'not an analysis')
+    with pytest.raises(ValueError):
+        load_results(path)
+
+@pytest.mark.parametrize('result_format', [NDJSON_GZIP, NDJSON_ZSTD])
+def test_corrupt_ndjson(tmp_path, result_format):
+    if result_format not in available_formats():
+        pytest.skip(f"{result_format} needs an optional package")
+    path = save_results(make_columns(), tmp_path / f"analysis{result_format}")
+    data = path.read_bytes()
+
+    # Not compressed at all, then cut short
+    path.write_bytes(b'not an analysis')
+    with pytest.raises(ValueError):
+        load_results(path)
+    path.write_bytes(data[:len(data) // 2])
+    with pytest.raises(ValueError):
+        load_results(path)
+
+def test_damaged_ndjson_line(tmp_path):
+    path = tmp_path / f"analysis{NDJSON_GZIP}"
+    with gzip.open(path, 'wt', encoding='utf-8') as ndjson_file:
+        ndjson_file.write('{"path": "/scan/a", "size": 1\n')
+    with pytest.raises(ValueError, match='is not an analysis'):
+        load_results(path)
+
+def test_metadata_log_lists_the_latest_save_of_existing_files(tmp_path):
+    log_path = tmp_path / 'metadata.jsonl'
+    first = save_results(make_columns(), tmp_path / f"first{COLUMNS}")
+    second = save_results(make_columns(), tmp_path / f"second{COLUMNS}")
+    record_analysis(first, {'note': 'old'}, log_path)
+    record_analysis(second, {}, log_path)
+    record_analysis(first, {'note': 'new'}, log_path)
+    second.unlink()
+
+    analyses = list_analyses(log_path)
+    assert len(analyses) == 1
+    assert analyses[0]['note'] == 'new'
@@ -0,0 +1,78 @@
+import os
+import random
+
+import pytest
+
+from backend.duplicates_checker import DuplicatePipeline
+from backend.scan_checkpoint import ScanCheckpoint
+from backend.scan_control import ScanControl, WorkerKilledException
+
+@pytest.fixture
+def tree(tmp_path):
+    rng = random.Random(1)
+    root = tmp_path / 'tree'
+    for group in range(12):
+        content = rng.randbytes(4096 + group)
+        for copy in range(2 + group % 3):
+            directory = root / f"dir{copy}"
+            directory.mkdir(parents=True, exist_ok=True)
+            (directory / f"file{group}").write_bytes(content)
+    # Same size and prefix as a group, other content
+    (root / 'dir0' / 'lookalike').write_bytes(content[:2048] + rng.randbytes(len(content) - 2048))
+    return str(root)
+
+def get_groups(pipeline):
+    return sorted((digest, size, tuple(files)) for digest, _, size, files in pipeline.get_duplicate_groups())
+
+def run_until_cancelled(tree, checkpoint_dir, updates, resume=False):
+    """Runs a scan checkpointed at every step, cancels it after 'updates' group updates."""
+    control = ScanControl()
+    pipeline = DuplicatePipeline(tree, workers=2, control=control, checkpoint_dir=checkpoint_dir,
+                                 checkpoint_interval=0, resume=resume)
+    with pytest.raises(WorkerKilledException):
+        for count, _ in enumerate(pipeline.run(), start=1):
+            if count == updates:
+                control.cancel()
+    return pipeline
+
+def test_resumed_scan_finds_the_same_groups(tree, tmp_path):
+    clean = DuplicatePipeline(tree, workers=2)
+    list(clean.run())
+
+    checkpoint_dir = tmp_path / 'checkpoints'
+    run_until_cancelled(tree, checkpoint_dir, 3)
+    # Cancelled again while resuming, the checkpoint is rewritten then appended to
+    run_until_cancelled(tree, checkpoint_dir, 6, resume=True)
+
+    resumed = DuplicatePipeline(tree, workers=2, checkpoint_dir=checkpoint_dir, resume=True)
+    assert resumed.resumed is not None and resumed.resumed.digests
+    list(resumed.run())
+    assert get_groups(resumed) == get_groups(clean)
+    # A completed scan removes its checkpoint
+    assert not os.path.exists(ScanCheckpoint.get_checkpoint_path(resumed.roots, checkpoint_dir))
+
+def test_checkpoint_holds_the_scan_state(tree, tmp_path):
+    checkpoint_dir = tmp_path / 'checkpoints'
+    pipeline = run_until_cancelled(tree, checkpoint_dir, 3)
+    state = pipeline.get_checkpoint()
+    loaded = ScanCheckpoint.load(pipeline.roots, state.settings, checkpoint_dir)
+
+    assert {path for path, _ in loaded.files} == {path for path, _ in state.files}
+    assert {stage: digests for stage, digests in loaded.digests.items() if digests} == \
+           {stage: digests for stage, digests in state.digests.items() if digests}
+    assert (loaded.walk_done, loaded.file_count) == (state.walk_done, state.file_count)
+
+def test_save_cut_short_keeps_the_earlier_ones(tree, tmp_path):
+    checkpoint_dir = tmp_path / 'checkpoints'
+    pipeline = run_until_cancelled(tree, checkpoint_dir, 3)
+    settings = pipeline.get_checkpoint().settings
+    path = ScanCheckpoint.get_checkpoint_path(pipeline.roots, checkpoint_dir)
+    complete = ScanCheckpoint.load(pipeline.roots, settings, checkpoint_dir)
+
+    with open(path, 'rb+') as checkpoint_file:
+        checkpoint_file.truncate(os.path.getsize(path) - 5)
+    truncated = ScanCheckpoint.load(pipeline.roots, settings, checkpoint_dir)
+    assert truncated is not None
+    assert {path for path, _ in truncated.files} <= {path for path, _ in complete.files}
+
+    assert ScanCheckpoint.load(pipeline.roots, dict(settings, block_size=1), checkpoint_dir) is None
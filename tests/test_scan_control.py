@@ -0,0 +1,47 @@
+import threading
+
+import pytest
+
+from backend.scan_control import ScanControl, WorkerKilledException
+
+def test_check_raises_once_cancelled():
+    control = ScanControl()
+    control.check()
+    control.cancel()
+    assert control.cancelled
+    with pytest.raises(WorkerKilledException):
+        control.check()
+
+def test_check_blocks_while_paused():
+    control = ScanControl()
+    control.pause()
+    assert control.paused
+    checked = threading.Event()
+
+    def check():
+        control.check()
+        checked.set()
+
+    thread = threading.Thread(target=check)
+    thread.start()
+    assert not checked.wait(0.05)
+    control.resume()
+    assert checked.wait(5)
+    thread.join()
+
+def test_cancel_wakes_a_paused_scan():
+    control = ScanControl()
+    control.pause()
+    errors = []
+
+    def check():
+        try:
+            control.check()
+        except WorkerKilledException as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=check)
+    thread.start()
+    control.cancel()
+    thread.join(5)
+    assert not thread.is_alive() and len(errors) == 1
@@ -0,0 +1,52 @@
+import os
+
+from backend.file_walker import ParallelWalker
+from backend.scan_filter import ScanFilter, format_pruned
+
+def write_tree(root, contents):
+    for name, size in contents.items():
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_bytes(b'x' * size)
+
+def walk(root, scan_filter):
+    walker = ParallelWalker(str(root), scan_filter=scan_filter)
+    return sorted(os.path.relpath(path, root) for path, _ in walker.walk()), walker
+
+def test_size_range(tmp_path):
+    write_tree(tmp_path, {'small': 100, 'medium': 5000, 'large': 50000})
+    files, walker = walk(tmp_path, ScanFilter(min_size=1024, max_size=10000))
+    assert files == ['medium']
+    assert walker.pruned_files == {'size': 2}
+
+def test_names_and_extensions(tmp_path):
+    write_tree(tmp_path, {'a.JPG': 2000, 'b.png': 2000, 'c.txt': 2000, 'd.jpg.bak': 2000})
+    assert walk(tmp_path, ScanFilter(extensions=['jpg', '.png']))[0] == ['a.JPG', 'b.png']
+    assert walk(tmp_path, ScanFilter(include_globs=['*.txt', '*.png']))[0] == ['b.png', 'c.txt']
+    assert walk(tmp_path, ScanFilter(exclude_globs=['*.bak']))[0] == ['a.JPG', 'b.png', 'c.txt']
+
+def test_pruned_directories_are_never_opened(tmp_path, monkeypatch):
+    write_tree(tmp_path, {'keep/a': 2000, 'node_modules/b': 2000, '.Trash-1000/c': 2000, 'keep/.git/d': 2000})
+    scanned = []
+    original_scandir = os.scandir
+    monkeypatch.setattr(os, 'scandir', lambda path: scanned.append(path) or original_scandir(path))
+
+    files, walker = walk(tmp_path, ScanFilter(exclude_dirs=['node_modules', '.git', '.Trash-*']))
+    assert files == [os.path.join('keep', 'a')]
+    assert walker.pruned_dirs == {'excluded': 3}
+    assert sorted(scanned) == [str(tmp_path), str(tmp_path / 'keep')]
+
+def test_hidden_files_and_directories(tmp_path):
+    write_tree(tmp_path, {'a': 2000, '.b': 2000, '.hidden/c': 2000})
+    files, walker = walk(tmp_path, ScanFilter(skip_hidden=True))
+    assert files == ['a']
+    assert (walker.pruned_dirs, walker.pruned_files) == ({'hidden': 1}, {'hidden': 1})
+
+def test_spec_round_trip():
+    scan_filter = ScanFilter(min_size=10, max_size=20, include_globs=['*.a'], extensions=['B'], exclude_dirs=['c'],
+                             same_filesystem=True, skip_hidden=True)
+    assert ScanFilter.from_spec(scan_filter.to_spec()).to_spec() == scan_filter.to_spec()
+
+def test_format_pruned():
+    assert format_pruned({'excluded': 12}, {'size': 300, 'hidden': 40}) == \
+        '12 directories (excluded: 12), 340 files (hidden: 40, size: 300)'
+    assert format_pruned({}, {}) == 'nothing'
@@ -0,0 +1,75 @@
+import datetime
+
+import pytest
+
+from backend.dir_snapshot import SnapshotStat
+from backend.result_columns import ResultColumns
+from backend.scan_history import ScanHistory, SnapshotDiff
+
+PAIR = b'\x01' * 32
+TRIPLE = b'\x02' * 32
+
+def make_columns(rows, algorithm='sha256'):
+    """Builds the columns of a scan from (path, size, digest) rows."""
+    columns = ResultColumns()
+    for row, (path, size, digest) in enumerate(rows):
+        mtime = 1_700_000_000 + row
+        columns.append(path, SnapshotStat(size, mtime * 10**9, mtime, 1, row, 1), digest, algorithm, digest[:4], 'sha1',
+                       root='/scan')
+    return columns
+
+@pytest.fixture
+def first_scan():
+    # A pair, a triple, and a file whose prefix matched the pair but whose content is unique
+    return make_columns([('/scan/a1', 1000, PAIR), ('/scan/a2', 1000, PAIR), ('/scan/lone', 1000, b'\x03' * 32),
+                         ('/scan/b1', 10, TRIPLE), ('/scan/b2', 10, TRIPLE), ('/scan/b3', 10, TRIPLE)])
+
+def test_lone_files_are_not_groups(first_scan):
+    second = make_columns([('/scan/a1', 1000, PAIR), ('/scan/a2', 1000, PAIR),
+                           ('/scan/other1', 1000, b'\x04' * 32), ('/scan/other2', 1000, b'\x05' * 32),
+                           ('/scan/b1', 10, TRIPLE), ('/scan/b2', 10, TRIPLE), ('/scan/b3', 10, TRIPLE)])
+    diff = SnapshotDiff(first_scan, second)
+    assert not diff.has_changes()
+    assert diff.reclaimable_before == diff.reclaimable_after == 1020
+
+def test_new_resolved_grown_shrunk(first_scan):
+    second = make_columns([('/scan/a1', 1000, PAIR),
+                           ('/scan/b1', 10, TRIPLE), ('/scan/b2', 10, TRIPLE),
+                           ('/scan/c1', 50, b'\x06' * 32), ('/scan/c2', 50, b'\x06' * 32)])
+    diff = SnapshotDiff(first_scan, second)
+
+    # The pair fell to one file: resolved, not shrunk
+    assert [(change.path, change.files_before, change.files_after) for change in diff.resolved_groups] == \
+           [('/scan/a1', 2, 1)]
+    assert [(change.key, change.files_before, change.files_after) for change in diff.shrunk_groups] == \
+           [(TRIPLE.hex(), 3, 2)]
+    assert [(change.reclaimable_before, change.reclaimable_after) for change in diff.new_groups] == [(0, 50)]
+    assert diff.grown_groups == []
+    assert diff.format_summary().startswith("1 new groups, 1 resolved, 0 grown, 1 shrunk")
+
+    reverse = SnapshotDiff(second, first_scan)
+    assert [change.key for change in reverse.new_groups] == [PAIR.hex()]
+    assert [change.key for change in reverse.grown_groups] == [TRIPLE.hex()]
+
+def test_different_algorithms_are_refused(first_scan):
+    second = make_columns([('/scan/a1', 1000, b'\x07' * 64), ('/scan/a2', 1000, b'\x07' * 64)], algorithm='blake2b')
+    with pytest.raises(ValueError):
+        SnapshotDiff(first_scan, second)
+
+def test_history_keeps_the_latest_snapshots(tmp_path, first_scan):
+    history = ScanHistory([str(tmp_path / 'scan')], tmp_path / 'history')
+    start = datetime.datetime(2026, 1, 1)
+    for day in range(4):
+        history.save(first_scan, start + datetime.timedelta(days=day), keep=3)
+
+    snapshots = history.list_snapshots()
+    assert [history.get_created(path).day for path in snapshots] == [2, 3, 4]
+    assert history.find_snapshot(datetime.datetime(2026, 1, 3, 12)) == snapshots[1]
+    assert history.find_snapshot(start) is None
+    assert not history.diff(snapshots[0], snapshots[-1]).has_changes()
+    assert [other.directory for other in ScanHistory.list_histories(tmp_path / 'history')] == [history.directory]
+
+def test_folders_with_the_same_name_are_kept_apart(tmp_path):
+    first = ScanHistory([str(tmp_path / 'one' / 'photos')], tmp_path / 'history')
+    second = ScanHistory([str(tmp_path / 'two' / 'photos')], tmp_path / 'history')
+    assert first.directory != second.directory
@@ -0,0 +1,21 @@
+from benchmarks.synthetic_tree import TreeSpec, plan_tree, generate_tree
+from backend.duplicates_checker import search_duplicate_files
+
+SPEC = TreeSpec(file_count=200, min_size=512, max_size=64 * 1024, duplicate_ratio=0.3, shared_prefix_ratio=0.2,
+                depth=2, fanout=3, prefix_size=4096, seed=7)
+
+def test_plan_is_deterministic():
+    assert plan_tree(SPEC) == plan_tree(SPEC)
+    assert plan_tree(SPEC) != plan_tree(SPEC._replace(seed=8))
+
+def test_scan_finds_the_expected_duplicates(tmp_path):
+    summary = generate_tree(tmp_path, SPEC)
+    assert summary['files'] == 200
+    assert summary['shared prefix'] > 0
+
+    columns = search_duplicate_files(str(tmp_path))
+    counts = {}
+    for row in range(len(columns)):
+        counts[columns.digests[row]] = counts.get(columns.digests[row], 0) + 1
+    groups = [count for count in counts.values() if count >= 2]
+    assert (len(groups), sum(groups)) == (summary['expected duplicate groups'], summary['expected duplicate files'])